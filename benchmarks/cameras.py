@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+
+from camera import Camera
+from play_mode import SCREEN_SIZE, PlayScene, write_snapshot
+from renderer import SceneRenderer
+from scene_store import SceneStore
+
+WORLD = 20000
+FRAME = 1 / 60
+SPEED = 4  # world pixels the main camera pans per frame
+EDITS = 20  # objects moved per frame somewhere in the world
+
+
+def make_scene(count, minimap_rate, seed=0):
+    # A main camera and a whole-world minimap in the top right corner
+    rng = np.random.default_rng(seed)
+    store = SceneStore()
+    store.add_many(rng.integers(0, WORLD, count), rng.integers(0, WORLD, count), rng.integers(8, 120, count), rng.integers(8, 120, count), rng.integers(0, 1 << 24, count))
+    cameras = [Camera((0, 0) + SCREEN_SIZE), Camera((0, 0, WORLD, WORLD), (SCREEN_SIZE[0] - 200, 0), 200 / WORLD, minimap_rate)]
+    snapshot = write_snapshot(store, cameras)
+    scene = PlayScene()
+    scene.load_snapshot(snapshot.name)
+    snapshot.close()
+    snapshot.unlink()
+    return scene
+
+
+def run(screen, count, minimap_rate, threads, frames, pan, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    scene = make_scene(count, minimap_rate)
+    renderer = SceneRenderer(scene, screen, threads=threads)
+    renderer.render(0.0)
+    ids = scene.objects.ids()
+    samples = []
+    for frame in range(1, frames + 1):
+        if pan:
+            scene.cameras[0].move_ip(SPEED, SPEED)
+        for id in rng.choice(ids, EDITS).tolist():
+            scene.apply(("set", id, int(rng.integers(0, WORLD)), int(rng.integers(0, WORLD)), 40, 40, int(rng.integers(0, 1 << 24)), -1))
+        start = time.perf_counter()
+        renderer.render(frame * FRAME)  # simulated 60 Hz clock, the minimap rate is honored without sleeping
+        samples.append((time.perf_counter() - start) * 1000)
+    stats = renderer.camera_stats()
+    renderer.close()
+    samples.sort()
+    return {
+        "frame_p50_ms": statistics.median(samples),
+        "frame_p99_ms": samples[len(samples) * 99 // 100],
+        "cameras": stats,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.cameras", description="A panning main camera plus a minimap, headless")
+    parser.add_argument("--objects", type=int, default=100000)
+    parser.add_argument("--frames", type=int, default=240)
+    parser.add_argument("--threads", type=int, default=2, help="render threads for the threaded run")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    pygame.display.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    results = {}
+    for name, rate, threads in (("minimap every frame", 0, 0), ("minimap 10 Hz", 10, 0), (f"minimap 10 Hz, {args.threads} threads", 10, args.threads)):
+        result = results[name] = run(screen, args.objects, rate, threads, args.frames, pan=True)
+        print(f"{name:<28} frame p50 {result['frame_p50_ms']:6.2f} ms  p99 {result['frame_p99_ms']:6.2f} ms")
+        for stats in result["cameras"]:
+            print(f"  camera {stats['camera']}  {stats['renders']:4} renders  {stats['skipped']:4} held  {stats['drawn']:6} drawn  {stats['culled']:6} culled  avg {stats['average_ms']:6.2f} ms")
+    pygame.quit()
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
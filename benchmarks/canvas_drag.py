@@ -0,0 +1,57 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+os.environ["PIKE_AUTOSAVE_DIR"] = tempfile.mkdtemp(prefix="pike_bench_autosave_")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import QRect
+from PyQt5.QtWidgets import QApplication
+from main import GameArea
+
+FRAMES = 60
+
+
+def build(count, seed=0):
+    rng = random.Random(seed)
+    area = GameArea()
+    area.resize(800, 600)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(count)]
+    rects = [(rng.randrange(800), rng.randrange(600), rng.randrange(4, 40), rng.randrange(4, 40)) for _ in range(count)]
+    area.add_objects(colors, rects)
+    area.grab()  # warm the tile cache
+    return area
+
+
+def drag(area, cached):
+    # grab() runs paintEvent for exactly the region handed to it
+    obj = area.objects.handle(area.objects.count - 1)
+    area.dragged_id = obj.id
+    x, y, _, _ = obj.bounds
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        old = obj.bounds
+        area.move_object(obj, x + frame * 3, y + frame * 2)
+        if cached:
+            new = obj.bounds
+            area.grab(QRect(*old).united(QRect(*new)))
+        else:
+            area.tiles.clear()  # the old behaviour: every object repainted on every move
+            area.grab()
+    elapsed = time.perf_counter() - start
+    area.dragged_id = None
+    return elapsed / FRAMES * 1000
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 50000]
+    for count in sizes:
+        area = build(count)
+        full = drag(area, False)
+        dirty = drag(area, True)
+        print(f"{count} objects: full repaint {full:.2f} ms/frame, dirty region + cached tiles {dirty:.2f} ms/frame")
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QApplication, QTextEdit
+from code_editor import CodeRunner, Console
+
+LINE = "frame {i}: player at (120, 340), 14 enemies on screen"
+LEGACY_LINES = 20000  # the old sink gets slower with every line, this keeps the run short
+
+
+class TextEditRedirect:
+    # The stdout redirect code_editor.py used before Console
+    def __init__(self, text_edit):
+        self.text_edit = text_edit
+
+    def write(self, text):
+        self.text_edit.moveCursor(QTextCursor.End)
+        self.text_edit.insertPlainText(text)
+
+
+def print_lines(sink, lines):
+    # print() issues two writes per line, the text and the newline
+    start = time.perf_counter()
+    for i in range(lines):
+        sink.write(LINE.format(i=i))
+        sink.write("\n")
+    return start
+
+
+def legacy_sink(app, lines):
+    console = QTextEdit()
+    console.resize(800, 200)
+    start = print_lines(TextEditRedirect(console), lines)
+    app.processEvents()
+    return lines / (time.perf_counter() - start), console.document().blockCount()
+
+
+def buffered_sink(app, lines):
+    console = Console()
+    console.resize(800, 200)
+    console.reset()
+    start = print_lines(console, lines)
+    console.flush()
+    app.processEvents()
+    rate = lines / (time.perf_counter() - start)
+    blocks = console.document().blockCount()
+    console.close_spill()
+    return rate, blocks
+
+
+def child_run(app, lines):
+    # End to end: a print-heavy script in the child interpreter streaming into the console
+    console = Console()
+    console.resize(800, 200)
+    console.reset()
+    runner = CodeRunner()
+    runner.output.connect(console.write)
+    done = []
+    runner.finished.connect(done.append)
+    start = time.perf_counter()
+    runner.start(f"for i in range({lines}):\n    print({LINE!r}.format(i=i))\n")
+    while not done:
+        app.processEvents()
+        time.sleep(0.001)
+    console.flush()
+    rate = lines / (time.perf_counter() - start)
+    blocks = console.document().blockCount()
+    runner.close()
+    console.close_spill()
+    return rate, blocks
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000]
+    for lines in sizes:
+        legacy_lines = min(lines, LEGACY_LINES)
+        legacy_rate, legacy_blocks = legacy_sink(app, legacy_lines)
+        buffered_rate, buffered_blocks = buffered_sink(app, lines)
+        child_rate, child_blocks = child_run(app, lines)
+        print(f"{lines} printed lines")
+        print(f"  QTextEdit insert per write   {legacy_rate:10.0f} lines/s   {legacy_blocks:7} lines kept (first {legacy_lines} only)")
+        print(f"  buffered Console             {buffered_rate:10.0f} lines/s   {buffered_blocks:7} lines kept")
+        print(f"  child run into Console       {child_rate:10.0f} lines/s   {child_blocks:7} lines kept")
@@ -0,0 +1,98 @@
+import os
+import re
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtGui import QFont, QSyntaxHighlighter, QTextCharFormat, QTextCursor, QTextDocument
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QPlainTextDocumentLayout
+from code_editor import KEYWORDS, PythonHighlighter
+
+KEYSTROKES = 200
+
+TEMPLATE = '''class Enemy{n}(GameObject):
+    """Chases the player for {n} frames
+    and then gives up if it is not in range."""
+
+    def update(self, dt):  # called once per frame
+        if self.target is not None and self.alive:
+            self.x += self.speed * dt
+        label = "enemy {n} is in 'chase' mode" if self.chasing else 'idle'
+        return label
+
+'''
+
+
+class LegacyPythonHighlighter(QSyntaxHighlighter):
+    # The per-keyword regex highlighter code_editor.py used before the single pass tokenizer
+    def __init__(self, document):
+        super().__init__(document)
+        keyword_format = QTextCharFormat()
+        keyword_format.setForeground(Qt.blue)
+        keyword_format.setFontWeight(QFont.Bold)
+        self.highlighting_rules = [(re.compile(r'\b' + keyword + r'\b'), keyword_format) for keyword in KEYWORDS]
+        string_format = QTextCharFormat()
+        string_format.setForeground(Qt.darkGreen)
+        self.highlighting_rules.append((re.compile(r'\".*\"'), string_format))
+        self.highlighting_rules.append((re.compile(r'\'.*\''), string_format))
+
+    def highlightBlock(self, text):
+        for pattern, format in self.highlighting_rules:
+            for match in pattern.finditer(text):
+                self.setFormat(match.start(), match.end() - match.start(), format)
+
+
+def make_source(lines):
+    chunk = TEMPLATE.count("\n")
+    return "".join(TEMPLATE.replace("{n}", str(n)) for n in range(lines // chunk + 1))
+
+
+def make_document(source):
+    document = QTextDocument()
+    document.setDocumentLayout(QPlainTextDocumentLayout(document))  # what QPlainTextEdit uses
+    document.setPlainText(source)
+    return document
+
+
+def keystrokes(document, text, count=KEYSTROKES):
+    # Median time for typing text into a line in the middle of the file, undone after each stroke
+    block = document.findBlockByNumber(document.blockCount() // 2 + 5)  # inside update()
+    samples = []
+    for _ in range(count):
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock)
+        start = time.perf_counter()
+        cursor.insertText(text)
+        samples.append(time.perf_counter() - start)
+        document.undo()
+    return statistics.median(samples) * 1e6
+
+
+def run(lines, highlighter_class):
+    document = make_document(make_source(lines))
+    highlighter = highlighter_class(document)
+    start = time.perf_counter()
+    highlighter.rehighlight()
+    full = time.perf_counter() - start
+    return {
+        "lines": document.blockCount(),
+        "full_ms": full * 1000,
+        "keystroke_us": keystrokes(document, "x"),
+        "open_string_us": keystrokes(document, ' """', 5),  # re-highlights the rest of the file
+    }
+
+
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [50000]
+    for lines in sizes:
+        legacy = run(lines, LegacyPythonHighlighter)
+        current = run(lines, PythonHighlighter)
+        print(f"{legacy['lines']} lines")
+        print(f"  full document      regex per keyword {legacy['full_ms']:10.1f} ms   single pass {current['full_ms']:10.1f} ms")
+        print(f"  keystroke          regex per keyword {legacy['keystroke_us']:10.1f} us   single pass {current['keystroke_us']:10.1f} us")
+        print(f"  opening a string   regex per keyword {legacy['open_string_us']:10.1f} us   single pass {current['open_string_us']:10.1f} us")
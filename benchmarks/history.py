@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+os.environ["PIKE_AUTOSAVE_DIR"] = tempfile.mkdtemp(prefix="pike_bench_autosave_")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+import pik_format
+from main import MainWindow
+
+SIZES = [10000, 100000, 1000000]
+WORLD = 20000
+DRAG_FRAMES = 60
+EDIT = 1000  # objects in the bulk edits
+
+
+def make_scene(count, seed=0):
+    rng = np.random.default_rng(seed)
+    objects = np.empty(count, pik_format.OBJECT_DTYPE)
+    objects["x"] = rng.integers(0, WORLD, count)
+    objects["y"] = rng.integers(0, WORLD, count)
+    objects["w"] = rng.integers(8, 120, count)
+    objects["h"] = rng.integers(8, 120, count)
+    objects["color"] = rng.integers(0, 1 << 24, count)
+    return objects
+
+
+def timed(func, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run(window, count):
+    area, history = window.game_area, window.history
+    area.load_records(make_scene(count), np.empty(0, pik_format.CAMERA_DTYPE))
+    ids = area.objects.ids()
+    dragged = area.objects.handle(int(ids[0]))
+    area.dragged_id = dragged.id  # a drag as mouseMoveEvent does it, every frame merges into one step
+    area.drags += 1
+    for frame in range(DRAG_FRAMES):
+        area.move_object(dragged, frame, frame)
+    area.dragged_id = None
+    drag_bytes = history.bytes
+    bulk = ids[:EDIT]
+    area.set_objects_color(bulk, (255, 0, 0))
+    area.translate_objects(10, 10, bulk)
+    area.remove_objects(bulk)
+
+    def undo_redo_all():
+        steps = len(history.undo_steps)
+        for _ in range(steps):
+            history.undo()
+        for _ in range(steps):
+            history.redo()
+    return {
+        "steps": len(history.undo_steps),
+        "drag_step_bytes": drag_bytes,
+        "history_bytes": history.bytes,
+        "scene_copy_bytes": pik_format.object_records(area.objects).nbytes,  # what one snapshot per step would cost
+        "undo_redo_all_ms": timed(undo_redo_all),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.history", description="Undo history size and undo/redo time against scene size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication([])
+    window = MainWindow()
+    results = {}
+    for count in args.sizes:
+        result = results[count] = run(window, count)
+        app.processEvents()  # the batched hierarchy updates queued by this size, outside the timings
+        print(f"{count:8} objects  {result['steps']} steps in {result['history_bytes']:7} bytes (drag of {DRAG_FRAMES} moves: {result['drag_step_bytes']} bytes, "
+              f"one scene copy {result['scene_copy_bytes'] / 1048576:.1f} MB)  undo+redo of every step {result['undo_redo_all_ms']:7.2f} ms")
+    window.journal.close()
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
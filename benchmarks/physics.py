@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from physics import FIXED_DT, Bodies
+from scene_store import SceneStore
+
+SIZES = [10000, 20000]
+COVERAGE = 0.15  # share of the box covered by bodies
+WALL = 200
+
+
+def make_scene(count, gravity, seed=0):
+    # count dynamic bodies of 8 to 16 pixels moving in a walled box, headless
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(8, 17, count)
+    side = int(np.sqrt(float((sizes * sizes).sum()) / COVERAGE))
+    store = SceneStore()
+    ids = store.add_many(rng.integers(0, side - 16, count), rng.integers(0, side - 16, count), sizes, sizes, rng.integers(0, 1 << 24, count))
+    walls = store.add_many([-WALL, -WALL, -WALL, side], [-WALL, side, -WALL, -WALL], [side + 2 * WALL, side + 2 * WALL, WALL, WALL], [WALL, WALL, side + 2 * WALL, side + 2 * WALL], [0] * 4)
+    bodies = Bodies(gravity)
+    for wall in walls.tolist():
+        bodies.set(wall, mass=0)
+    for id, vx, vy in zip(ids.tolist(), rng.uniform(-200, 200, count).tolist(), rng.uniform(-200, 200, count).tolist()):
+        bodies.set(id, (vx, vy), restitution=0.8)
+    bodies.pull(store)
+    return store, bodies, side
+
+
+def run(count, gravity, frames, settle):
+    store, bodies, side = make_scene(count, gravity)
+    for _ in range(settle):
+        bodies.step(FIXED_DT)
+    samples = []
+    pairs = contacts = 0
+    for _ in range(frames):
+        start = time.perf_counter()
+        bodies.step(FIXED_DT)
+        bodies.push(store)
+        samples.append((time.perf_counter() - start) * 1000)
+        pairs += bodies.pairs
+        contacts += bodies.contacts
+    samples.sort()
+    moving = bodies.inverse_mass[:bodies.count] > 0
+    inside = (bodies.x[:bodies.count][moving] > -1) & (bodies.x[:bodies.count][moving] < side + 1)
+    inside &= (bodies.y[:bodies.count][moving] > -1) & (bodies.y[:bodies.count][moving] < side + 1)
+    return {
+        "step_p50_ms": statistics.median(samples),
+        "step_p99_ms": samples[len(samples) * 99 // 100],
+        "pairs": pairs // frames,
+        "contacts": contacts // frames,
+        "escaped": int(np.count_nonzero(~inside)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.physics", description="Fixed step of dynamic bodies, headless")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--settle", type=int, default=120, help="steps run before timing, so piles have formed")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    budget = FIXED_DT * 1000
+    results = {}
+    # crowd: top down, bodies bounce around the box. pile: with gravity, everything ends up resting on the floor.
+    for name, gravity in (("crowd", (0.0, 0.0)), ("pile", (0.0, 980.0))):
+        for count in args.sizes:
+            result = results[f"{name} {count}"] = run(count, gravity, args.frames, args.settle)
+            print(f"{name:<6} {count:6} bodies  step p50 {result['step_p50_ms']:6.2f} ms  p99 {result['step_p99_ms']:6.2f} ms  "
+                  f"{result['pairs']:7} pairs  {result['contacts']:6} contacts  "
+                  f"{'within' if result['step_p99_ms'] <= budget else 'over'} the {budget:.1f} ms step")
+            if result["escaped"]:
+                print(f"  {result['escaped']} bodies left the box")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
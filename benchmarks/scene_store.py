@@ -0,0 +1,95 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+from scene_store import SceneStore
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+WORLD = 20000
+
+
+class LegacyGameObject:
+    # The per-object class main.py used before SceneStore
+    def __init__(self, color, rect):
+        self.color = color
+        self.rect = rect
+
+
+def make_data(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.choice(COLORS), (rng.randrange(WORLD), rng.randrange(WORLD), rng.randrange(8, 120), rng.randrange(8, 120))) for _ in range(count)]
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    scene = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return scene, elapsed, size
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(count):
+    data = make_data(count)
+    colors = [color for color, _ in data]
+    rects = [rect for _, rect in data]
+    legacy, legacy_build, legacy_bytes = measure(lambda: [LegacyGameObject(color, pygame.Rect(rect)) for color, rect in data])
+
+    def build_store():
+        store = SceneStore()
+        xs, ys, ws, hs = zip(*rects)
+        store.add_many(xs, ys, ws, hs, colors)
+        return store
+    store, store_build, store_bytes = measure(build_store)
+    viewport = (5000, 5000, 4000, 3000)
+
+    def legacy_translate():
+        for obj in legacy:
+            obj.rect.move_ip(3, 4)
+
+    def legacy_filter():
+        view = pygame.Rect(viewport)
+        return [obj for obj in legacy if view.colliderect(obj.rect)]
+
+    def legacy_group():
+        groups = {}
+        for obj in legacy:
+            groups.setdefault(obj.color, []).append(obj)
+        return groups
+
+    return {
+        "objects": count,
+        "legacy_bytes": legacy_bytes,
+        "store_bytes": store_bytes,
+        "legacy_build_ms": legacy_build * 1000,
+        "store_build_ms": store_build * 1000,
+        "legacy_translate_ms": timed(legacy_translate) * 1000,
+        "store_translate_ms": timed(lambda: store.translate_all(3, 4)) * 1000,
+        "legacy_filter_ms": timed(legacy_filter) * 1000,
+        "store_filter_ms": timed(lambda: store.ids_in_rect(viewport)) * 1000,
+        "legacy_group_ms": timed(legacy_group) * 1000,
+        "store_group_ms": timed(store.group_by_color) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    for count in sizes:
+        r = run(count)
+        print(f"{count} objects")
+        print(f"  memory     GameObject list {r['legacy_bytes'] / 1e6:8.2f} MB   SceneStore {r['store_bytes'] / 1e6:8.2f} MB")
+        for name in ("build", "translate", "filter", "group"):
+            print(f"  {name:<10} GameObject list {r[f'legacy_{name}_ms']:8.2f} ms   SceneStore {r[f'store_{name}_ms']:8.2f} ms")
@@ -0,0 +1,76 @@
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+from spatial_index import SpatialHash
+
+WORLD = 20000
+QUERIES = 1000
+
+
+def make_rects(count, seed=0):
+    rng = random.Random(seed)
+    return [pygame.Rect(rng.randrange(WORLD), rng.randrange(WORLD), rng.randrange(8, 120), rng.randrange(8, 120)) for _ in range(count)]
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run(count):
+    rng = random.Random(1)
+    rects = make_rects(count)
+    points = [(rng.randrange(WORLD), rng.randrange(WORLD)) for _ in range(QUERIES)]
+    viewports = [pygame.Rect(x, y, 800, 600) for x, y in points]
+
+    index = SpatialHash()
+    build = timed(lambda: [index.insert(i, rect) for i, rect in enumerate(rects)])
+
+    def linear_points():
+        for x, y in points:
+            for rect in rects:
+                if rect.collidepoint(x, y):
+                    break
+
+    def linear_viewports():
+        for viewport in viewports:
+            [rect for rect in rects if viewport.colliderect(rect)]
+
+    def indexed_points():
+        for x, y in points:
+            index.topmost_at(x, y)
+
+    def indexed_viewports():
+        for viewport in viewports:
+            index.query_rect(viewport)
+
+    def indexed_moves():
+        for i in range(QUERIES):
+            rect = rects[i % count]
+            index.move(i % count, (rect.x + 37, rect.y + 11, rect.w, rect.h))
+
+    return {
+        "objects": count,
+        "build_ms": build * 1000,
+        "linear_point_us": timed(linear_points) / QUERIES * 1e6,
+        "index_point_us": timed(indexed_points) / QUERIES * 1e6,
+        "linear_viewport_us": timed(linear_viewports) / QUERIES * 1e6,
+        "index_viewport_us": timed(indexed_viewports) / QUERIES * 1e6,
+        "index_move_us": timed(indexed_moves) / QUERIES * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    print(f"{'objects':>8} {'build ms':>9} {'scan pt us':>11} {'index pt us':>12} {'scan view us':>13} {'index view us':>14} {'move us':>8}")
+    for count in sizes:
+        r = run(count)
+        print(f"{r['objects']:>8} {r['build_ms']:>9.1f} {r['linear_point_us']:>11.1f} {r['index_point_us']:>12.2f} "
+              f"{r['linear_viewport_us']:>13.1f} {r['index_viewport_us']:>14.2f} {r['index_move_us']:>8.2f}")
@@ -0,0 +1,61 @@
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+
+from sprites import PAGE_SIZE, PLACEMENT_DTYPE, SpriteAtlas, SurfaceCache, pack
+
+DRAWS = 20000
+
+
+def make_atlas(count, rng):
+    sizes = [(rng.randint(8, 128), rng.randint(8, 128)) for _ in range(count)]
+    start = time.perf_counter()
+    placements, page_count = pack(sizes)
+    packed = time.perf_counter() - start
+    atlas = SpriteAtlas()
+    pages = [np.full((PAGE_SIZE, PAGE_SIZE, 4), 255, np.uint8) for _ in range(page_count)]
+    records = np.array([(page, x, y, w, h) for (page, x, y), (w, h) in zip(placements, sizes)], PLACEMENT_DTYPE)
+    atlas.set_state([], records, pages)
+    fill = sum(w * h for w, h in sizes) / (page_count * PAGE_SIZE * PAGE_SIZE)
+    return atlas, packed, page_count, fill
+
+
+def draw_rate(screen, atlas, draws, cached, rng):
+    # Every draw asks for one of a few on-screen sizes of a sprite, as a scene full of scaled copies does
+    pages = [pygame.image.frombuffer(page.tobytes(), (PAGE_SIZE, PAGE_SIZE), "RGBA").convert_alpha() for page in atlas.pages]
+
+    def scaled(key):
+        sprite, w, h = key
+        page, x, y, sprite_w, sprite_h = atlas.placements[sprite].tolist()
+        return pygame.transform.smoothscale(pages[page].subsurface((x, y, sprite_w, sprite_h)), (w, h)), w * h * 4
+
+    cache = SurfaceCache(scaled)
+    keys = [(rng.randrange(len(atlas.placements)), rng.choice((16, 32, 48)), rng.choice((16, 32, 48))) for _ in range(draws)]
+    start = time.perf_counter()
+    for key in keys:
+        image = cache.get(key) if cached else scaled(key)[0]
+        screen.blit(image, (key[1], key[2]))
+    return draws / (time.perf_counter() - start), cache
+
+
+if __name__ == "__main__":
+    pygame.display.init()
+    screen = pygame.display.set_mode((800, 600))
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500]
+    for count in sizes:
+        rng = random.Random(count)
+        atlas, packed, page_count, fill = make_atlas(count, rng)
+        uncached, _ = draw_rate(screen, atlas, DRAWS, False, rng)
+        cached, cache = draw_rate(screen, atlas, DRAWS, True, rng)
+        print(f"{count} sprites")
+        print(f"  skyline pack              {packed * 1000:10.1f} ms   {page_count} page(s), {fill:.0%} filled")
+        print(f"  scale on every draw       {uncached:10.0f} draws/s")
+        print(f"  LRU surface cache         {cached:10.0f} draws/s   {cache.hits} hits, {cache.misses} misses")
+    pygame.quit()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["main.py", "code_editor.py"]
+RUNS = 5
+TARGET = 1.0  # seconds from launch until the main window is up
+
+
+def launch(script):
+    # One cold start: the app prints its startup report and quits as soon as its window is shown
+    environment = dict(os.environ)
+    environment.update({
+        "QT_QPA_PLATFORM": os.environ.get("QT_QPA_PLATFORM", "offscreen"),
+        "SDL_VIDEODRIVER": os.environ.get("SDL_VIDEODRIVER", "dummy"),
+        "PIKE_STARTUP_REPORT": "exit",
+        "PIKE_AUTOSAVE_DIR": tempfile.mkdtemp(prefix="pike_bench_autosave_"),
+        "PIKE_SYMBOL_CACHE": tempfile.mkdtemp(prefix="pike_bench_symbols_"),
+        "PIKE_RUN_WORKERS": "0",
+    })
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(ROOT, script)], cwd=ROOT, env=environment, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    marks = {}
+    for line in result.stderr.splitlines():
+        name, _, value = line.rpartition(" ")
+        if value == "ms" and not line.startswith(" "):
+            name, _, number = name.strip().rpartition(" ")
+            marks[name.strip()] = float(number) / 1000
+    if result.returncode or "window shown" not in marks:
+        raise RuntimeError(f"{script} did not start:\n{result.stderr}")
+    return wall, marks, result.stderr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="Cold start time of the editors")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--target", type=float, default=TARGET, help="seconds until the window is shown (default 1.0)")
+    parser.add_argument("--report", action="store_true", help="print the startup report of the last run")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for script in ENTRY_POINTS:
+        walls, shown, imports = [], [], []
+        for _ in range(args.runs):
+            wall, marks, report = launch(script)
+            walls.append(wall)
+            shown.append(marks["window shown"])
+            imports.append(marks["imports"])
+        # Interpreter start-up happens before the report's clock starts, the wall time includes it and the exit
+        print(f"{script}")
+        print(f"  imports done        {statistics.median(imports) * 1000:8.1f} ms")
+        print(f"  window shown        {statistics.median(shown) * 1000:8.1f} ms")
+        print(f"  process wall time   {statistics.median(walls) * 1000:8.1f} ms")
+        if args.report:
+            print(report)
+        if statistics.median(walls) > args.target:
+            print(f"  slower than the {args.target:g} s target")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
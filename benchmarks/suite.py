@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Everything runs without a display: pygame on the dummy video driver, Qt offscreen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+os.environ["PIKE_AUTOSAVE_DIR"] = tempfile.mkdtemp(prefix="pike_bench_autosave_")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+from PyQt5.QtCore import QEvent, QPointF, Qt
+from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtWidgets import QApplication
+
+import pik_format
+import play_mode
+from main import MainWindow
+
+SIZES = [1000, 10000, 100000, 1000000]
+WORLD = 20000
+VIEW = (800, 600)
+CLICKS = 200
+FRAMES = 120
+THRESHOLD = 0.2
+
+
+def make_scene(count, seed=0):
+    # Scene density grows with the object count, the visible window always covers the same world area
+    rng = np.random.default_rng(seed)
+    objects = np.empty(count, pik_format.OBJECT_DTYPE)
+    objects["x"] = rng.integers(0, WORLD, count)
+    objects["y"] = rng.integers(0, WORLD, count)
+    objects["w"] = rng.integers(8, 120, count)
+    objects["h"] = rng.integers(8, 120, count)
+    objects["color"] = rng.integers(0, 1 << 24, count)
+    cameras = np.array([(0, 0) + VIEW], pik_format.CAMERA_DTYPE)
+    return objects, cameras
+
+
+def timed(func, repeat):
+    # Median wall time in milliseconds
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+class PanEdits:
+    # Feeds run_loop one camera pan per frame, then stops it
+    def __init__(self, frames):
+        self.frames = frames
+        self.waiting = False
+
+    def get_nowait(self):
+        if self.waiting:
+            self.waiting = False
+            raise queue.Empty
+        self.waiting = True
+        if self.frames == 0:
+            return None
+        self.frames -= 1
+        return "pan"
+
+
+def play_fps(area, screen, frames, pan):
+    area.cameras[0].topleft = (0, 0)
+
+    def on_edit(message):
+        if pan:
+            area.cameras[0].move_ip(1, 1)  # moving the camera forces a full redraw every frame
+    start = time.perf_counter()
+    play_mode.run_loop(area, screen, PanEdits(frames), on_edit, fps=0)
+    return frames / (time.perf_counter() - start)
+
+
+def run(window, screen, count, repeat, frames):
+    area = window.game_area
+    objects, cameras = make_scene(count)
+    area.load_records(objects, cameras)
+    results = {"objects": count}
+
+    serialized = area.serialize_objects()
+    results["serialize_ms"] = timed(area.serialize_objects, repeat)
+    results["deserialize_ms"] = timed(lambda serialized=serialized: area.deserialize_objects(serialized), repeat)
+    del serialized
+
+    path = os.path.join(tempfile.gettempdir(), f"pike_bench_{count}.pik")
+    results["save_ms"] = timed(lambda: window.write_project(path), repeat)
+    results["load_ms"] = timed(lambda: window.read_project(path), repeat)
+    results["file_bytes"] = os.path.getsize(path)
+    os.remove(path)
+
+    rng = random.Random(1)
+    points = [QPointF(rng.randrange(VIEW[0]), rng.randrange(VIEW[1])) for _ in range(CLICKS)]
+
+    def clicks():
+        for point in points:
+            area.mousePressEvent(QMouseEvent(QEvent.MouseButtonPress, point, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier))
+            area.mouseReleaseEvent(QMouseEvent(QEvent.MouseButtonRelease, point, Qt.LeftButton, Qt.NoButton, Qt.NoModifier))
+    results["hit_test_us"] = timed(clicks, repeat) * 1000 / CLICKS
+
+    def cold_paint():
+        area.tiles.clear()
+        area.grab()
+    results["paint_cold_ms"] = timed(cold_paint, repeat)
+    results["paint_cached_ms"] = timed(area.grab, repeat)
+
+    results["play_static_fps"] = play_fps(area, screen, frames, False)
+    results["play_pan_fps"] = play_fps(area, screen, frames, True)
+    return results
+
+
+def higher_is_better(metric):
+    return metric.endswith("_fps")
+
+
+def compare(baseline, current, threshold):
+    # Returns the list of (size, metric, old, new, change) that regressed past the threshold
+    regressions = []
+    print(f"{'objects':>8} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>8}")
+    for size, metrics in current["results"].items():
+        old_metrics = baseline["results"].get(size)
+        if old_metrics is None:
+            continue
+        for metric, new in metrics.items():
+            old = old_metrics.get(metric)
+            if metric in ("objects", "file_bytes") or not old:
+                continue
+            change = (old - new) / old if higher_is_better(metric) else (new - old) / old
+            flag = ""
+            if change > threshold:
+                regressions.append((size, metric, old, new, change))
+                flag = "  REGRESSED"
+            print(f"{size:>8} {metric:<16} {old:>12.3f} {new:>12.3f} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description="Headless Pike Engine benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=FRAMES)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="fail if a metric regressed against this JSON file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed regression, 0.2 is 20%% (default)")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = MainWindow()
+    window.game_area.resize(*VIEW)
+    pygame.display.init()
+    screen = pygame.display.set_mode(play_mode.SCREEN_SIZE)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pygame": pygame.version.ver,
+        "numpy": np.__version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": {},
+    }
+    try:
+        for count in args.sizes:
+            report["results"][str(count)] = run(window, screen, count, args.repeat, args.frames)
+            app.processEvents()  # the batched hierarchy updates and repaints queued by this size, outside the timings
+            print(f"{count} objects: " + ", ".join(f"{key} {value:.3f}" for key, value in report["results"][str(count)].items() if key != "objects"), file=sys.stderr)
+    finally:
+        window.journal.close()
+        pygame.display.quit()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
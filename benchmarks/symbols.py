@@ -0,0 +1,122 @@
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from symbol_index import DocumentIndex, SymbolIndex, parse_symbols
+
+LOOKUPS = 2000
+
+TEMPLATE = '''class Enemy{n}(GameObject):
+    speed = {n}
+
+    def update(self, dt):
+        self.x += self.speed * dt
+
+    def draw_{n}(self, screen):
+        return screen
+
+
+def spawn_enemy_{n}(scene):
+    return scene.add(Enemy{n}())
+
+'''
+
+
+def make_source(classes, offset=0):
+    return "".join(TEMPLATE.replace("{n}", str(offset + n)) for n in range(classes))
+
+
+def make_workspace(files, classes):
+    root = tempfile.mkdtemp(prefix="pike_bench_symbols_")
+    for number in range(files):
+        package = os.path.join(root, f"package_{number % 10}")
+        os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"module_{number}.py"), "w") as source_file:
+            source_file.write(make_source(classes, number * classes))
+    return root
+
+
+def scan(cache_dir, root):
+    index = SymbolIndex(cache_dir=cache_dir)
+    start = time.perf_counter()
+    index.set_root(root)
+    index.wait()
+    elapsed = time.perf_counter() - start
+    return index, elapsed
+
+
+def lookup_us(func, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6, max(samples) * 1e6
+
+
+def run(files, classes):
+    root = make_workspace(files, classes)
+    cache_dir = tempfile.mkdtemp(prefix="pike_bench_symbol_cache_")
+    try:
+        index, cold = scan(cache_dir, root)
+        symbols = sum(len(entry[3]) for entry in index.files.values())
+        index.close()
+        index, warm = scan(cache_dir, root)
+        index.close()
+        touched = os.path.join(root, "package_0", "module_0.py")
+        with open(touched, "a") as source_file:
+            source_file.write("\ndef added_later():\n    pass\n")
+        index, one_changed = scan(cache_dir, root)
+        parsed = index.stats["parsed"]
+
+        names = [f"Enemy{n}" for n in range(0, files * classes, max(1, files * classes // LOOKUPS))]
+        definition = lookup_us(index.definitions, names)
+        find = lookup_us(index.find, [name[:7] for name in names])
+        index.close()
+
+        source = make_source(classes * 10)
+        start = time.perf_counter()
+        parse_symbols(source, "open.py")
+        full_parse = time.perf_counter() - start
+        document = DocumentIndex("open.py")
+        document.update(source)
+        edited = source.replace("self.x += self.speed * dt", "self.x += self.speed * dt * 2", 1)
+        start = time.perf_counter()
+        document.update(edited)
+        incremental = time.perf_counter() - start
+        return {
+            "files": files,
+            "symbols": symbols,
+            "cold": cold,
+            "warm": warm,
+            "one_changed": one_changed,
+            "parsed": parsed,
+            "definition": definition,
+            "find": find,
+            "document_lines": source.count("\n"),
+            "full_parse": full_parse,
+            "incremental": incremental,
+            "regions_parsed": document.parsed,
+        }
+    finally:
+        shutil.rmtree(root)
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500]
+    for files in sizes:
+        result = run(files, 40)
+        print(f"{result['files']} files, {result['symbols']} symbols")
+        print(f"  cold scan                 {result['cold'] * 1000:10.1f} ms")
+        print(f"  cached scan               {result['warm'] * 1000:10.1f} ms")
+        print(f"  scan after one file edit  {result['one_changed'] * 1000:10.1f} ms   {result['parsed']} file(s) parsed")
+        print(f"  go to definition          {result['definition'][0]:10.1f} us median {result['definition'][1]:8.1f} us worst")
+        print(f"  find symbol (prefix)      {result['find'][0]:10.1f} us median {result['find'][1]:8.1f} us worst")
+        print(f"  open document, {result['document_lines']} lines: full parse {result['full_parse'] * 1000:.1f} ms, "
+              f"one edit {result['incremental'] * 1000:.1f} ms ({result['regions_parsed']} region parsed)")
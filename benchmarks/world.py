@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+
+import pik_format
+from play_mode import PlayScene
+from world_partition import CELL_SIZE, OBJECT_BYTES, PREFETCH_MARGIN, WorldPartition, cell_name, cells_dir, write_cell, write_manifest
+
+DENSITY = 2000  # objects per cell
+VIEW = (800, 600)
+SPEED = 40  # world pixels the camera pans per frame
+FRAME = 1 / 60
+
+
+def make_world(path, columns, rows, seed=0):
+    # Written cell by cell, the whole world never has to fit in memory
+    rng = np.random.default_rng(seed)
+    directory = cells_dir(path)
+    os.makedirs(directory)
+    cells = []
+    uid = 0
+    for column in range(columns):
+        for row in range(rows):
+            objects = np.empty(DENSITY, pik_format.OBJECT_DTYPE)
+            objects["x"] = column * CELL_SIZE + rng.integers(0, CELL_SIZE, DENSITY)
+            objects["y"] = row * CELL_SIZE + rng.integers(0, CELL_SIZE, DENSITY)
+            objects["w"] = rng.integers(8, 120, DENSITY)
+            objects["h"] = rng.integers(8, 120, DENSITY)
+            objects["color"] = rng.integers(0, 1 << 24, DENSITY)
+            write_cell(os.path.join(directory, cell_name((column, row))), objects, np.full(DENSITY, -1, pik_format.SPRITE_DTYPE), np.arange(uid, uid + DENSITY, dtype=np.uint64))
+            uid += DENSITY
+            cells.append([column, row, DENSITY])
+    meta = {"cell_size": CELL_SIZE, "next_uid": uid, "reach": [120, 120], "cells": cells}
+    write_manifest(path, meta, pik_format.camera_records([(0, 0) + VIEW]))
+    return uid
+
+
+def pan(path, margin, budget, frames):
+    # A camera flying diagonally across the world at a steady frame rate
+    scene = PlayScene()
+    world = WorldPartition(path, scene, budget=budget, margin=margin, read_only=True)
+    camera = pygame.Rect((0, 0) + VIEW)
+    samples = []
+    peak = 0
+    for frame in range(frames):
+        camera.topleft = (frame * SPEED, frame * SPEED // 2)
+        start = time.perf_counter()
+        world.update([camera])
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed * 1000)
+        peak = max(peak, world.loaded_objects)
+        time.sleep(max(0.0, FRAME - elapsed))
+    world.close()
+    samples.sort()
+    stats = dict(world.stats)
+    needed = stats["prefetch_hits"] + stats["prefetch_misses"]
+    return {
+        "update_p50_ms": statistics.median(samples),
+        "update_p99_ms": samples[len(samples) * 99 // 100],
+        "prefetch_hit_rate": stats["prefetch_hits"] / max(needed, 1),
+        "stalls": stats["stalls"],
+        "stall_ms": stats["stall_ms"],
+        "worst_stall_ms": stats["worst_stall_ms"],
+        "peak_loaded_objects": peak,
+        "evictions": stats["evictions"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.world", description="Streaming a world partition under a panning camera")
+    parser.add_argument("--cells", type=int, default=40, help="world is cells x cells (default 40, 3.2M objects)")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--budget-mb", type=int, default=16)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="pike_bench_world_")
+    try:
+        path = os.path.join(directory, "world.pik")
+        start = time.perf_counter()
+        total = make_world(path, args.cells, args.cells)
+        print(f"{total} objects in {args.cells * args.cells} cells, written in {time.perf_counter() - start:.1f} s "
+              f"(~{total * OBJECT_BYTES / 1048576:.0f} MB if fully loaded, budget {args.budget_mb} MB)")
+        results = {}
+        for name, margin in (("no prefetch", 0), ("prefetch", PREFETCH_MARGIN)):
+            result = results[name] = pan(path, margin, args.budget_mb * 1024 * 1024, args.frames)
+            print(f"  {name:<12} update p50 {result['update_p50_ms']:6.2f} ms  p99 {result['update_p99_ms']:6.2f} ms  "
+                  f"hits {result['prefetch_hit_rate']:4.0%}  stalls {result['stalls']:3} ({result['stall_ms']:.0f} ms, worst {result['worst_stall_ms']:.1f} ms)  "
+                  f"peak {result['peak_loaded_objects']} objects loaded, {result['evictions']} evictions")
+        if args.output:
+            with open(args.output, "w") as output_file:
+                json.dump(results, output_file, indent=2)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import pygame
+
+DEFAULT_VIEW = ((0, 0), 1.0, 0.0)  # screen position, zoom and rate of a new camera
+
+
+class Camera(pygame.Rect):
+    # The Rect is the world area the camera sees. screen_position is where its viewport sits on the game
+    # screen, zoom scales the world into it (0.1 for a minimap) and rate caps how many times a second it is
+    # redrawn, 0 redraws whenever something in view changed.
+    def __init__(self, rect, screen_position=(0, 0), zoom=1.0, rate=0.0):
+        super().__init__(rect)
+        self.screen_position = tuple(screen_position)
+        self.zoom = float(zoom)
+        self.rate = float(rate)
+
+    @property
+    def viewport(self):
+        return pygame.Rect(self.screen_position, (max(1, round(self.width * self.zoom)), max(1, round(self.height * self.zoom))))
+
+    def view(self):
+        # Everything that decides what the camera's render target shows
+        return tuple(self), self.screen_position, self.zoom
+
+    def settings(self):
+        return self.screen_position, self.zoom, self.rate
+
+    def set_view(self, screen_position, zoom, rate):
+        self.screen_position = tuple(screen_position)
+        self.zoom = float(zoom)
+        self.rate = float(rate)
+
+
+def make_cameras(records, views=None):
+    # Cameras from .pik camera records, with their CAMERA_VIEWS records when the file has them
+    cameras = [Camera(rect) for rect in records.tolist()]
+    if views is not None and len(views) == len(cameras):
+        for camera, (x, y, zoom, rate) in zip(cameras, views.tolist()):
+            camera.set_view((x, y), zoom, rate)
+    return cameras
@@ -1,13 +1,420 @@
 import sys
 import re
-import subprocess
-from PyQt5.QtWidgets import QApplication, QMainWindow, QPlainTextEdit, QVBoxLayout, QWidget, QTextEdit, QAction, QFileDialog, QPushButton, QSplitter
-from PyQt5.QtGui import QFont, QTextCursor, QTextCharFormat, QBrush, QColor, QPainter, QPainterPath, QPalette, QIcon, QSyntaxHighlighter
-from PyQt5.QtCore import Qt, QSize, QRect, QRectF, QObject, QEvent, pyqtSignal
-from io import StringIO
-import contextlib
+from profiler import profiler, startup  # first, so the startup report times the imports below
+from PyQt5.QtWidgets import QApplication, QMainWindow, QPlainTextEdit, QVBoxLayout, QWidget, QTextEdit, QAction, QFileDialog, QPushButton, QSplitter, QPlainTextDocumentLayout, QProgressBar, QTreeWidget, QTreeWidgetItem, QDialog, QLineEdit, QListWidget
+from PyQt5.QtGui import QFont, QTextCursor, QTextCharFormat, QBrush, QColor, QPainter, QPainterPath, QPalette, QIcon, QSyntaxHighlighter, QDesktopServices, QTextDocument
+from PyQt5.QtCore import Qt, QSize, QRect, QRectF, QObject, QEvent, QProcess, QProcessEnvironment, QThread, QTimer, QUrl, pyqtSignal
 import os
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+import codecs
+import io
+import json
+import mmap
+import shutil
+import tempfile
+import time
+from symbol_index import SymbolIndex
+
+RUN_TIMEOUT = float(os.environ.get("PIKE_RUN_TIMEOUT", "0"))  # seconds, 0 lets a run go on until it is stopped
+RUN_MEMORY_MB = int(os.environ.get("PIKE_RUN_MEMORY_MB", "0"))  # address space limit of a run, 0 for none
+STOP_GRACE_MS = 2000
+
+LARGE_FILE_BYTES = 2 * 1024 * 1024  # from this size files load in the background with the expensive features off
+LOAD_CHUNK_BYTES = 4 * 1024 * 1024
+
+INDEX_IDLE_MS = 400  # the open document is re-indexed once typing pauses this long
+
+CONSOLE_MAX_LINES = 10000  # older lines drop off the top, the spill file keeps everything
+CONSOLE_FLUSH_MS = 50
+CONSOLE_FLUSH_CHARS = 1024 * 1024
+CONSOLE_BUSY_SHARE = 0.25  # inserting output may take at most this share of the editor's time
+
+RUN_WORKERS = int(os.environ.get("PIKE_RUN_WORKERS", "2"))  # warm interpreters kept waiting for the next run
+RUN_PRELOAD = [name for name in os.environ.get("PIKE_RUN_PRELOAD", "pygame,numpy").split(",") if name]
+CODE_CACHE_DIR = os.environ.get("PIKE_CODE_CACHE", os.path.join(os.path.expanduser("~"), ".pike", "code_cache"))
+CODE_CACHE_ENTRIES = 64
+
+# Runs in a worker interpreter: argv lists modules to import ahead of time, then one job arrives as a JSON line on stdin
+RUNNER_BOOTSTRAP = """
+import hashlib, importlib.util, json, linecache, marshal, os, sys, traceback
+for module in sys.argv[1:]:
+    try:
+        __import__(module)
+    except Exception:
+        pass
+line = sys.stdin.readline()
+if not line:
+    sys.exit(0)
+job = json.loads(line)
+if job["limit"]:
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (job["limit"], job["limit"]))
+    except (ImportError, ValueError, OSError):
+        print("memory limit is not supported on this platform", file=sys.stderr)
+os.chdir(job["cwd"])
+sys.path[0] = job["cwd"]
+name = job["name"]
+with open(job["path"]) as script:
+    source = script.read()
+linecache.cache[name] = (len(source), None, source.splitlines(True), name)  # tracebacks show the editor's lines
+sys.argv = [name]
+try:
+    key = hashlib.sha256(importlib.util.MAGIC_NUMBER + name.encode() + b"\\0" + source.encode()).hexdigest()
+    cache_path = os.path.join(job["cache"], key + ".code")
+    code = None
+    try:
+        with open(cache_path, "rb") as cached:
+            code = marshal.load(cached)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    if code is None:
+        code = compile(source, name, "exec")
+        try:
+            with open(cache_path + ".tmp", "wb") as cached:
+                marshal.dump(code, cached)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass
+    exec(code, {"__name__": "__main__", "__file__": name})
+except SystemExit:
+    raise
+except BaseException as error:
+    traceback.print_exception(type(error), error, error.__traceback__.tb_next)  # leave this bootstrap out
+    sys.exit(1)
+"""
+
+class CodeRunner(QObject):
+    # Runs editor code in a child interpreter so a long loop or a pygame window cannot freeze the editor.
+    # Workers are started ahead of time with RUN_PRELOAD imported, each one takes a single run and is replaced.
+    output = pyqtSignal(str, bool)  # text, came from stderr
+    finished = pyqtSignal(str)  # summary line for the console
+
+    def __init__(self, parent=None, workers=RUN_WORKERS):
+        super().__init__(parent)
+        self.workers = workers
+        self.idle = []
+        self.process = None
+        self.stop_reason = None
+        self.started_ns = 0
+        self.decoders = {}
+        self.script_path = os.path.join(tempfile.gettempdir(), f"pike_run_{os.getpid()}.py")
+        self.timeout_timer = QTimer(self)
+        self.timeout_timer.setSingleShot(True)
+        self.timeout_timer.timeout.connect(self.timed_out)
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.timeout.connect(self.kill)
+        os.makedirs(CODE_CACHE_DIR, exist_ok=True)
+        self.prune_code_cache()
+        QTimer.singleShot(0, self.warm)  # after the window is up
+
+    def prune_code_cache(self):
+        entries = [os.path.join(CODE_CACHE_DIR, name) for name in os.listdir(CODE_CACHE_DIR)]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[CODE_CACHE_ENTRIES:]:
+            os.remove(path)
+
+    def spawn(self):
+        worker = QProcess(self)
+        environment = QProcessEnvironment.systemEnvironment()
+        environment.insert("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        worker.setProcessEnvironment(environment)
+        worker.setProgram(sys.executable)
+        worker.setArguments(["-u", "-c", RUNNER_BOOTSTRAP] + RUN_PRELOAD)
+        worker.start()
+        return worker
+
+    def warm(self):
+        self.idle = [worker for worker in self.idle if worker.state() != QProcess.NotRunning]
+        while len(self.idle) < self.workers:
+            self.idle.append(self.spawn())
+
+    def running(self):
+        return self.process is not None and self.process.state() != QProcess.NotRunning
+
+    def start(self, source, name="<editor>", working_directory=None, timeout=RUN_TIMEOUT, memory_mb=RUN_MEMORY_MB):
+        if self.running():
+            return False
+        with open(self.script_path, "w") as script:
+            script.write(source)
+        self.stop_reason = None
+        self.decoders = {False: codecs.getincrementaldecoder("utf-8")("replace"), True: codecs.getincrementaldecoder("utf-8")("replace")}
+        self.started_ns = time.perf_counter_ns()
+        self.warm()
+        self.process = self.idle.pop(0) if self.idle else self.spawn()
+        self.process.readAllStandardOutput()  # anything the preloads printed is not part of this run
+        self.process.readAllStandardError()
+        self.process.readyReadStandardOutput.connect(lambda: self.read(False))
+        self.process.readyReadStandardError.connect(lambda: self.read(True))
+        self.process.finished.connect(self.process_finished)
+        self.process.errorOccurred.connect(self.process_error)
+        job = {
+            "path": self.script_path,
+            "name": name,
+            "cwd": working_directory or os.getcwd(),
+            "limit": memory_mb * 1024 * 1024,
+            "cache": CODE_CACHE_DIR,
+        }
+        self.process.write(json.dumps(job).encode() + b"\n")
+        self.process.closeWriteChannel()  # input() in a run sees end of file
+        if timeout:
+            self.timeout_timer.start(int(timeout * 1000))
+        return True
+
+    def read(self, error):
+        data = self.process.readAllStandardError() if error else self.process.readAllStandardOutput()
+        text = self.decoders[error].decode(bytes(data))
+        if text:
+            self.output.emit(text, error)
+
+    def stop(self, reason="stopped"):
+        if not self.running():
+            return
+        self.stop_reason = reason
+        self.process.terminate()
+        self.kill_timer.start(STOP_GRACE_MS)  # a run that ignores SIGTERM is killed after the grace period
+
+    def timed_out(self):
+        self.stop_reason = f"timed out after {self.timeout_timer.interval() / 1000:g} s"
+        self.kill()
+
+    def kill(self):
+        if self.running():
+            self.process.kill()
+
+    def process_error(self, error):
+        if error == QProcess.FailedToStart:
+            self.timeout_timer.stop()
+            self.finished.emit(f"Could not start {sys.executable}: {self.process.errorString()}")
+
+    def process_finished(self, exit_code, exit_status):
+        self.timeout_timer.stop()
+        self.kill_timer.stop()
+        self.read(False)
+        self.read(True)
+        elapsed = (time.perf_counter_ns() - self.started_ns) / 1e9
+        if profiler.enabled:
+            profiler.sample("run", self.started_ns, time.perf_counter_ns())
+        if self.stop_reason is not None:
+            message = f"Run {self.stop_reason} ({elapsed:.2f} s)"
+        elif exit_status == QProcess.CrashExit:
+            message = f"Run crashed ({elapsed:.2f} s)"
+        else:
+            message = f"Run finished with exit code {exit_code} ({elapsed:.2f} s)"
+        self.process.deleteLater()
+        self.process = None
+        self.finished.emit(message)
+        self.warm()
+
+    def close(self):
+        self.workers = 0  # nothing is respawned while shutting down
+        for worker in self.idle + ([self.process] if self.running() else []):
+            worker.kill()
+            worker.waitForFinished(STOP_GRACE_MS)
+        self.idle.clear()
+        if os.path.exists(self.script_path):
+            os.remove(self.script_path)
+
+class Console(QPlainTextEdit):
+    # Output sink: writes are buffered and inserted in one edit per flush, the document is a ring of CONSOLE_MAX_LINES
+    def __init__(self, parent=None, max_lines=CONSOLE_MAX_LINES):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        self.setMaximumBlockCount(max_lines)
+        self.pending = []  # (text, is error)
+        self.pending_chars = 0
+        self.lines = 0
+        self.flush_cost = 0.0
+        self.spill_path = os.path.join(tempfile.gettempdir(), f"pike_console_{os.getpid()}.log")
+        self.spill_file = None
+        self.error_format = QTextCharFormat()
+        self.error_format.setForeground(Qt.red)
+        self.plain_format = QTextCharFormat()
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def reset(self):
+        self.flush_timer.stop()
+        self.pending.clear()
+        self.pending_chars = 0
+        self.lines = 0
+        self.clear()
+        if self.spill_file is not None:
+            self.spill_file.close()
+        self.spill_file = open(self.spill_path, "w", encoding="utf-8")
+
+    def write(self, text, error=False):
+        if self.spill_file is not None:
+            self.spill_file.write(text)
+        self.pending.append((text, error))
+        self.pending_chars += len(text)
+        if self.pending_chars >= CONSOLE_FLUSH_CHARS:
+            self.flush()
+        elif not self.flush_timer.isActive():
+            # Under heavy output flushes get further apart, so each one carries more lines and fewer get laid out
+            self.flush_timer.start(max(CONSOLE_FLUSH_MS, int(self.flush_cost * 1000 / CONSOLE_BUSY_SHARE)))
+
+    def flush(self):
+        self.flush_timer.stop()
+        if not self.pending:
+            return
+        started = time.perf_counter()
+        runs = []  # consecutive writes to the same channel become one insert
+        for text, error in self.pending:
+            if runs and runs[-1][1] == error:
+                runs[-1][0].append(text)
+            else:
+                runs.append(([text], error))
+        runs = [("".join(parts), error) for parts, error in runs]
+        self.pending.clear()
+        self.pending_chars = 0
+        if self.spill_file is not None:
+            self.spill_file.flush()
+
+        new_lines = sum(text.count("\n") for text, _ in runs)
+        self.lines += new_lines
+        replace = new_lines >= self.maximumBlockCount()
+        if replace:
+            # Everything shown now would be trimmed anyway, lay out only the lines that stay
+            runs = self.tail(runs, self.maximumBlockCount() - 1)
+
+        scrollbar = self.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        if replace:
+            self.clear()
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for text, error in runs:
+            cursor.insertText(text, self.error_format if error else self.plain_format)
+        cursor.endEditBlock()
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+        self.flush_cost = time.perf_counter() - started
+
+    def tail(self, runs, keep):
+        # The runs cut down to their last keep lines
+        kept = []
+        for text, error in reversed(runs):
+            count = text.count("\n")
+            if count < keep:
+                kept.append((text, error))
+                keep -= count
+                continue
+            position = len(text)
+            for _ in range(keep + 1):
+                position = text.rfind("\n", 0, position)
+            kept.append((text[position + 1:], error))
+            break
+        kept.reverse()
+        return kept
+
+    def dropped_lines(self):
+        return max(0, self.lines - self.maximumBlockCount() + 1)
+
+    def open_spill(self):
+        self.flush()
+        if os.path.exists(self.spill_path):
+            QDesktopServices.openUrl(QUrl.fromLocalFile(self.spill_path))
+
+    def close_spill(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+class FileLoader(QThread):
+    # Decodes a file through mmap in chunks and builds its QTextDocument off the GUI thread
+    progress = pyqtSignal(int, int)  # bytes decoded, file size
+    loaded = pyqtSignal(object, str)  # QTextDocument, path
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+    def run(self):
+        try:
+            parts = []
+            decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")("replace"), translate=True)
+            with open(self.path, "rb") as source:
+                size = os.fstat(source.fileno()).st_size
+                if size:
+                    with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        for offset in range(0, size, LOAD_CHUNK_BYTES):
+                            parts.append(decoder.decode(mapped[offset:offset + LOAD_CHUNK_BYTES]))
+                            self.progress.emit(min(offset + LOAD_CHUNK_BYTES, size), size)
+            parts.append(decoder.decode(b"", final=True))
+            document = QTextDocument()
+            document.setPlainText("".join(parts))
+            document.moveToThread(QApplication.instance().thread())  # handed to the editor once it is complete
+            self.loaded.emit(document, self.path)
+        except (OSError, ValueError) as error:
+            self.failed.emit(str(error))
+
+class FileSaver(QThread):
+    # Writes next to the target and renames over it, a failed or interrupted save leaves the old file intact
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, text, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.text = text
+
+    def run(self):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as target:
+                target.write(self.text)
+                target.flush()
+                os.fsync(target.fileno())
+            try:
+                shutil.copymode(self.path, temp_path)  # the new file would otherwise get default permissions
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, self.path)
+            self.saved.emit(self.path)
+        except OSError as error:
+            self.failed.emit(str(error))
+
+class SymbolFinder(QDialog):
+    # Find Symbol: type the start of a name, Enter jumps to the selected definition
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.symbols = []
+        self.setWindowTitle("Find Symbol")
+        self.resize(500, 300)
+        self.query = QLineEdit(self)
+        self.results = QListWidget(self)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.query)
+        layout.addWidget(self.results)
+        self.query.textChanged.connect(self.search)
+        self.query.returnPressed.connect(self.accept)
+        self.results.itemActivated.connect(self.accept)
+
+    def search(self, text):
+        with profiler.span("symbols.find"):
+            self.symbols = self.index.find(text)
+        self.results.clear()
+        for symbol in self.symbols:
+            self.results.addItem(f"{symbol.name}    {symbol.kind} in {os.path.basename(symbol.path)}:{symbol.line}")
+        self.results.setCurrentRow(0)
+
+    def keyPressEvent(self, event):
+        if event.key() in (Qt.Key_Up, Qt.Key_Down):
+            self.results.keyPressEvent(event)  # pick a result without leaving the query field
+        else:
+            super().keyPressEvent(event)
+
+    def selected(self):
+        row = self.results.currentRow()
+        return self.symbols[row] if 0 <= row < len(self.symbols) else None
 
 class LineNumberArea(QWidget):
     def __init__(self, editor):
@@ -20,35 +427,84 @@ class LineNumberArea(QWidget):
     def paintEvent(self, event):
         self.code_editor.line_number_area_paint_event(event)
 
+KEYWORDS = [
+    "and", "as", "assert", "break", "class", "continue",
+    "def", "del", "elif", "else", "except", "False",
+    "finally", "for", "from", "global", "if", "import",
+    "in", "is", "lambda", "None", "nonlocal", "not",
+    "or", "pass", "raise", "return", "True", "try",
+    "while", "with", "yield"
+]
+
+# One alternation for the whole line, the earliest token wins so keywords inside strings and comments are skipped
+TOKEN_PATTERN = re.compile(
+    r"(?P<comment>#.*)"
+    r"|(?P<string>(?:\b[rRbBuUfF]{1,2})?(?P<quote>'''|\"\"\"|'|\"))"
+    r"|(?P<keyword>\b(?:" + "|".join(KEYWORDS) + r")\b)"
+)
+STRING_END = {
+    "'": re.compile(r"(?:[^'\\]|\\.)*'"),
+    '"': re.compile(r'(?:[^"\\]|\\.)*"'),
+    "'''": re.compile(r"(?:[^'\\]|\\.|'(?!''))*'''", re.S),
+    '"""': re.compile(r'(?:[^"\\]|\\.|"(?!""))*"""', re.S),
+}
+
+# Block states, a block that ends inside a triple-quoted string hands it to the next one
+NORMAL, IN_SINGLE_TRIPLE, IN_DOUBLE_TRIPLE = 0, 1, 2
+TRIPLE_STATES = {"'''": IN_SINGLE_TRIPLE, '"""': IN_DOUBLE_TRIPLE}
+STATE_QUOTES = {IN_SINGLE_TRIPLE: "'''", IN_DOUBLE_TRIPLE: '"""'}
+
 class PythonHighlighter(QSyntaxHighlighter):
     def __init__(self, document):
         super().__init__(document)
 
-        keyword_format = QTextCharFormat()
-        keyword_format.setForeground(Qt.blue)
-        keyword_format.setFontWeight(QFont.Bold)
-
-        keywords = [
-            "and", "as", "assert", "break", "class", "continue",
-            "def", "del", "elif", "else", "except", "False",
-            "finally", "for", "from", "global", "if", "import",
-            "in", "is", "lambda", "None", "nonlocal", "not",
-            "or", "pass", "raise", "return", "True", "try",
-            "while", "with", "yield"
-        ]
-
-        self.highlighting_rules = [(re.compile(r'\b' + keyword + r'\b'), keyword_format) for keyword in keywords]
+        self.keyword_format = QTextCharFormat()
+        self.keyword_format.setForeground(Qt.blue)
+        self.keyword_format.setFontWeight(QFont.Bold)
 
         self.string_format = QTextCharFormat()
         self.string_format.setForeground(Qt.darkGreen)
-        self.highlighting_rules.append((re.compile(r'\".*\"'), self.string_format))
-        self.highlighting_rules.append((re.compile(r'\'.*\''), self.string_format))
+
+        self.comment_format = QTextCharFormat()
+        self.comment_format.setForeground(Qt.darkGray)
+        self.comment_format.setFontItalic(True)
 
     def highlightBlock(self, text):
-        for pattern, format in self.highlighting_rules:
-            iterator = pattern.finditer(text)
-            for match in iterator:
-                self.setFormat(match.start(), match.end() - match.start(), format)
+        # Qt only moves on to the next block when the state set here differs from the one it had
+        with profiler.span("highlight"):
+            position = 0
+            quote = STATE_QUOTES.get(self.previousBlockState())
+            if quote is not None:
+                position = self.string_body(text, 0, 0, quote)
+                if position is None:
+                    return
+            self.setCurrentBlockState(NORMAL)
+
+            while True:
+                match = TOKEN_PATTERN.search(text, position)
+                if match is None:
+                    return
+                kind = match.lastgroup
+                if kind == "keyword":
+                    self.setFormat(match.start(), match.end() - match.start(), self.keyword_format)
+                    position = match.end()
+                elif kind == "comment":
+                    self.setFormat(match.start(), match.end() - match.start(), self.comment_format)
+                    return
+                else:
+                    position = self.string_body(text, match.start(), match.end(), match.group("quote"))
+                    if position is None:
+                        return
+
+    def string_body(self, text, start, body_start, quote):
+        # Formats a string from start to its closing quote, returns where to carry on or None at the end of the line
+        end = STRING_END[quote].match(text, body_start)
+        if end is not None:
+            self.setFormat(start, end.end() - start, self.string_format)
+            return end.end()
+        self.setFormat(start, len(text) - start, self.string_format)
+        self.setCurrentBlockState(TRIPLE_STATES.get(quote, NORMAL))
+        return None
 
 class CodeEditor(QPlainTextEdit):
     def __init__(self):
@@ -65,6 +521,8 @@ class CodeEditor(QPlainTextEdit):
         font = QFont("Courier New", 12)  # Replace with your desired font and size
         self.setFont(font)
 
+        self.large_file = False
+        self.loaded_document = None
         self.line_number_area = LineNumberArea(self)
         self.blockCountChanged.connect(self.update_line_number_area_width)
         self.updateRequest.connect(self.update_line_number_area)
@@ -72,6 +530,7 @@ class CodeEditor(QPlainTextEdit):
         self.update_line_number_area_width()
         self.highlight_current_line()
         self.highlighter = PythonHighlighter(self.document())
+        self.highlighter.setParent(self)  # outlives the documents it is moved between
 
     def line_number_area_width(self):
         digits = 1
@@ -83,7 +542,40 @@ class CodeEditor(QPlainTextEdit):
         return space
 
     def update_line_number_area_width(self):
-        self.setViewportMargins(self.line_number_area_width(), 0, 0, 0)
+        width = self.line_number_area_width()
+        if width != self.viewportMargins().left():
+            self.setViewportMargins(width, 0, 0, 0)
+
+    def set_document(self, document, large_file):
+        # Large files get no highlighting, no line wrap and no current-line highlight
+        document.setDefaultFont(self.font())
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setParent(self)
+        previous = self.loaded_document
+        self.large_file = large_file
+        self.highlighter.setDocument(None if large_file else document)
+        self.setLineWrapMode(QPlainTextEdit.NoWrap if large_file else QPlainTextEdit.WidgetWidth)
+        self.setDocument(document)
+        self.loaded_document = document
+        if previous is not None:
+            previous.deleteLater()
+        self.update_line_number_area_width()
+        self.highlight_current_line()
+
+    def set_text(self, text):
+        if self.large_file:
+            self.set_document(QTextDocument(), False)
+        self.setPlainText(text)
+
+    def go_to_line(self, line, column=0):
+        block = self.document().findBlockByNumber(line - 1)
+        if not block.isValid():
+            return
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.Right, QTextCursor.MoveAnchor, min(column, block.length() - 1))
+        self.setTextCursor(cursor)
+        self.centerCursor()
+        self.setFocus()
 
     def update_line_number_area(self, rect, dy):
         if dy:
@@ -102,7 +594,7 @@ class CodeEditor(QPlainTextEdit):
     def highlight_current_line(self):
         extra_selections = []
 
-        if not self.isReadOnly():
+        if not self.isReadOnly() and not self.large_file:
             selection = QTextEdit.ExtraSelection()
             line_color = QColor(Qt.yellow).lighter(160)
             selection.format.setBackground(line_color)
@@ -134,23 +626,54 @@ class CodeEditor(QPlainTextEdit):
             block_number += 1
 
 class CodeEditorApp(QMainWindow):
+    symbols_changed = pyqtSignal()  # emitted from index threads, delivered on the GUI thread
+
     def __init__(self):
         super().__init__()
 
         self.editor = CodeEditor()
-        self.console = QTextEdit()  # Initialize the console widget
+        self.console = Console()  # Initialize the console widget
         self.splitter = QSplitter(Qt.Vertical)
         self.splitter.addWidget(self.editor)
         self.splitter.addWidget(self.console)
         self.splitter.setSizes([300, 100])  # Adjust initial sizes as needed
 
-        self.setCentralWidget(self.splitter)
+        self.outline = QTreeWidget()
+        self.outline.setHeaderHidden(True)
+        self.outline.itemActivated.connect(self.outline_activated)
+        self.outline.itemClicked.connect(self.outline_activated)
+        self.main_splitter = QSplitter(Qt.Horizontal)
+        self.main_splitter.addWidget(self.outline)
+        self.main_splitter.addWidget(self.splitter)
+        self.main_splitter.setSizes([180, 620])
+
+        self.setCentralWidget(self.main_splitter)
 
         self.setWindowTitle("Pike Code Editor")
         self.setGeometry(100, 100, 800, 600)
 
+        self.file_name = None
+        self.loader = None
+        self.savers = []
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.runner = CodeRunner(self)
+        self.runner.output.connect(self.append_output)
+        self.runner.finished.connect(self.run_finished)
+
+        self.pending_jump = None
+        self.symbols = SymbolIndex(on_change=self.symbols_changed.emit)
+        self.symbols_changed.connect(self.refresh_outline)
+        self.index_timer = QTimer(self)
+        self.index_timer.setSingleShot(True)
+        self.index_timer.setInterval(INDEX_IDLE_MS)
+        self.index_timer.timeout.connect(self.index_document)
+        self.editor.textChanged.connect(self.document_edited)
+        QTimer.singleShot(0, lambda: self.symbols.root or self.symbols.set_root(os.getcwd()))  # after the window is up
+
         self.init_menu_bar() # Initialize the console widget
-        self.imported_modules = {}
 
     def init_console(self):
         self.console = QPlainTextEdit(self)
@@ -173,69 +696,234 @@ class CodeEditorApp(QMainWindow):
         save_action.triggered.connect(self.save_file)
         file_menu.addAction(save_action)
         
-        run_action = QAction("Run", self)  # Add the "Run" action
-        run_action.triggered.connect(self.run_code)  # Connect the action to a function
-        menubar.addAction(run_action)  # Add the action to the menu bar
-
-    def run_import(self, module_name):
-        try:
-            module = __import__(module_name)
-            self.imported_modules[module_name] = module
-            print(f"Imported module: {module_name}")
-        except ImportError as e:
-            print(f"Error importing module {module_name}: {e}")
+        full_output_action = QAction("Open Full Output", self)
+        full_output_action.triggered.connect(self.console.open_spill)
+        file_menu.addAction(full_output_action)
+
+        export_trace_action = QAction("Export Trace", self)
+        export_trace_action.triggered.connect(self.export_trace)
+        file_menu.addAction(export_trace_action)
+
+        self.run_action = QAction("Run", self)  # Add the "Run" action
+        self.run_action.triggered.connect(self.run_code)  # Connect the action to a function
+        menubar.addAction(self.run_action)  # Add the action to the menu bar
+
+        self.stop_action = QAction("Stop", self)
+        self.stop_action.triggered.connect(self.stop_code)
+        self.stop_action.setEnabled(False)
+        menubar.addAction(self.stop_action)
+
+        navigate_menu = menubar.addMenu("Navigate")
+
+        definition_action = QAction("Go to Definition", self)
+        definition_action.setShortcut("F12")
+        definition_action.triggered.connect(self.go_to_definition)
+        navigate_menu.addAction(definition_action)
+
+        find_symbol_action = QAction("Find Symbol...", self)
+        find_symbol_action.setShortcut("Ctrl+T")
+        find_symbol_action.triggered.connect(self.find_symbol)
+        navigate_menu.addAction(find_symbol_action)
+
+    def document_key(self):
+        return os.path.abspath(self.file_name) if self.file_name else "<editor>"
+
+    def set_file_name(self, file_name):
+        self.symbols.close_document(self.document_key())
+        self.file_name = file_name
+        directory = os.path.dirname(os.path.abspath(file_name))
+        if self.symbols.root is None or not (directory + os.sep).startswith(self.symbols.root + os.sep):
+            self.symbols.set_root(directory)  # a file outside the workspace makes its folder the workspace
+        self.index_timer.start()
+
+    def document_edited(self):
+        if not self.editor.large_file:
+            self.index_timer.start()
+
+    def index_document(self):
+        if not self.editor.large_file:
+            self.symbols.update_document(self.document_key(), self.editor.toPlainText())
+
+    def refresh_outline(self):
+        self.outline.clear()
+        items = {}
+        for symbol in self.symbols.outline(self.document_key()):
+            label = symbol.name if symbol.kind == "variable" else f"{'class' if symbol.kind == 'class' else 'def'} {symbol.name}"
+            parent = items.get(symbol.container)
+            item = QTreeWidgetItem(parent or self.outline, [label])
+            item.setData(0, Qt.UserRole, symbol.line)
+            item.setData(0, Qt.UserRole + 1, symbol.column)
+            if symbol.kind == "class":
+                items[f"{symbol.container}.{symbol.name}" if symbol.container else symbol.name] = item
+        self.outline.expandAll()
+
+    def outline_activated(self, item):
+        self.editor.go_to_line(item.data(0, Qt.UserRole), item.data(0, Qt.UserRole + 1))
+
+    def go_to_definition(self):
+        cursor = self.editor.textCursor()
+        cursor.select(QTextCursor.WordUnderCursor)
+        name = cursor.selectedText()
+        if not name.isidentifier():
+            return
+        with profiler.span("symbols.definition"):
+            found = self.symbols.definitions(name, self.document_key())
+        if not found:
+            self.statusBar().showMessage(f"No definition found for {name}", 3000)
+            return
+        self.jump_to(found[0])
+
+    def find_symbol(self):
+        finder = SymbolFinder(self.symbols, self)
+        if finder.exec_() == QDialog.Accepted and finder.selected() is not None:
+            self.jump_to(finder.selected())
+
+    def jump_to(self, symbol):
+        if symbol.path in (self.document_key(), "<editor>"):
+            self.editor.go_to_line(symbol.line, symbol.column)
+            return
+        if self.editor.document().isModified():
+            self.statusBar().showMessage(f"{symbol.name} is in {symbol.path}:{symbol.line}, save this file before jumping there")
+            return
+        self.pending_jump = (symbol.line, symbol.column)
+        self.load_file(symbol.path)
+        if self.loader is None:  # small files are already in the editor
+            self.editor.go_to_line(*self.pending_jump)
+            self.pending_jump = None
+
+    def export_trace(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Trace", "pike_code_trace.json", "Trace Files (*.json);;All Files (*)")
+        if file_name:
+            profiler.export_chrome_trace(file_name)
 
     def run_code(self):
-        import_statements = re.findall(r"import \w+", self.editor.toPlainText())
-        for statement in import_statements:
-            module_name = statement.split()[1]
-            self.run_import(module_name)
-
-            code = self.editor.toPlainText()
-
-        # Execute the code using the imported modules
-        for module_name, module in self.imported_modules.items():
-            code = f"import {module_name}\n{code}"
-
-        # Redirect stdout to the console widget
-        original_stdout = sys.stdout
-        with contextlib.redirect_stdout(TextEditRedirect(self.console)):
-            try:
-                exec(code)  # Execute the code
-            except Exception as e:
-                print("An error occurred:", e)
-
-        sys.stdout = original_stdout
+        with profiler.span("run.start"):
+            name = self.file_name or "<editor>"
+            working_directory = os.path.dirname(self.file_name) if self.file_name else None
+            if not self.runner.start(self.editor.toPlainText(), name, working_directory):
+                return
+        self.console.reset()
+        self.run_action.setEnabled(False)
+        self.stop_action.setEnabled(True)
+
+    def stop_code(self):
+        self.runner.stop()
+
+    def append_output(self, text, error):
+        self.console.write(text, error)
+
+    def run_finished(self, message):
+        self.console.flush()
+        if self.console.dropped_lines():
+            message += f", {self.console.dropped_lines()} earlier lines are in File > Open Full Output"
+        self.console.write(("" if self.console.document().isEmpty() else "\n") + message + "\n")
+        self.console.flush()
+        self.run_action.setEnabled(True)
+        self.stop_action.setEnabled(False)
+
+    def closeEvent(self, event):
+        for saver in list(self.savers):
+            if not saver.isFinished():
+                saver.start()  # queued saves still happen, start does nothing on the running one
+            saver.wait()
+        if self.loader is not None:
+            self.loader.wait()
+        self.symbols.close()
+        self.runner.close()
+        self.console.close_spill()
+        super().closeEvent(event)
 
     def open_file(self):
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getOpenFileName(self, "Open File", "", "All Files (*);;Text Files (*.txt)", options=options)
 
         if file_name:
-            with open(file_name, "r") as file:
-                self.editor.setPlainText(file.read())
+            self.load_file(file_name)
+
+    def load_file(self, file_name):
+        if os.path.getsize(file_name) < LARGE_FILE_BYTES:
+            with open(file_name, "r", encoding="utf-8", errors="replace") as file:
+                self.editor.set_text(file.read())
+            self.set_file_name(file_name)
+            return
+        if self.loader is not None:
+            return  # one large file at a time
+        self.loader = FileLoader(file_name, self)
+        self.loader.progress.connect(self.load_progress)
+        self.loader.loaded.connect(self.file_loaded)
+        self.loader.failed.connect(self.load_failed)
+        self.loader.finished.connect(self.loader_finished)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.statusBar().showMessage(f"Loading {os.path.basename(file_name)}...")
+        self.loader.start()
+
+    def load_progress(self, done, total):
+        if done >= total:
+            self.progress_bar.setRange(0, 0)  # building the document, no way to tell how far along it is
+        else:
+            self.progress_bar.setValue(done * 100 // total)
+
+    def file_loaded(self, document, file_name):
+        self.editor.set_document(document, True)
+        self.set_file_name(file_name)
+        if self.pending_jump is not None:
+            self.editor.go_to_line(*self.pending_jump)
+            self.pending_jump = None
+        self.statusBar().showMessage(f"{os.path.basename(file_name)}: large file mode, highlighting and line wrap are off")
+
+    def load_failed(self, message):
+        self.statusBar().showMessage(f"Could not open file: {message}")
+
+    def loader_finished(self):
+        self.progress_bar.hide()
+        self.pending_jump = None
+        self.loader.deleteLater()
+        self.loader = None
 
     def save_file(self):
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getSaveFileName(self, "Save File", "", "All Files (*);;Text Files (*.txt)", options=options)
 
         if file_name:
-            with open(file_name, "w") as file:
-                file.write(self.editor.toPlainText())
-
-class TextEditRedirect:
-    def __init__(self, text_edit):
-        self.text_edit = text_edit
-
-    def write(self, text):
-        self.text_edit.moveCursor(QTextCursor.End)
-        self.text_edit.insertPlainText(text)
+            self.write_file(file_name)
+
+    def write_file(self, file_name):
+        document = self.editor.document()
+        revision = document.revision()
+        saver = FileSaver(file_name, self.editor.toPlainText(), self)
+        saver.saved.connect(lambda path: self.file_saved(path, document, revision))
+        saver.saved.connect(self.symbols.refresh_file)
+        saver.failed.connect(lambda message: self.statusBar().showMessage(f"Could not save: {message}"))
+        saver.finished.connect(lambda: self.save_finished(saver))
+        # Saves run one at a time in the order they were made, the next starts when the one before finishes
+        self.savers.append(saver)
+        if len(self.savers) == 1:
+            saver.start()
+        if file_name != self.file_name:
+            self.set_file_name(file_name)
+
+    def file_saved(self, path, document, revision):
+        self.statusBar().showMessage(f"Saved {path}", 3000)
+        if self.editor.document() is document and document.revision() == revision:
+            document.setModified(False)  # not if it was edited (or another file opened) while saving
+
+    def save_finished(self, saver):
+        self.savers.remove(saver)
+        if self.savers and not self.savers[0].isFinished():
+            self.savers[0].start()
 
 if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    startup.mark("imports")
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     icon = QIcon("icon.ico")
     app.setWindowIcon(icon)
+    startup.mark("QApplication")
     main_win = CodeEditorApp()
+    startup.mark("CodeEditorApp")
     main_win.show()
+    QTimer.singleShot(0, lambda: startup.finish() and main_win.close())  # runs once the first show and paint are through, closeEvent shuts down as usual
     sys.exit(app.exec_())
@@ -0,0 +1,181 @@
+import os
+from collections import deque
+
+import numpy as np
+
+UNDO_BUDGET = int(os.environ.get("PIKE_UNDO_MB", "64")) * 1024 * 1024  # bytes of history kept, the oldest steps go first
+COMMAND_BYTES = 64  # rough cost of a command's tuple on top of its arrays
+
+
+def id_array(ids):
+    return np.array(ids, np.uint32).reshape(-1)
+
+
+def command_bytes(command):
+    return COMMAND_BYTES + sum(part.nbytes for part in command if isinstance(part, np.ndarray))
+
+
+class Step:
+    # What one undo or redo applies: the commands of one edit, or of one transaction
+    __slots__ = ("commands", "bytes", "merge")
+
+    def __init__(self, merge=None):
+        self.commands = []
+        self.bytes = 0
+        self.merge = merge  # steps recorded with the same key (a drag) collapse into one
+
+
+class EditHistory:
+    # Commands hold just what is needed to go both ways, never a copy of the scene:
+    #   ("rects", ids, old, new)          move and resize, (n, 4) arrays
+    #   ("translate", ids, dx, dy)        a bulk move keeps only the offset
+    #   ("colors", ids, old, new)         new is one packed color shared by every object of a bulk recolor
+    #   ("sprites", ids, old, new)
+    #   ("add", ids), ("delete", ids, bodies)
+    #                                     ids are never reused, removed objects keep their columns in the store
+    #                                     and are only revived, bodies is [(id, velocity, mass, restitution)]
+    #   ("body", id, old, new)            Bodies.get() tuples, None for no body
+    #   ("camera_add", camera, index), ("camera_delete", camera, index)
+    #                                     the Camera itself, so undo brings back its view too
+    #   ("camera_view", camera, old, new)
+    # Undoing or redoing a step costs as much as the edit it records, whatever the size of the scene.
+    def __init__(self, budget=UNDO_BUDGET):
+        self.budget = budget
+        self.game_area = None
+        self.undo_steps = deque()
+        self.redo_steps = []
+        self.bytes = 0
+        self.depth = 0  # open transactions, their commands go into one step
+        self.open = None
+        self.applying = False
+
+    def attach(self, game_area):
+        self.game_area = game_area
+        game_area.history = self
+        game_area.edit_listeners.append(self.edited)
+
+    def edited(self, op, id):
+        if op in ("reset", "stream"):
+            self.clear()  # ids of a loaded scene or of evicted cells mean nothing to the recorded steps
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.bytes = 0
+        self.open = None
+
+    def can_undo(self):
+        return bool(self.undo_steps)
+
+    def can_redo(self):
+        return bool(self.redo_steps)
+
+    def begin(self):
+        self.depth += 1
+
+    def end(self):
+        self.depth -= 1
+        if not self.depth and self.open is not None:
+            step, self.open = self.open, None
+            self.push(step)
+
+    def record(self, command, merge=None):
+        # A streamed world is not recorded, the cells it evicts take their objects' ids with them
+        if self.applying or self.game_area.world is not None:
+            return
+        if isinstance(command[1], np.ndarray) and not len(command[1]):
+            return  # a bulk edit that matched nothing
+        size = command_bytes(command)
+        if self.depth:
+            if self.open is None:
+                self.open = Step()
+            self.open.commands.append(command)
+            self.open.bytes += size
+            return
+        last = self.undo_steps[-1] if self.undo_steps else None
+        if merge is not None and last is not None and last.merge == merge and not self.redo_steps:
+            kind, ids, old, _ = last.commands[-1]
+            last.commands[-1] = (kind, ids, old, command[3])  # keeps where the drag started, takes where it is now
+            return
+        step = Step(merge)
+        step.commands.append(command)
+        step.bytes = size
+        self.push(step)
+
+    def push(self, step):
+        for dropped in self.redo_steps:
+            self.bytes -= dropped.bytes
+        self.redo_steps.clear()
+        self.undo_steps.append(step)
+        self.bytes += step.bytes
+        while self.bytes > self.budget and len(self.undo_steps) > 1:
+            self.bytes -= self.undo_steps.popleft().bytes
+
+    def undo(self):
+        if not self.undo_steps or self.depth:
+            return False
+        step = self.undo_steps.pop()
+        self.replay(reversed(step.commands), True)
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self):
+        if not self.redo_steps or self.depth:
+            return False
+        step = self.redo_steps.pop()
+        self.replay(step.commands, False)
+        self.undo_steps.append(step)
+        return True
+
+    def replay(self, commands, undo):
+        area = self.game_area
+        self.applying = True
+        try:
+            with area.transaction():  # one repaint for the whole step
+                for command in commands:
+                    self.apply(area, command, undo)
+        finally:
+            self.applying = False
+
+    def apply(self, area, command, undo):
+        kind = command[0]
+        if kind == "rects":
+            _, ids, old, new = command
+            area.set_rects(ids, old if undo else new)
+        elif kind == "translate":
+            _, ids, dx, dy = command
+            area.translate_objects(-dx if undo else dx, -dy if undo else dy, ids)
+        elif kind == "colors":
+            _, ids, old, new = command
+            area.set_packed_colors(ids, old if undo else new)
+        elif kind == "sprites":
+            _, ids, old, new = command
+            for id, sprite in zip(ids.tolist(), np.broadcast_to(old if undo else new, ids.shape).tolist()):
+                area.set_object_sprite(area.objects.handle(id), sprite)
+        elif kind == "add":
+            if undo:
+                area.remove_objects(command[1])
+            else:
+                area.revive_objects(command[1])
+        elif kind == "delete":
+            _, ids, bodies = command
+            if undo:
+                area.revive_objects(ids, bodies)
+            else:
+                area.remove_objects(ids)
+        elif kind == "body":
+            _, id, old, new = command
+            body = old if undo else new
+            if body is None:
+                area.remove_object_body(area.objects.handle(id))
+            else:
+                area.set_object_body(area.objects.handle(id), *body)
+        elif kind == "camera_add" or kind == "camera_delete":
+            _, camera, index = command
+            if (kind == "camera_add") == undo:
+                area.remove_camera(camera)
+            else:
+                area.add_camera(camera, index)
+        elif kind == "camera_view":
+            _, camera, old, new = command
+            area.set_camera_view(camera, *(old if undo else new))
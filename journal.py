@@ -0,0 +1,236 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+import pik_format
+import sprites
+from camera import DEFAULT_VIEW
+from scene_store import unpack_color
+
+JOURNAL_MAGIC = b"PIKJ"
+JOURNAL_HEADER = struct.Struct("<4sI")  # magic, snapshot generation the journal continues from
+RECORD = struct.Struct("<BxxxIiiiiI")  # op, id, x, y, w, h, packed color
+BODY_RECORD = struct.Struct("<BxxxIffffI")  # op, id, vx, vy, mass, restitution, flags, the same size as RECORD
+VIEW_RECORD = struct.Struct("<BxxxIiidf")  # op, camera index, screen x, screen y, zoom, update rate, the same size too
+
+ADD, DELETE, MOVE, RESIZE, COLOR, CAMERA_ADD, CAMERA_DELETE, SPRITE, BODY, CAMERA_VIEW, REVIVE = range(1, 12)
+OPS = {"add": ADD, "delete": DELETE, "move": MOVE, "resize": RESIZE, "color": COLOR, "camera_add": CAMERA_ADD, "camera_delete": CAMERA_DELETE, "sprite": SPRITE,
+       "revive": REVIVE}
+HAS_BODY = 1  # BODY flags, without it the object's body was removed
+
+IDS = b"OIDS"  # original object ids of a snapshot, journal records refer to these
+GENERATION = b"JGEN"
+
+FLUSH_INTERVAL = 0.5
+COMPACT_RECORDS = 20000
+
+
+class EditJournal:
+    def __init__(self, directory, flush_interval=FLUSH_INTERVAL, compact_records=COMPACT_RECORDS):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "autosave.pik")
+        self.journal_path = os.path.join(directory, "autosave.journal")
+        self.flush_interval = flush_interval
+        self.compact_records = compact_records
+        self.game_area = None
+        self.generation = 0
+        self.pending = []
+        self.pending_moves = {}
+        self.since_snapshot = 0
+        self.snapshot = None
+        self.atlas_revision = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.journal_file = None
+
+    def attach(self, game_area):
+        self.game_area = game_area
+        game_area.edit_listeners.append(self.edited)
+        os.makedirs(self.directory, exist_ok=True)
+        self.compact()  # start from a snapshot of whatever is loaded, ids now match the journal
+        self.thread = threading.Thread(target=self.writer, name="pike-journal", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.thread is None:
+            return
+        if self.edited in self.game_area.edit_listeners:
+            self.game_area.edit_listeners.remove(self.edited)
+        self.stopping = True
+        self.wake.set()
+        self.thread.join()
+        self.thread = None
+
+    def edited(self, op, id):
+        if self.game_area.world is not None:
+            return  # a streamed world keeps its own unsaved cells, see world_partition
+        if op in ("reset", "atlas"):
+            self.compact()  # a new atlas goes into the snapshot, the journal only refers to sprites by index
+            return
+        store = self.game_area.objects
+        if op == "camera_view":
+            camera = self.game_area.cameras[id]
+            records = [VIEW_RECORD.pack(CAMERA_VIEW, id, *camera.screen_position, camera.zoom, camera.rate)]
+        elif op == "body":
+            bodies = self.game_area.bodies
+            flags = HAS_BODY if id in bodies else 0
+            (vx, vy), mass, restitution = bodies.get(id) if flags else ((0.0, 0.0), 0.0, 0.0)
+            records = [BODY_RECORD.pack(BODY, id, vx, vy, mass, restitution, flags)]  # float32, plenty for a body
+        else:
+            if op.startswith("camera"):
+                x, y, w, h = self.game_area.cameras[id] if op == "camera_add" else (0, 0, 0, 0)
+                color = 0
+            else:
+                x, y, w, h = store.bounds(id)
+                color = int(store.sprite[id]) & 0xFFFFFFFF if op == "sprite" else int(store.color[id])
+            records = [RECORD.pack(OPS[op], id, x, y, w, h, color)]
+            if op in ("add", "revive") and store.sprite[id] >= 0:
+                records.append(RECORD.pack(SPRITE, id, x, y, w, h, int(store.sprite[id])))
+            elif op == "camera_add":
+                camera = self.game_area.cameras[id]
+                if camera.settings() != DEFAULT_VIEW:  # a camera brought back by undo keeps its view
+                    records.append(VIEW_RECORD.pack(CAMERA_VIEW, id, *camera.screen_position, camera.zoom, camera.rate))
+        with self.lock:
+            if op == "move" and id in self.pending_moves:
+                self.pending[self.pending_moves[id]] = records[0]  # only the last position of a drag matters
+            else:
+                if op == "move":
+                    self.pending_moves[id] = len(self.pending)
+                elif op in ("add", "delete", "revive"):
+                    self.pending_moves.pop(id, None)  # a later move must not land before this record
+                self.pending.extend(records)
+                self.since_snapshot += len(records)
+        if self.since_snapshot >= self.compact_records:
+            self.compact()
+
+    def compact(self):
+        # Capturing is a handful of vectorized column copies, the write happens on the writer thread
+        store = self.game_area.objects
+        ids = store.ids()
+        extra = [(IDS, len(ids), ids.astype("<u4").tobytes())] + pik_format.scene_chunks(store, self.game_area.bodies, self.game_area.cameras)
+        atlas = self.game_area.atlas
+        atlas_state = None
+        if atlas.revision != self.atlas_revision:
+            # Pages are never written in place, handing them to the writer thread needs no copy
+            self.atlas_revision = atlas.revision
+            atlas_state = (atlas.page_size,) + tuple(atlas.state())
+        with self.lock:
+            self.generation += 1
+            extra.append((GENERATION, 1, struct.pack("<I", self.generation)))
+            self.snapshot = (pik_format.object_records(store), pik_format.camera_records(self.game_area.cameras), extra, atlas_state, self.generation)
+            self.pending.clear()
+            self.pending_moves.clear()
+            self.since_snapshot = 0
+        if self.thread is None:
+            self.write_snapshot(self.snapshot)
+            self.snapshot = None
+        else:
+            self.wake.set()
+
+    def write_snapshot(self, snapshot):
+        objects, cameras, extra, atlas_state, generation = snapshot
+        if atlas_state is not None:
+            sprites.write_atlas(sprites.atlas_path(self.snapshot_path), *atlas_state)  # before the .pik that refers to it
+        pik_format.write_pik(self.snapshot_path, objects, cameras, extra)
+        if self.journal_file is not None:
+            self.journal_file.close()
+        self.journal_file = open(self.journal_path, "wb")
+        self.journal_file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, generation))
+        self.journal_file.flush()
+
+    def writer(self):
+        while True:
+            if not self.stopping:
+                self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            with self.lock:
+                snapshot, self.snapshot = self.snapshot, None
+                batch, self.pending = self.pending, []
+                self.pending_moves.clear()
+            if snapshot is not None:
+                self.write_snapshot(snapshot)
+            if batch:
+                self.journal_file.write(b"".join(batch))
+                self.journal_file.flush()
+                os.fsync(self.journal_file.fileno())
+            if self.stopping and self.snapshot is None and not self.pending:  # anything queued while writing goes out first
+                self.journal_file.close()
+                self.journal_file = None
+                return
+
+    def discard(self):
+        # After a clean exit: the scene was saved or the user chose not to, there is nothing to recover
+        for path in (self.snapshot_path, self.journal_path, sprites.atlas_path(self.snapshot_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def has_recovery(self):
+        return os.path.exists(self.snapshot_path)
+
+    def recover(self, game_area):
+        if os.path.exists(sprites.atlas_path(self.snapshot_path)):
+            game_area.atlas.load(sprites.atlas_path(self.snapshot_path))
+        else:
+            game_area.atlas.clear()
+        with pik_format.PikFile(self.snapshot_path) as pik:
+            objects = pik.array(pik_format.OBJECTS)
+            game_area.load_records(objects, pik.array(pik_format.CAMERAS), pik.array(pik_format.OBJECT_SPRITES), pik.array(pik_format.BODIES),
+                                   pik.array(pik_format.CAMERA_VIEWS))
+            original_ids = np.frombuffer(pik.raw(IDS), "<u4").tolist() if IDS in pik.chunks else list(range(len(objects)))
+            generation = struct.unpack("<I", pik.raw(GENERATION))[0] if GENERATION in pik.chunks else 0
+            del objects
+        self.generation = generation
+        handles = dict(zip(original_ids, game_area.objects))
+        replayed = 0
+        try:
+            with open(self.journal_path, "rb") as journal_file:
+                data = journal_file.read()
+        except FileNotFoundError:
+            return replayed
+        if len(data) < JOURNAL_HEADER.size:
+            return replayed
+        magic, journal_generation = JOURNAL_HEADER.unpack_from(data)
+        if magic != JOURNAL_MAGIC or journal_generation != generation:
+            return replayed  # written before the snapshot was taken, already part of it
+        end = JOURNAL_HEADER.size + (len(data) - JOURNAL_HEADER.size) // RECORD.size * RECORD.size  # drop a torn tail
+        with game_area.transaction():  # one repaint for the whole replay
+            for offset in range(JOURNAL_HEADER.size, end, RECORD.size):
+                op, id, x, y, w, h, color = RECORD.unpack_from(data, offset)
+                obj = handles.get(id)
+                if op == ADD or (op == REVIVE and obj is None):
+                    handles[id] = game_area.add_object(unpack_color(color), (x, y, w, h))  # revived after a snapshot that left it out
+                elif op == REVIVE:
+                    game_area.revive_objects([obj.id])  # keeps the handle later records of this id refer to
+                elif op == CAMERA_ADD:
+                    game_area.add_camera((x, y, w, h), id)
+                elif op == CAMERA_DELETE:
+                    if id < len(game_area.cameras):
+                        game_area.remove_camera(game_area.cameras[id])
+                elif op == CAMERA_VIEW:
+                    if id < len(game_area.cameras):
+                        _, _, x, y, zoom, rate = VIEW_RECORD.unpack_from(data, offset)
+                        game_area.set_camera_view(game_area.cameras[id], (x, y), zoom, rate)
+                elif obj is None:
+                    continue
+                elif op == DELETE:
+                    game_area.remove_object(obj)
+                elif op == MOVE:
+                    game_area.move_object(obj, x, y)
+                elif op == RESIZE:
+                    game_area.resize_object(obj, w, h)
+                elif op == COLOR:
+                    game_area.set_object_color(obj, unpack_color(color))
+                elif op == SPRITE:
+                    game_area.set_object_sprite(obj, color - (1 << 32) if color >= 1 << 31 else color)
+                elif op == BODY:
+                    _, _, vx, vy, mass, restitution, flags = BODY_RECORD.unpack_from(data, offset)
+                    if flags & HAS_BODY:
+                        game_area.set_object_body(obj, (vx, vy), mass, restitution)
+                    else:
+                        game_area.remove_object_body(obj)
+                replayed += 1
+        return replayed
@@ -1,177 +1,704 @@
 import sys
-import pygame
+import os
+from profiler import profiler, startup, load_trace_events  # first, so the startup report times the imports below
 import json  # Import the json module
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QDialog, QDockWidget, QScrollArea, QMenu, QAction, QLabel, QFileDialog  # Include QFileDialog
-from PyQt5.QtGui import QPainter, QColor, QIcon
-from PyQt5.QtCore import Qt, QRect
-from pygame.locals import QUIT
+import numpy as np
+from contextlib import contextmanager
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QDialog, QDockWidget, QMenu, QAction, QFileDialog, QListView, QAbstractItemView, QInputDialog, QMessageBox  # Include QFileDialog
+from PyQt5.QtGui import QPainter, QColor, QIcon, QPixmap, QImage, QKeySequence
+from PyQt5.QtCore import Qt, QRect, QTimer, QAbstractListModel, QModelIndex, QItemSelectionModel, pyqtSignal
+from spatial_index import SpatialHash
+from scene_store import SceneStore, pack_color, unpack_color
+from pik_format import normalize_entry
+import pik_format
+from journal import EditJournal
+from history import EditHistory, id_array
+from sprites import SpriteAtlas, SurfaceCache, atlas_path
+import world_partition
+from world_partition import WorldPartition, create_world
+from physics import RESTITUTION, Bodies
 
-pygame.init()
+# pygame and play_mode (which pulls in pygame) are imported where they are first needed, the editor starts without them
 
 WHITE = (255, 255, 255)
 RED = (255, 0, 0)
+TILE_SIZE = 256
+FULL_REFRESH_BOUNDS = 1000  # a transaction touching more rects than this repaints everything
+STREAM_POLL_MS = 50  # how often cells prefetched in the background are brought into a streamed world
+AUTOSAVE_DIR = os.environ.get("PIKE_AUTOSAVE_DIR", os.path.join(os.path.expanduser("~"), ".pike", "autosave"))
+IMAGE_FILTER = "Images (*.png *.jpg *.jpeg *.bmp *.gif);;All Files (*)"
 
-class GameObject:
-    def __init__(self, color, rect):
-        self.color = color
-        self.rect = rect
+
+def load_rgba(path):
+    # Decodes an image file into an (h, w, 4) RGBA array with Qt, the editor does not need pygame for it
+    image = QImage(path)
+    if image.isNull():
+        raise ValueError(f"{path} is not an image Qt can read")
+    image = image.convertToFormat(QImage.Format_RGBA8888)
+    bits = image.constBits()
+    bits.setsize(image.height() * image.bytesPerLine())
+    rows = np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine())
+    return rows[:, :image.width() * 4].reshape(image.height(), image.width(), 4).copy()
 
 class GameArea(QWidget):
+    object_clicked = pyqtSignal(object)  # object id, or None for empty space
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.objects = []
+        self.objects = SceneStore()
         self.cameras = []
+        self.index = SpatialHash()
+        self.listeners = []
+        self.edit_listeners = []
+        self.revision = 0
         self.clicked_object = None
         self.offset = None
-        self.selected_label = None
-        self.layout = QVBoxLayout(self)
+        self.qcolors = {}
+        self.tiles = {}  # (column, row) -> QPixmap of everything except the dragged object
+        self.dragged_id = None
+        self.pending_drag = None
+        self.drag_timer = QTimer(self)
+        self.drag_timer.setSingleShot(True)
+        self.drag_timer.timeout.connect(self.apply_drag)
+        self.transaction_depth = 0
+        self.pending_changed = False
+        self.pending_bounds = []
+        self.pending_tiles = False
+        self.atlas = SpriteAtlas()
+        self.atlas_pixmaps = []  # one QPixmap per atlas page, made on first use
+        self.atlas_revision = None
+        self.sprite_pixmaps = SurfaceCache(self.scaled_sprite)  # (sprite, w, h) -> QPixmap
+        self.origin = (0, 0)  # world position of the top-left corner, middle-drag pans
+        self.pan_start = None
+        self.world = None  # WorldPartition while a streamed world is open
+        self.bodies = Bodies()  # physics bodies of objects, simulated in play mode only
+        self.history = None  # EditHistory once attached
+        self.drags = 0  # numbers each drag, its moves merge into one undo step
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(STREAM_POLL_MS)
+        self.stream_timer.timeout.connect(lambda: self.stream([self.view_rect()], wait_for_needed=False))
 
     def paintEvent(self, event):
-        painter = QPainter(self)
-        
-        for obj in self.objects:
-            rect = QRect(obj.rect.x, obj.rect.y, obj.rect.width, obj.rect.height)
-            painter.fillRect(rect, QColor(*obj.color))
+        with profiler.span("paint"):
+            painter = QPainter(self)
+            painter.translate(-self.origin[0], -self.origin[1])
+            dirty = event.rect().translated(self.origin[0], self.origin[1])  # everything below is in world coordinates
+
+            first_column, first_row = dirty.left() // TILE_SIZE, dirty.top() // TILE_SIZE
+            last_column, last_row = dirty.right() // TILE_SIZE, dirty.bottom() // TILE_SIZE
+            for column in range(first_column, last_column + 1):
+                for row in range(first_row, last_row + 1):
+                    tile = self.tiles.get((column, row))
+                    if tile is None:
+                        tile = self.tiles[(column, row)] = self.render_tile(column, row)
+                    painter.drawPixmap(column * TILE_SIZE, row * TILE_SIZE, tile)
+
+            if self.dragged_id is not None:
+                x, y, w, h = self.objects.bounds(self.dragged_id)
+                self.draw_object(painter, x, y, w, h, int(self.objects.color[self.dragged_id]), int(self.objects.sprite[self.dragged_id]))
 
-        for camera in self.cameras:
             painter.setPen(QColor(0, 0, 255))
-            camera_rect = QRect(camera.x, camera.y, camera.width, camera.height)
-            painter.drawRect(camera_rect)
+            for camera in self.cameras:
+                camera_rect = QRect(camera.x, camera.y, camera.width, camera.height)
+                if camera_rect.adjusted(0, 0, 1, 1).intersects(dirty):
+                    painter.drawRect(camera_rect)
 
+            painter.end()
+        profiler.end_frame("editor_frame")
+
+    def render_tile(self, column, row):
+        tile = QPixmap(TILE_SIZE, TILE_SIZE)
+        tile.fill(Qt.transparent)
+        painter = QPainter(tile)
+        left, top = column * TILE_SIZE, row * TILE_SIZE
+        painter.translate(-left, -top)
+        ids = self.index.query_rect((left, top, TILE_SIZE, TILE_SIZE))
+        if self.dragged_id is not None and self.dragged_id in ids:
+            ids.remove(self.dragged_id)
+        store = self.objects
+        for (x, y, w, h), color, sprite in zip(store.bounds_many(ids), store.color[ids].tolist(), store.sprite[ids].tolist()):
+            self.draw_object(painter, x, y, w, h, color, sprite)
         painter.end()
+        return tile
 
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            x, y = event.pos().x(), event.pos().y()
-            for obj in self.objects:
-                if obj.rect.collidepoint(x, y):
-                    self.clicked_object = obj
-                    self.offset = (x - obj.rect.x, y - obj.rect.y)
-                    break
-            else:
-                self.clicked_object = None
+    def draw_object(self, painter, x, y, w, h, color, sprite):
+        if sprite >= 0 and w > 0 and h > 0:
+            painter.drawPixmap(x, y, self.sprite_pixmap(sprite, w, h))
+        else:
+            painter.fillRect(x, y, w, h, self.qcolor(color))
 
-    def mouseMoveEvent(self, event):
-        if self.clicked_object:
-            x, y = event.pos().x(), event.pos().y()
-            self.clicked_object.rect.x = x - self.offset[0]
-            self.clicked_object.rect.y = y - self.offset[1]
+    def sprite_pixmap(self, sprite, w, h):
+        if self.atlas_revision != self.atlas.revision:
+            self.atlas_revision = self.atlas.revision
+            self.atlas_pixmaps = [None] * len(self.atlas.pages)
+            self.sprite_pixmaps.clear()
+        return self.sprite_pixmaps.get((sprite, w, h))
+
+    def scaled_sprite(self, key):
+        sprite, w, h = key
+        page, x, y, sprite_w, sprite_h = self.atlas.placements[sprite].tolist()
+        pixmap = self.atlas_pixmaps[page]
+        if pixmap is None:
+            data = self.atlas.pages[page]
+            pixels = data.tobytes()  # QImage only borrows the buffer
+            image = QImage(pixels, data.shape[1], data.shape[0], data.shape[1] * 4, QImage.Format_RGBA8888)
+            pixmap = self.atlas_pixmaps[page] = QPixmap.fromImage(image)
+        scaled = pixmap.copy(x, y, sprite_w, sprite_h)
+        if (sprite_w, sprite_h) != (w, h):
+            scaled = scaled.scaled(w, h, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        return scaled, w * h * 4
+
+    def qcolor(self, color):
+        qcolor = self.qcolors.get(color)
+        if qcolor is None:
+            qcolor = self.qcolors[color] = QColor(color)
+        return qcolor
+
+    def invalidate(self, bounds=None, tiles=True):
+        if bounds is None:
+            self.tiles.clear()
             self.update()
+            return
+        region = QRect()
+        for x, y, w, h in bounds:
+            rect = QRect(x, y, max(w, 1), max(h, 1))
+            region = region.united(rect)
+            if tiles:
+                for column in range(rect.left() // TILE_SIZE, rect.right() // TILE_SIZE + 1):
+                    for row in range(rect.top() // TILE_SIZE, rect.bottom() // TILE_SIZE + 1):
+                        self.tiles.pop((column, row), None)
+        self.update(region.translated(-self.origin[0], -self.origin[1]))
 
-    def add_camera(self):
-        screen_center = self.rect().center()
-        camera = pygame.Rect(screen_center.x(), screen_center.y(), 200, 150)
-        self.cameras.append(camera)
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.tiles.clear()
+        if self.world is not None:
+            self.stream([self.view_rect()])
+
+    def view_rect(self):
+        return (self.origin[0], self.origin[1], self.width(), self.height())
+
+    def pan_to(self, x, y):
+        self.origin = (x, y)
+        left, top = x // TILE_SIZE - 1, y // TILE_SIZE - 1
+        right, bottom = (x + self.width()) // TILE_SIZE + 1, (y + self.height()) // TILE_SIZE + 1
+        for column, row in [key for key in self.tiles if not (left <= key[0] <= right and top <= key[1] <= bottom)]:
+            del self.tiles[(column, row)]  # only tiles around the view are kept
+        if self.world is not None:
+            self.stream([self.view_rect()])
         self.update()
 
+    def stream(self, rects, wait_for_needed=True):
+        self.world.update(rects, wait_for_needed)
+        if self.clicked_object is not None and self.clicked_object.id not in self.world.home:
+            self.clicked_object = None  # its cell was evicted, the slot may be reused
+            self.dragged_id = None
+
+    def open_world(self, path):
+        self.close_world()
+        self.load_records(np.empty(0, pik_format.OBJECT_DTYPE), np.empty(0, pik_format.CAMERA_DTYPE))
+        self.world = WorldPartition(path, self, on_stream=lambda changes: self.notify_edited("stream", changes))
+        if len(self.world.cameras):
+            from camera import make_cameras
+            self.cameras.extend(make_cameras(self.world.cameras, self.world.camera_views))
+            self.notify_changed()
+        self.edit_listeners.insert(0, self.world.edited)  # cells know about an edit before anyone else does
+        self.stream([self.view_rect()])
+        self.stream_timer.start()
+        return self.world
+
+    def close_world(self):
+        if self.world is None:
+            return
+        self.stream_timer.stop()
+        self.edit_listeners.remove(self.world.edited)
+        self.world.close()  # unsaved cells stay on disk and are picked up when the world is opened again
+        self.world = None
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MiddleButton:
+            self.pan_start = (event.pos().x(), event.pos().y(), self.origin)
+        elif event.button() == Qt.LeftButton:
+            x, y = event.pos().x() + self.origin[0], event.pos().y() + self.origin[1]
+            with profiler.span("hit_test"):
+                id = self.index.topmost_at(x, y)
+            self.clicked_object = None if id is None else self.objects.handle(id)
+            if id is not None:
+                obj_x, obj_y, _, _ = self.objects.bounds(id)
+                self.offset = (x - obj_x, y - obj_y)
+                self.dragged_id = id
+                self.drags += 1
+                self.invalidate([self.objects.bounds(id)])  # take it out of the cached tiles while it moves
+            self.object_clicked.emit(id)
+
+    def mouseMoveEvent(self, event):
+        if self.pan_start is not None:
+            start_x, start_y, (origin_x, origin_y) = self.pan_start
+            self.pan_to(origin_x + start_x - event.pos().x(), origin_y + start_y - event.pos().y())
+        elif self.clicked_object:
+            # Coalesce moves that arrive faster than the display refreshes
+            self.pending_drag = (event.pos().x() + self.origin[0], event.pos().y() + self.origin[1])
+            if not self.drag_timer.isActive():
+                self.drag_timer.start(self.frame_interval())
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MiddleButton:
+            self.pan_start = None
+        elif event.button() == Qt.LeftButton and self.dragged_id is not None:
+            self.drag_timer.stop()
+            self.apply_drag()
+            bounds = self.objects.bounds(self.dragged_id)
+            self.dragged_id = None
+            self.invalidate([bounds])  # bake it back into the tiles
+
+    def apply_drag(self):
+        if self.pending_drag is None or self.clicked_object is None:
+            return
+        x, y = self.pending_drag
+        self.pending_drag = None
+        self.move_object(self.clicked_object, x - self.offset[0], y - self.offset[1])
+
+    def frame_interval(self):
+        screen = self.screen() if self.isVisible() else QApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return int(1000 / rate) if rate > 0 else 16
+
+    @contextmanager
+    def transaction(self):
+        # with game_area.transaction(): every change inside reaches the canvas and listeners as one notification.
+        # Edit events still go out one per operation, the journal and play mode need each of them.
+        self.transaction_depth += 1
+        if self.history is not None:
+            self.history.begin()
+        try:
+            yield self
+        finally:
+            self.transaction_depth -= 1
+            if self.history is not None:
+                self.history.end()
+            if not self.transaction_depth and self.pending_changed:
+                bounds, tiles = self.pending_bounds, self.pending_tiles
+                self.pending_changed = False
+                self.pending_bounds = []
+                self.pending_tiles = False
+                if bounds is not None and len(bounds) > FULL_REFRESH_BOUNDS:
+                    bounds = None
+                self.notify_changed(bounds, tiles)
+
+    def notify_changed(self, bounds=None, tiles=True):
+        # bounds is a list of world rects that changed, None means the whole scene
+        if self.transaction_depth:
+            self.pending_changed = True
+            self.pending_tiles = self.pending_tiles or tiles
+            if bounds is None or self.pending_bounds is None:
+                self.pending_bounds = None
+            else:
+                self.pending_bounds.extend(bounds)
+            return
+        self.revision += 1
+        self.invalidate(bounds, tiles)
+        for listener in self.listeners:
+            listener(bounds)
+
+    def record(self, command, merge=None):
+        # Undo history, see history.EditHistory for the commands
+        if self.history is not None:
+            self.history.record(command, merge)
+
+    def notify_edited(self, op, id):
+        # op is one of add, revive (an undone delete), delete, move, resize, color, sprite, body, camera_add, camera_delete, camera_view, atlas or reset,
+        # or stream when a world loaded or evicted cells (not an edit, ids of evicted objects are gone, id is the
+        # list of ("add" or "delete", ids) in the order the world made them)
+        for listener in self.edit_listeners:
+            listener(op, id)
+
+    def add_camera(self, rect=None, index=None):
+        # index puts a camera brought back by undo where it was, later cameras are drawn on top
+        if rect is None:
+            screen_center = self.rect().center()
+            rect = (screen_center.x() + self.origin[0], screen_center.y() + self.origin[1], 200, 150)
+        from camera import Camera
+        camera = rect if isinstance(rect, Camera) else Camera(rect)  # undo brings back the same camera, view and all
+        index = len(self.cameras) if index is None else min(index, len(self.cameras))
+        self.cameras.insert(index, camera)
+        self.record(("camera_add", camera, index))
+        self.notify_changed()
+        self.notify_edited("camera_add", index)
+        return camera
+
+    def remove_camera(self, camera):
+        for index, existing in enumerate(self.cameras):
+            if existing is camera:
+                del self.cameras[index]
+                self.record(("camera_delete", camera, index))
+                self.notify_changed()
+                self.notify_edited("camera_delete", index)
+                return True
+        return False
+
+    def set_camera_view(self, camera, screen_position, zoom, rate):
+        # Where the camera shows up on the game screen, its zoom and update rate. Not drawn in the editor.
+        old = (camera.screen_position, camera.zoom, camera.rate)
+        camera.set_view(screen_position, zoom, rate)
+        self.record(("camera_view", camera, old, (camera.screen_position, camera.zoom, camera.rate)))
+        index = next(index for index, existing in enumerate(self.cameras) if existing is camera)  # Rects compare equal by value
+        self.notify_edited("camera_view", index)
+
     def add_static_object(self):
-        if not pygame.get_init():
-            pygame.init()
-            
+        import pygame
+        if not pygame.display.get_init():
+            pygame.display.init()  # the mouse position is all it needs
+
         x, y = pygame.mouse.get_pos()
-        rect = pygame.Rect(x, y, 50, 50)
-        self.objects.append(GameObject(RED, rect))
-        self.update()
+        obj = self.add_object(RED, (x + self.origin[0], y + self.origin[1], 50, 50))
+        return obj
 
-    def set_selected_label(self, index):
-        self.clear_selected_labels()
-        self.selected_label = index
-        if self.selected_label is not None:
-            if 0 <= self.selected_label < self.layout.count():
-                layout_item = self.layout.itemAt(self.selected_label)
-                if layout_item:
-                    widget = layout_item.widget()
-                    if widget:
-                        widget.set_selected(True)
-                    else:
-                        print("Widget not found for layout item.")
-                else:
-                    print("Layout item not found.")
+    def add_sprite(self, path):
+        # The image is packed into the atlas once, objects share it by index
+        count = len(self.atlas)
+        sprite = self.atlas.add(path, load_rgba)
+        if len(self.atlas) != count:
+            self.notify_edited("atlas", sprite)
+        return sprite
+
+    def add_sprite_object(self, path, position=(0, 0)):
+        sprite = self.add_sprite(path)
+        w, h = self.atlas.size(sprite)
+        return self.add_object(WHITE, (position[0], position[1], w, h), sprite)
+
+    def set_object_sprite(self, obj, sprite):
+        self.record(("sprites", id_array(obj.id), self.objects.sprite[[obj.id]], np.int32(sprite)))
+        self.objects.set_sprite(obj.id, sprite)
+        self.notify_changed([obj.bounds])
+        self.notify_edited("sprite", obj.id)
+
+    def set_object_body(self, obj, velocity=(0.0, 0.0), mass=1.0, restitution=RESTITUTION):
+        # mass 0 makes the object a static collider, others fall and collide in play mode
+        old = self.bodies.get(obj.id) if obj.id in self.bodies else None
+        self.bodies.set(obj.id, velocity, mass, restitution)
+        self.record(("body", obj.id, old, self.bodies.get(obj.id)))
+        self.notify_edited("body", obj.id)
+
+    def remove_object_body(self, obj):
+        old = self.bodies.get(obj.id) if obj.id in self.bodies else None
+        if self.bodies.remove(obj.id):
+            self.record(("body", obj.id, old, None))
+            self.notify_edited("body", obj.id)
+
+    def add_object(self, color, rect, sprite=-1):
+        obj = self.objects.add(color, rect, sprite)
+        self.index.insert(obj.id, obj.bounds, order=obj.id)
+        self.record(("add", id_array(obj.id)))
+        self.notify_changed([obj.bounds])
+        self.notify_edited("add", obj.id)
+        return obj
+
+    def remove_object(self, obj):
+        if self.objects.is_alive(obj.id):
+            self.record(("delete", id_array(obj.id), self.removed_bodies([obj.id])))
+        if self.objects.remove(obj.id):
+            self.index.remove(obj.id)
+            self.bodies.remove(obj.id)
+            self.notify_changed([obj.bounds])
+            self.notify_edited("delete", obj.id)
+        if self.clicked_object == obj:
+            self.clicked_object = None
+            self.dragged_id = None
+
+    def add_objects(self, colors, rects):
+        if not len(rects):
+            return np.empty(0, np.intp)
+        rects = np.asarray(rects, np.int32).reshape(-1, 4)
+        colors = np.asarray(colors, np.uint32)
+        ids = self.objects.add_many(rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3], colors.reshape(-1, 3) if colors.ndim > 1 else colors)
+        self.index.insert_many(ids, rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3])
+        self.record(("add", id_array(ids)))
+        self.notify_changed()
+        for id in ids.tolist():
+            self.notify_edited("add", id)
+        return ids
+
+    def revive_objects(self, ids, bodies=()):
+        # Undo of a removal: the objects come back with their ids, so also in their old draw order
+        ids = self.objects.revive(ids)
+        store = self.objects
+        self.index.insert_many(ids, store.x[ids], store.y[ids], store.w[ids], store.h[ids])
+        for id, velocity, mass, restitution in bodies:
+            self.bodies.set(id, velocity, mass, restitution)
+        self.record(("add", id_array(ids)))
+        self.notify_changed(list(store.bounds_many(ids)))
+        for id in ids.tolist():
+            self.notify_edited("revive", id)
+        for id, _, _, _ in bodies:
+            self.notify_edited("body", id)
+        return ids
+
+    def removed_bodies(self, ids):
+        # Bodies of objects about to be removed, kept by the undo history
+        bodies = self.bodies
+        if self.history is None or not len(bodies):
+            return []
+        return [(id,) + bodies.get(id) for id in bodies.id[:bodies.count][np.isin(bodies.id[:bodies.count], ids)].tolist()]
+
+    def load_records(self, objects, cameras, sprites=None, bodies=None, views=None):
+        # objects/cameras are .pik record arrays, see pik_format. Load the atlas first, sprites index into it.
+        self.objects.clear()
+        self.cameras.clear()
+        self.index.clear()
+        self.bodies.clear()
+        self.clicked_object = None
+        self.dragged_id = None
+        ids = self.objects.add_many(objects["x"], objects["y"], objects["w"], objects["h"], objects["color"], -1 if sprites is None or not len(sprites) else sprites)
+        self.index.insert_deferred(ids, objects["x"], objects["y"], objects["w"], objects["h"])  # indexed as the view reaches it
+        if bodies is not None and len(bodies):
+            self.bodies.set_many(ids[bodies["object"]], bodies)
+        if len(cameras):
+            from camera import make_cameras
+            self.cameras.extend(make_cameras(cameras, views))
+        self.notify_changed()
+        self.notify_edited("reset", None)
+
+    def translate_objects(self, dx, dy, ids=None):
+        ids = self.objects.translate_all(dx, dy, None if ids is None else np.asarray(ids, np.intp))
+        self.record(("translate", id_array(ids), dx, dy))
+        for id, bounds in zip(ids.tolist(), self.objects.bounds_many(ids)):
+            self.index.move(id, bounds)
+        self.notify_changed()
+        for id in ids.tolist():
+            self.notify_edited("move", id)
+        return ids
 
-    def clear_selected_labels(self):
-        for index in range(self.layout.count()):
-            layout_item = self.layout.itemAt(index)
-            if layout_item:
-                widget = layout_item.widget()
-                if widget:
-                    widget.set_selected(False)
-        self.selected_label = None
+    def move_object(self, obj, x, y):
+        old_bounds = obj.bounds
+        self.objects.move(obj.id, x, y)
+        self.index.move(obj.id, obj.bounds)
+        self.record_rects([obj.id], [old_bounds], self.drags if obj.id == self.dragged_id else None)
+        self.notify_changed([old_bounds, obj.bounds], tiles=obj.id != self.dragged_id)
+        self.notify_edited("move", obj.id)
+
+    def resize_object(self, obj, width, height):
+        x, y, old_width, old_height = obj.bounds
+        self.objects.set_rect(obj.id, (x, y, width, height))
+        self.index.move(obj.id, obj.bounds)
+        self.record_rects([obj.id], [(x, y, old_width, old_height)])
+        self.notify_changed([(x, y, old_width, old_height), obj.bounds])
+        self.notify_edited("resize", obj.id)
+
+    def record_rects(self, ids, old_rects, merge=None):
+        if self.history is not None:
+            ids = id_array(ids)
+            new_rects = np.array(list(self.objects.bounds_many(ids)), np.int32).reshape(-1, 4)
+            self.history.record(("rects", ids, np.array(old_rects, np.int32).reshape(-1, 4), new_rects), merge)
+
+    def set_rects(self, ids, rects):
+        # Bulk move and resize, rects is (n, 4)
+        store = self.objects
+        ids = np.asarray(ids, np.intp)
+        rects = np.asarray(rects, np.int32).reshape(-1, 4)
+        old_rects = np.stack([store.x[ids], store.y[ids], store.w[ids], store.h[ids]], axis=1)
+        store.x[ids], store.y[ids], store.w[ids], store.h[ids] = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+        self.record_rects(ids, old_rects)
+        bounds = []
+        for id, old, new in zip(ids.tolist(), old_rects.tolist(), rects.tolist()):
+            self.index.move(id, tuple(new))
+            bounds.extend((tuple(old), tuple(new)))
+        self.notify_changed(bounds)
+        for id, old, new in zip(ids.tolist(), old_rects.tolist(), rects.tolist()):
+            if old[:2] != new[:2]:
+                self.notify_edited("move", id)
+            if old[2:] != new[2:]:
+                self.notify_edited("resize", id)
+        return ids
+
+    def set_object_color(self, obj, color):
+        self.record(("colors", id_array(obj.id), self.objects.color[[obj.id]], np.uint32(pack_color(color))))
+        self.objects.set_color(obj.id, color)
+        self.notify_changed([obj.bounds])
+        self.notify_edited("color", obj.id)
+
+    def set_objects_color(self, ids, color):
+        return self.set_packed_colors(ids, np.uint32(pack_color(color)))
+
+    def set_packed_colors(self, ids, colors):
+        # colors is one packed color for all of them or one per id
+        ids = np.asarray(ids, np.intp)
+        alive = self.objects.alive[ids]
+        ids = ids[alive]
+        colors = np.asarray(colors, np.uint32)
+        if colors.ndim:
+            colors = colors[alive]
+        self.record(("colors", id_array(ids), self.objects.color[ids], colors))
+        self.objects.color[ids] = colors
+        self.notify_changed(list(self.objects.bounds_many(ids)))
+        for id in ids.tolist():
+            self.notify_edited("color", id)
+        return ids
+
+    def remove_objects(self, ids):
+        ids = np.asarray(ids, np.intp)
+        ids = np.unique(ids[self.objects.alive[ids]])
+        self.record(("delete", id_array(ids), self.removed_bodies(ids)))
+        ids = self.objects.remove_many(ids)
+        bounds = list(self.objects.bounds_many(ids))
+        for id in ids.tolist():
+            self.index.remove(id)
+            self.bodies.remove(id)
+        if self.clicked_object is not None and not self.clicked_object.alive:
+            self.clicked_object = None
+            self.dragged_id = None
+        self.notify_changed(bounds)
+        for id in ids.tolist():
+            self.notify_edited("delete", id)
+        return ids
 
     def serialize_objects(self):
-        serialized_objects = []
-        for obj in self.objects:
-            serialized_objects.append({
-                "color": obj.color,
-                "rect": (obj.rect.x, obj.rect.y, obj.rect.width, obj.rect.height)
-            })
-        for camera in self.cameras:
-            serialized_objects.append({
-                "color": (0, 0, 255),  # Use a consistent color for cameras
-                "rect": (camera.x, camera.y, camera.width, camera.height)
-            })
-        return serialized_objects
+        with profiler.span("serialize"):
+            serialized_objects = []
+            store = self.objects
+            ids = store.ids()
+            for rect, color in zip(store.bounds_many(ids), store.color[ids].tolist()):
+                serialized_objects.append({
+                    "type": "object",
+                    "color": unpack_color(color),
+                    "rect": rect
+                })
+            for camera in self.cameras:
+                serialized_objects.append({
+                    "type": "camera",
+                    "rect": (camera.x, camera.y, camera.width, camera.height)
+                })
+            return serialized_objects
 
     def deserialize_objects(self, serialized_objects):
-        self.objects.clear()  # Clear existing objects
-        self.cameras.clear()  # Clear existing cameras
-        for obj_data in serialized_objects:
-            color = obj_data["color"]
-            rect_data = obj_data["rect"]
-            rect = pygame.Rect(*rect_data)  # Create a pygame.Rect object
-            if color == (0, 0, 255):
-                self.cameras.append(rect)  # Add camera
-            else:
-                self.objects.append(GameObject(color, rect))  # Add regular object
-        self.update()
-            
+        with profiler.span("deserialize"):
+            colors, rects, cameras = [], [], []
+            for obj_data in serialized_objects:
+                kind, color, rect = normalize_entry(obj_data)  # Accepts the old color-sentinel entries too
+                if kind == "camera":
+                    cameras.append(rect)
+                else:
+                    colors.append(color)
+                    rects.append(rect)
+            self.load_records(*pik_format.build_records(colors, rects, cameras))
 
-class ListItem(QWidget):
-    def __init__(self, game_area, obj, index, parent=None):
+
+class SceneModel(QAbstractListModel):
+    # One row per object or camera, keyed by ("object", id) or ("camera", serial) so rows survive edits
+    def __init__(self, game_area, parent=None):
         super().__init__(parent)
         self.game_area = game_area
-        self.obj = obj
-        self.index = index
+        self.entries = []
+        self.rows = {}
+        self.camera_keys = []  # mirrors game_area.cameras
+        self.camera_serial = 0
+        self.pending_adds = {}
+        self.pending_removes = set()
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.timeout.connect(self.flush)
+        game_area.edit_listeners.append(self.edited)
+        self.reset()
 
-        self.layout = QVBoxLayout(self)
-        self.label = QLabel("Object", self)
-        self.layout.addWidget(self.label)
-        self.setLayout(self.layout)
-        self.setContextMenuPolicy(Qt.CustomContextMenu)
-        self.customContextMenuRequested.connect(self.show_context_menu)
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
 
-        self.label.setMouseTracking(True)
-        self.label.setStyleSheet("QLabel { background-color: transparent; }")
-        self.label.mousePressEvent = lambda event: self.select_label()
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        kind, key = self.entries[index.row()]
+        if kind == "camera":
+            return f"Camera {key}"
+        if key in self.game_area.bodies:
+            return f"{'Dynamic Body' if self.game_area.bodies.get(key)[1] else 'Static Collider'} {key}"
+        return f"Static Object {key}"
 
-    def show_context_menu(self, point):
-        menu = QMenu(self)
-        add_component_action = QAction("Add Component", self)
-        add_component_action.triggered.connect(self.add_component)
-        delete_action = QAction("Delete", self)
-        delete_action.triggered.connect(self.delete_object)
-        menu.addAction(add_component_action)
-        menu.addAction(delete_action)
-        menu.exec_(self.mapToGlobal(point))
+    def next_camera_key(self):
+        self.camera_serial += 1
+        return ("camera", self.camera_serial)
 
-    def add_component(self):
-        print("Add Component action triggered")
-
-    def delete_object(self):
-        if self.obj in self.game_area.objects:
-            self.game_area.objects.remove(self.obj)
-        elif self.obj in self.game_area.cameras:
-            self.game_area.cameras.remove(self.obj)
-        self.deleteLater()
-        self.game_area.update()
-
-    def select_label(self):
-        self.game_area.set_selected_label(self.index)
-
-    def set_selected(self, selected):
-        if selected:
-            self.label.setStyleSheet("QLabel { background-color: lightblue; }")
+    def reset(self):
+        self.beginResetModel()
+        self.camera_keys = [self.next_camera_key() for _ in self.game_area.cameras]
+        self.entries = [("object", id) for id in self.game_area.objects.ids().tolist()] + self.camera_keys
+        self.rows = {key: row for row, key in enumerate(self.entries)}
+        self.pending_adds.clear()
+        self.pending_removes.clear()
+        self.endResetModel()
+
+    def edited(self, op, id):
+        if op == "reset":
+            self.flush_timer.stop()
+            self.reset()
+            return
+        if op == "stream":
+            for change, ids in id:
+                for object_id in ids:
+                    self.edited(change, object_id)
+            return
+        if op in ("add", "revive"):
+            key = ("object", id)
+        elif op == "camera_add":
+            key = self.next_camera_key()
+            self.camera_keys.insert(id, key)
+        elif op == "delete":
+            key = ("object", id)
+        elif op == "camera_delete":
+            key = self.camera_keys.pop(id)
+        elif op == "body":
+            row = self.rows.get(("object", id))
+            if row is not None:
+                self.dataChanged.emit(self.index(row), self.index(row))
+            return
+        else:
+            return  # moves and recolors do not change the rows
+        if op in ("add", "revive", "camera_add"):
+            self.pending_adds[key] = None
+        elif key in self.pending_adds:
+            del self.pending_adds[key]  # never shown, nothing to remove
         else:
-            self.label.setStyleSheet("QLabel { background-color: transparent; }")
+            self.pending_removes.add(key)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start(0)
+
+    def flush(self):
+        # Batched so a bulk edit turns into one insert and one remove signal instead of one per object
+        self.flush_timer.stop()
+        if self.pending_removes:
+            rows = sorted(self.rows.pop(key) for key in self.pending_removes if key in self.rows)
+            self.pending_removes.clear()
+            # One remove signal per run of adjacent rows, last run first so the rows of the others stay put.
+            # Selection and scroll position survive, unlike with a model reset.
+            runs = []
+            for row in rows:
+                if runs and runs[-1][1] == row - 1:
+                    runs[-1][1] = row
+                else:
+                    runs.append([row, row])
+            for first, last in reversed(runs):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self.entries[first:last + 1]
+                self.endRemoveRows()
+            if rows:
+                for row in range(rows[0], len(self.entries)):
+                    self.rows[self.entries[row]] = row
+        if self.pending_adds:
+            first = len(self.entries)
+            self.beginInsertRows(QModelIndex(), first, first + len(self.pending_adds) - 1)
+            for row, key in enumerate(self.pending_adds, first):
+                self.entries.append(key)
+                self.rows[key] = row
+            self.pending_adds.clear()
+            self.endInsertRows()
+
+    def row_of_object(self, id):
+        self.flush()
+        return self.rows.get(("object", id))
+
+    def target(self, row):
+        kind, key = self.entries[row]
+        if kind == "camera":
+            return kind, self.game_area.cameras[self.camera_keys.index((kind, key))]
+        return kind, key
 
 
 class ContainerWindow(QDialog):
@@ -181,42 +708,138 @@ class ContainerWindow(QDialog):
         self.setGeometry(100, 100, 400, 300)
         self.game_area = game_area
         self.layout = QVBoxLayout(self)
-        self.layout.setAlignment(Qt.AlignTop)
+        self.layout.setContentsMargins(0, 0, 0, 0)
         self.setLayout(self.layout)
 
+        self.model = SceneModel(game_area, self)
+        self.view = QListView(self)
+        self.view.setModel(self.model)
+        self.view.setUniformItemSizes(True)  # lets the view skip measuring every row
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.view.customContextMenuRequested.connect(self.show_context_menu)
+        self.layout.addWidget(self.view)
+        game_area.object_clicked.connect(self.select_object)
+
     def add_camera(self):
         self.game_area.add_camera()
-        self.add_list_item(len(self.game_area.cameras) - 1, "Camera")
 
     def add_static_object(self):
         self.game_area.add_static_object()
-        self.add_list_item(len(self.game_area.objects) - 1, "Static Object")
-
-    def add_list_item(self, index, label_text):
-        obj = None
-        if label_text == "Camera":
-            obj = self.game_area.cameras[index]
-        elif label_text == "Static Object":
-            obj = self.game_area.objects[index]
-        item = ListItem(self.game_area, obj, index)
-        item.label.setText(label_text)
-        self.layout.addWidget(item)
-        item.label.mousePressEvent = lambda event: self.select_label(item)
-
-    def contextMenuEvent(self, event):
+
+    def show_context_menu(self, point):
         menu = QMenu(self)
         add_camera_action = QAction("Add Camera", self)
         add_camera_action.triggered.connect(self.add_camera)
         add_static_object_action = QAction("Add Static Object", self)
         add_static_object_action.triggered.connect(self.add_static_object)
+        add_sprite_object_action = QAction("Add Sprite Object...", self)
+        add_sprite_object_action.triggered.connect(self.add_sprite_object)
         menu.addAction(add_camera_action)
         menu.addAction(add_static_object_action)
-        menu.exec_(event.globalPos())
+        menu.addAction(add_sprite_object_action)
+        if self.view.selectionModel().hasSelection():
+            menu.addSeparator()
+            add_component_action = QAction("Add Sprite Component...", self)
+            add_component_action.triggered.connect(self.add_component)
+            delete_action = QAction("Delete", self)
+            delete_action.triggered.connect(self.delete_selected)
+            menu.addAction(add_component_action)
+            if self.selected_cameras():
+                camera_view_action = QAction("Camera View...", self)
+                camera_view_action.triggered.connect(self.edit_camera_view)
+                menu.addAction(camera_view_action)
+            if self.game_area.world is None:  # world cells only hold objects, bodies would not be saved
+                add_body_action = QAction("Add Dynamic Body", self)
+                add_body_action.triggered.connect(lambda: self.add_body(1.0))
+                add_collider_action = QAction("Add Static Collider", self)
+                add_collider_action.triggered.connect(lambda: self.add_body(0.0))
+                remove_body_action = QAction("Remove Body", self)
+                remove_body_action.triggered.connect(self.remove_body)
+                menu.addAction(add_body_action)
+                menu.addAction(add_collider_action)
+                menu.addAction(remove_body_action)
+            menu.addAction(delete_action)
+        menu.exec_(self.view.viewport().mapToGlobal(point))
+
+    def add_sprite_object(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Add Sprite Object", "", IMAGE_FILTER)
+        if not path:
+            return
+        try:
+            self.game_area.add_sprite_object(path)
+        except (OSError, ValueError) as error:
+            QMessageBox.warning(self, "Add Sprite Object", f"Could not add {path}:\n{error}")
+
+    def add_component(self):
+        # Sprites are the component objects can have, they replace the object's color
+        path, _ = QFileDialog.getOpenFileName(self, "Add Sprite Component", "", IMAGE_FILTER)
+        if not path:
+            return
+        ids = self.selected_objects()
+        try:
+            sprite = self.game_area.add_sprite(path)
+        except (OSError, ValueError) as error:
+            QMessageBox.warning(self, "Add Sprite Component", f"Could not add {path}:\n{error}")
+            return
+        with self.game_area.transaction() as scene:
+            for id in ids:
+                scene.set_object_sprite(scene.objects.handle(id), sprite)
+
+    def selected_objects(self):
+        self.model.flush()
+        return [key for kind, key in (self.model.target(index.row()) for index in self.view.selectionModel().selectedRows()) if kind == "object"]
+
+    def selected_cameras(self):
+        self.model.flush()
+        return [camera for kind, camera in (self.model.target(index.row()) for index in self.view.selectionModel().selectedRows()) if kind == "camera"]
+
+    def edit_camera_view(self):
+        cameras = self.selected_cameras()
+        if not cameras:
+            return
+        camera = cameras[0]
+        current = f"{camera.screen_position[0]}, {camera.screen_position[1]}, {camera.zoom:g}, {camera.rate:g}"
+        text, ok = QInputDialog.getText(self, "Camera View", "Screen x, y, zoom, updates per second (0 every frame):", text=current)
+        if not ok:
+            return
+        try:
+            x, y, zoom, rate = [float(value) for value in text.split(",")]
+        except ValueError:
+            return
+        if zoom <= 0 or rate < 0:
+            return
+        for camera in cameras:
+            self.game_area.set_camera_view(camera, (int(x), int(y)), zoom, rate)
+
+    def add_body(self, mass):
+        with self.game_area.transaction() as scene:
+            for id in self.selected_objects():
+                scene.set_object_body(scene.objects.handle(id), mass=mass)
+
+    def remove_body(self):
+        with self.game_area.transaction() as scene:
+            for id in self.selected_objects():
+                scene.remove_object_body(scene.objects.handle(id))
+
+    def delete_selected(self):
+        self.model.flush()
+        targets = [self.model.target(index.row()) for index in self.view.selectionModel().selectedRows()]
+        with self.game_area.transaction() as scene:
+            scene.remove_objects([key for kind, key in targets if kind == "object"])
+            for kind, camera in targets:
+                if kind == "camera":
+                    scene.remove_camera(camera)
+
+    def select_object(self, id):
+        row = None if id is None else self.model.row_of_object(id)
+        if row is None:
+            self.view.clearSelection()
+            return
+        index = self.model.index(row)
+        self.view.selectionModel().select(index, QItemSelectionModel.ClearAndSelect)
+        self.view.scrollTo(index)
 
-    def select_label(self, item):
-        self.game_area.set_selected_label(item.index)
-        self.game_area.clear_selected_labels()
-        item.set_selected(True)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -238,18 +861,50 @@ class MainWindow(QMainWindow):
 
         self.dock_container = QDockWidget("Game Objects", self)
         self.container_window = ContainerWindow(self.game_area, self.dock_container)
-
-        self.scroll_area = QScrollArea(self)
-        self.scroll_area.setWidget(self.container_window)
-        self.scroll_area.setWidgetResizable(True)
-
-        self.dock_container.setWidget(self.scroll_area)
+        self.dock_container.setWidget(self.container_window)
         self.addDockWidget(Qt.RightDockWidgetArea, self.dock_container)
         self.dock_container.setVisible(True)
 
         self.game_objects = []
         self.init_menu_bar()  # Initialize the menu bar
 
+        self.journal = EditJournal(AUTOSAVE_DIR)
+        self.unsaved = self.journal.has_recovery()  # left behind by a crash, a clean exit discards the autosave
+        if self.unsaved:
+            self.journal.recover(self.game_area)
+        self.journal.attach(self.game_area)
+        self.game_area.edit_listeners.append(self.edited)
+        self.history = EditHistory()  # after recovery, replayed edits are not undoable
+        self.history.attach(self.game_area)
+
+        self.play_session = None  # created on the first Play
+        self.play_timer = QTimer(self)
+        self.play_timer.setInterval(250)
+        self.play_timer.timeout.connect(self.poll_game)
+
+    def poll_game(self):
+        self.play_session.poll()
+        if not self.play_session.running():
+            self.play_timer.stop()
+
+    def edited(self, op, id):
+        if op != "stream":
+            self.unsaved = True
+
+    def closeEvent(self, event):
+        if self.unsaved:
+            answer = QMessageBox.question(self, "Pike Engine", "Save the scene before closing?", QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
+            if answer == QMessageBox.Cancel or (answer == QMessageBox.Save and not self.save_project()):
+                event.ignore()
+                return
+        self.play_timer.stop()
+        if self.play_session is not None:
+            self.play_session.stop()
+        self.game_area.close_world()
+        self.journal.close()
+        self.journal.discard()  # saved or declined, either way the next start has nothing to recover
+        super().closeEvent(event)
+
     def init_menu_bar(self):
         menu_bar = self.menuBar()
 
@@ -268,10 +923,71 @@ class MainWindow(QMainWindow):
         load_project_action.triggered.connect(self.load_project)
         file_menu.addAction(load_project_action)
 
+        export_world_action = QAction("Export World Partition...", self)
+        export_world_action.triggered.connect(self.export_world)
+        file_menu.addAction(export_world_action)
+
+        undo_action = QAction("Undo", self)
+        undo_action.setShortcut(QKeySequence.Undo)
+        undo_action.triggered.connect(self.undo)
+        edit_menu.addAction(undo_action)
+
+        redo_action = QAction("Redo", self)
+        redo_action.setShortcut(QKeySequence.Redo)
+        redo_action.triggered.connect(self.redo)
+        edit_menu.addAction(redo_action)
+        edit_menu.addSeparator()
+
         edit_project_action = QAction("Add Component", self)
         edit_project_action.triggered.connect(self.edit_project)
         edit_menu.addAction(edit_project_action)
 
+        profile_menu = menu_bar.addMenu("Profile")
+
+        profile_action = QAction("Enable Profiler", self)
+        profile_action.setCheckable(True)
+        profile_action.setChecked(profiler.enabled)
+        profile_action.toggled.connect(profiler.set_enabled)
+        profile_menu.addAction(profile_action)
+
+        report_action = QAction("Print Frame Report", self)
+        report_action.triggered.connect(self.print_profile_report)
+        profile_menu.addAction(report_action)
+
+        export_trace_action = QAction("Export Trace...", self)
+        export_trace_action.triggered.connect(self.export_trace)
+        profile_menu.addAction(export_trace_action)
+
+        world_stats_action = QAction("Print World Streaming Stats", self)
+        world_stats_action.triggered.connect(self.print_world_stats)
+        profile_menu.addAction(world_stats_action)
+
+    def undo(self):
+        with profiler.span("undo"):
+            self.history.undo()
+
+    def redo(self):
+        with profiler.span("redo"):
+            self.history.redo()
+
+    def print_profile_report(self):
+        for line in profiler.report_lines():
+            print(line)
+
+    def print_world_stats(self):
+        if self.game_area.world is None:
+            print("No streamed world is open")
+            return
+        for line in self.game_area.world.report_lines():
+            print(line)
+
+    def export_trace(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "pike_trace.json", "Trace Files (*.json);;All Files (*)")
+        if file_path:
+            import play_mode
+            # Play mode writes its own trace when its window closes, merge it in as another process
+            profiler.export_chrome_trace(file_path, load_trace_events(play_mode.PLAY_TRACE_PATH))
+
     def new_project(self):
         print("New Project action triggered")
 
@@ -284,96 +1000,121 @@ class MainWindow(QMainWindow):
         return state
 
     def save_project(self):
-        state = self.serialize_state()
         file_path, _ = QFileDialog.getSaveFileName(self, "Save Project", "", "Pik Files (*.pik);;All Files (*)")
         if file_path:
-            with open(file_path, "w") as pik_file:
-                json.dump(state, pik_file, indent=4, cls=CustomJSONEncoder)
+            self.write_project(file_path)
+        return bool(file_path)
+
+    def write_project(self, file_path):
+        with profiler.span("save"):
+            if self.game_area.world is not None:
+                self.game_area.world.save(file_path)  # only edited cells are written
+            else:
+                pik_format.save_scene(file_path, self.game_area.objects, self.game_area.cameras, bodies=self.game_area.bodies)
+            if len(self.game_area.atlas):
+                self.game_area.atlas.save(atlas_path(file_path))  # loading maps it back instead of repacking
+            elif os.path.exists(atlas_path(file_path)):
+                os.remove(atlas_path(file_path))
+        self.unsaved = False
 
     def load_project(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Load Project", "", "Pik Files (*.pik);;All Files (*)")
         if file_path:
-            with open(file_path, "r") as pik_file:
-                state = json.load(pik_file)
-                self.game_area.deserialize_objects(state.get("game_objects", []))
-                self.game_area.cameras = [pygame.Rect(*rect_data) for rect_data in state.get("cameras", [])]
-
-    def deserialize_state(self, state):
-        self.deserialize_objects(state.get("game_objects", []))
-        self.cameras = [pygame.Rect(*rect_data) for rect_data in state.get("cameras", [])]
-        self.update()
+            try:
+                self.read_project(file_path)
+            except (OSError, ValueError) as error:  # PikFormatError is a ValueError
+                QMessageBox.warning(self, "Load Project", f"Could not open {file_path}:\n{error}")
 
-    def edit_project(self):
-        print("New edit action triggered")
-
-    def start_game(self):
-        self.play_game()
-
-    def play_game(self):
-        pygame.init()
-
-        screen = pygame.display.set_mode((800, 600))
-        clock = pygame.time.Clock()
-
-        running = True
-        while running:
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    running = False
+    def read_project(self, file_path):
+        # A file that cannot be read raises before the open scene is touched
+        with profiler.span("load"):
+            pik = None
+            if pik_format.is_pik(file_path):
+                pik = pik_format.PikFile(file_path)
+                try:
+                    is_world = world_partition.WORLD in pik.chunks
+                    records = None if is_world else (pik.array(pik_format.OBJECTS), pik.array(pik_format.CAMERAS), pik.array(pik_format.OBJECT_SPRITES),
+                                                     pik.array(pik_format.BODIES), pik.array(pik_format.CAMERA_VIEWS))
+                except Exception:
+                    pik.close()
+                    raise
+                if is_world:
+                    pik.close()  # the world reads its own manifest
+            else:
+                # Old JSON projects are streamed instead of parsed in one go
+                is_world = False
+                records = pik_format.legacy_records(file_path)
+            try:
+                self.game_area.close_world()
+                self.read_atlas(file_path if pik is not None else None)
+                if is_world:
+                    self.game_area.open_world(file_path)  # cells are loaded around the view as it pans
+                else:
+                    self.game_area.load_records(*records)
+            finally:
+                del records
+                if pik is not None:
+                    pik.close()
+        self.unsaved = False
 
-            screen.fill(WHITE)
+    def export_world(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export World Partition", "", "Pik Files (*.pik);;All Files (*)")
+        if file_path:
+            self.write_world(file_path)
 
-            for camera in self.game_area.cameras:
-                camera_rect = pygame.Rect(camera.x, camera.y, camera.width, camera.height)
-                for obj in self.game_area.objects:
-                    rect = pygame.Rect(obj.rect.x, obj.rect.y, obj.rect.width, obj.rect.height)
-                    if camera_rect.colliderect(rect):
-                        pygame.draw.rect(screen, obj.color, rect.move(-camera_rect.left, -camera_rect.top))
+    def write_world(self, file_path):
+        # Splits the scene into cells on disk and reopens it streamed
+        with profiler.span("save"):
+            if self.game_area.world is not None:
+                self.game_area.world.save(file_path)
+            else:
+                create_world(file_path, self.game_area.objects, self.game_area.cameras)
+            if len(self.game_area.atlas):
+                self.game_area.atlas.save(atlas_path(file_path))
+        self.read_project(file_path)
 
-            pygame.display.flip()
-            clock.tick(60)
+    def read_atlas(self, file_path):
+        atlas = self.game_area.atlas
+        if file_path is None or not os.path.exists(atlas_path(file_path)):
+            atlas.clear()
+            return
+        atlas.load(atlas_path(file_path))
+        atlas.refresh(load_rgba)  # repacks only when a source image changed since the save
 
-        pygame.quit()
+    def deserialize_state(self, state):
+        with self.game_area.transaction() as scene:
+            scene.deserialize_objects(state.get("game_objects", []))
+            if "cameras" in state:
+                from camera import Camera
+                scene.cameras[:] = [Camera(rect_data) for rect_data in state["cameras"]]
+                scene.notify_changed()
+                scene.notify_edited("reset", None)
 
-    def serialize_objects(self):
-        serialized_objects = []
-        for obj in self.objects:
-            serialized_objects.append({
-                "type": "object",
-                "color": obj.color,
-                "rect": (obj.rect.x, obj.rect.y, obj.rect.width, obj.rect.height)
-            })
-        for camera in self.cameras:
-            serialized_objects.append({
-                "type": "camera",
-                "rect": (camera.x, camera.y, camera.width, camera.height)
-            })
-        return serialized_objects
+    def edit_project(self):
+        print("New edit action triggered")
 
-    def deserialize_objects(self, serialized_objects):
-        self.objects.clear()
-        self.cameras.clear()
-        for obj_data in serialized_objects:
-            obj_type = obj_data.get("type")
-            rect_data = obj_data["rect"]
-            rect = pygame.Rect(*rect_data)
-            if obj_type == "camera":
-                self.cameras.append(rect)
-            elif obj_type == "object":
-                color = obj_data["color"]
-                self.objects.append(GameObject(color, rect))
-        self.update()
+    def start_game(self):
+        if self.play_session is None:
+            from play_mode import PlaySession
+            self.play_session = PlaySession(self.game_area)
+        self.play_session.start()
+        self.play_timer.start()
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, pygame.Rect):
+        pygame = sys.modules.get("pygame")  # nothing can be a Rect before pygame is imported
+        if pygame is not None and isinstance(obj, pygame.Rect):
             return obj.topleft + obj.size
         return super().default(obj)
 
 if __name__ == "__main__":
+    startup.mark("imports")
     app = QApplication(sys.argv)
     icon = QIcon("icon.ico")
     app.setWindowIcon(icon)
+    startup.mark("QApplication")
     main_window = MainWindow()
+    startup.mark("MainWindow")
     main_window.show()
+    QTimer.singleShot(0, lambda: startup.finish() and main_window.close())  # runs once the first show and paint are through, closeEvent shuts down as usual
     sys.exit(app.exec_())
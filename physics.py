@@ -0,0 +1,374 @@
+import numpy as np
+
+from pik_format import BODY_DTYPE
+
+FIXED_DT = 1 / 60
+MAX_STEPS = 5  # fixed steps per frame, past that the game slows down instead of falling further behind
+GRAVITY = (0.0, 980.0)  # world pixels per second squared
+RESTITUTION = 0.2
+MAX_SPEED = 1200.0  # world pixels per second, 20 pixels per step at 60 Hz
+SOLVER_ITERATIONS = 4
+BOUNCE_SPEED = 60.0  # world pixels per second, slower contacts don't bounce so resting bodies stay put
+CONTACT_MARGIN = 4.0  # world pixels, pairs this close are kept for the later solver passes
+MIN_CELL = 8.0  # smallest broadphase grid cell, in world pixels
+LARGE_BODY = 4  # bodies this many times larger than the typical dynamic body are tested against the others directly
+DENSE_GRID = 8  # grid cells per body up to which cells are looked up in a table instead of searched
+INITIAL_CAPACITY = 256
+
+
+class Bodies:
+    # Dynamic bodies (mass > 0) and static colliders (mass 0) of scene objects, one row per body.
+    # The collider is the object's rect. Rows are packed, removing one moves the last row into its place.
+    def __init__(self, gravity=GRAVITY, capacity=INITIAL_CAPACITY):
+        self.gravity = gravity
+        self.count = 0
+        self.rows = {}  # object id -> row
+        self.id = np.zeros(capacity, np.intp)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.inverse_mass = np.zeros(capacity)
+        self.restitution = np.zeros(capacity)
+        # Simulation state, copied from the scene by pull() and written back by push()
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.w = np.zeros(capacity)
+        self.h = np.zeros(capacity)
+        self.pairs = 0
+        self.contacts = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, id):
+        return id in self.rows
+
+    def columns(self):
+        return ("id", "vx", "vy", "inverse_mass", "restitution", "x", "y", "w", "h")
+
+    def reserve(self, capacity):
+        if capacity <= len(self.id):
+            return
+        capacity = max(capacity, len(self.id) * 2)
+        for name in self.columns():
+            column = getattr(self, name)
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def clear(self):
+        self.count = 0
+        self.rows.clear()
+
+    def set(self, id, velocity=(0.0, 0.0), mass=1.0, restitution=RESTITUTION):
+        # Adds or replaces the body of an object, mass 0 makes it a static collider
+        row = self.rows.get(id)
+        if row is None:
+            row = self.rows[id] = self.count
+            self.reserve(row + 1)
+            self.count += 1
+        self.id[row] = id
+        self.vx[row], self.vy[row] = velocity
+        self.inverse_mass[row] = 1.0 / mass if mass > 0 else 0.0
+        self.restitution[row] = restitution
+        return row
+
+    def set_many(self, ids, records):
+        # records are BODY_DTYPE rows, ids the objects they belong to
+        for id, vx, vy, mass, restitution in zip(np.asarray(ids).tolist(), records["vx"].tolist(), records["vy"].tolist(), records["mass"].tolist(), records["restitution"].tolist()):
+            self.set(id, (vx, vy), mass, restitution)
+
+    def remove(self, id):
+        row = self.rows.pop(id, None)
+        if row is None:
+            return False
+        last = self.count - 1
+        if row != last:
+            for name in self.columns():
+                column = getattr(self, name)
+                column[row] = column[last]
+            self.rows[int(self.id[row])] = row
+        self.count = last
+        return True
+
+    def get(self, id):
+        row = self.rows[id]
+        mass = 1.0 / float(self.inverse_mass[row]) if self.inverse_mass[row] else 0.0
+        return (float(self.vx[row]), float(self.vy[row])), mass, float(self.restitution[row])
+
+    def is_dynamic(self, id):
+        row = self.rows.get(id)
+        return row is not None and self.inverse_mass[row] > 0
+
+    def dynamic_ids(self):
+        n = self.count
+        return self.id[:n][self.inverse_mass[:n] > 0]
+
+    def records(self, ids):
+        # BODY_DTYPE rows with "object" as the position of the body's object in ids (the saved object order)
+        n = self.count
+        records = np.empty(n, BODY_DTYPE)
+        records["object"] = np.searchsorted(ids, self.id[:n])
+        records["vx"] = self.vx[:n]
+        records["vy"] = self.vy[:n]
+        records["mass"] = np.divide(1.0, self.inverse_mass[:n], out=np.zeros(n), where=self.inverse_mass[:n] > 0)
+        records["restitution"] = self.restitution[:n]
+        order = np.argsort(records["object"], kind="stable")
+        return records[order]
+
+    def pull(self, store, ids=None):
+        # Copies positions and sizes of all (or the given) bodies from the scene
+        rows = slice(0, self.count) if ids is None else np.array([self.rows[id] for id in ids], np.intp)
+        objects = self.id[rows]
+        self.x[rows] = store.x[objects]
+        self.y[rows] = store.y[objects]
+        self.w[rows] = store.w[objects]
+        self.h[rows] = store.h[objects]
+
+    def push(self, store):
+        # Writes the simulated positions of dynamic bodies back to the scene
+        n = self.count
+        moving = self.inverse_mass[:n] > 0
+        objects = self.id[:n][moving]
+        store.x[objects] = np.round(self.x[:n][moving])
+        store.y[objects] = np.round(self.y[:n][moving])
+
+    def step(self, dt):
+        # Position based: bodies move, overlaps are pushed apart, and the velocity becomes the distance
+        # actually travelled. Piles settle without building up speed, bounces are added from the contacts.
+        n = self.count
+        if not n:
+            return
+        moving = self.inverse_mass[:n] > 0
+        vx, vy = self.vx[:n], self.vy[:n]
+        vx[moving] += self.gravity[0] * dt
+        vy[moving] += self.gravity[1] * dt
+        # There is no swept collision, capping the speed keeps fast bodies from stepping through thin colliders
+        speed = np.hypot(vx, vy)
+        fast = speed > MAX_SPEED
+        if fast.any():
+            vx[fast] *= MAX_SPEED / speed[fast]
+            vy[fast] *= MAX_SPEED / speed[fast]
+        start_x, start_y = self.x[:n].copy(), self.y[:n].copy()
+        self.x[:n][moving] += vx[moving] * dt
+        self.y[:n][moving] += vy[moving] * dt
+
+        self.pairs = self.contacts = 0
+        a, b = self.broadphase(CONTACT_MARGIN)
+        # A few solver passes, so pushing a body out of one contact into another (stacks, crowds) settles
+        # within the step. The pairs that are close to touching are found once, before the first pass, their
+        # sizes and mass shares are gathered once and reused by every pass.
+        # Contacts with static colliders are solved after the others, a crowd can't push a body into a wall.
+        both = (self.inverse_mass[a] > 0) & (self.inverse_mass[b] > 0)
+        groups = [self.pair_constants(a[both], b[both], True), self.pair_constants(a[~both], b[~both], False)]
+        contacts = []
+        for iteration in range(SOLVER_ITERATIONS):
+            touching = 0
+            for group in groups:
+                if len(group[0]):
+                    touched, contact = self.solve(*group, contacts=not iteration)
+                    touching += touched
+                    if contact is not None:
+                        contacts.append(contact)
+            if not iteration:
+                self.contacts = touching
+            if not touching:
+                break
+
+        before_x, before_y = vx.copy(), vy.copy()
+        vx[moving] = (self.x[:n][moving] - start_x[moving]) / dt
+        vy[moving] = (self.y[:n][moving] - start_y[moving]) / dt
+        for contact_a, contact_b, normal_x, normal_y in contacts:
+            self.bounce(contact_a, contact_b, normal_x, normal_y, before_x, before_y)
+
+    def broadphase(self, margin=0.0):
+        # Uniform grid with cells as large as the dynamic bodies (up to LARGE_BODY times the typical one).
+        # A body no larger than a cell sits in the cell of its top left corner and can only touch bodies of
+        # that cell and the 8 around it, pairing every cell with itself and 4 of its neighbours finds each
+        # pair once. Bodies larger than a cell (floors, walls) look up the cells they cover instead.
+        # Pairs of two static colliders are never produced. It is all done on arrays, the only Python loop
+        # is over the large bodies. Returns the pairs closer than margin, pairs counts the candidates tested.
+        n = self.count
+        x, y, w, h = self.x[:n], self.y[:n], self.w[:n], self.h[:n]
+        moving = self.inverse_mass[:n] > 0
+        if not moving.any():
+            return np.empty(0, np.intp), np.empty(0, np.intp)
+        extent = np.maximum(w, h)
+        moving_extent = extent[moving]
+        size = max(MIN_CELL, min(float(moving_extent.max()), LARGE_BODY * float(np.median(moving_extent))))
+        large = extent > size
+        small = np.flatnonzero(~large)
+        if not len(small):
+            small = np.empty(0, np.intp)
+        pairs_a, pairs_b = [], []
+        tested = [0]
+
+        # Cells are numbered column by column with an empty row and column all around the occupied ones,
+        # so a neighbour offset never wraps into another column
+        cx = np.floor(x[small] / size).astype(np.int64)
+        cy = np.floor(y[small] / size).astype(np.int64)
+        left_column, top_row = (int(cx.min()) - 1, int(cy.min()) - 1) if len(small) else (0, 0)
+        cx -= left_column
+        cy -= top_row
+        columns = int(cx.max()) + 2 if len(small) else 1
+        stride = int(cy.max()) + 2 if len(small) else 1
+        key = cx * stride + cy
+        order = np.argsort(key)
+        key = key[order]
+        members = small[order]
+        if columns * stride <= DENSE_GRID * max(len(key), 1):
+            # A table of where each cell's bodies start and end in members
+            cell_end = np.cumsum(np.bincount(key, minlength=columns * stride))
+            cell_start = np.r_[0, cell_end[:-1]]
+            def span(first_cells, last_cells):
+                return cell_start[first_cells], cell_end[last_cells]
+        else:
+            def span(first_cells, last_cells):
+                return np.searchsorted(key, first_cells, "left"), np.searchsorted(key, last_cells, "right")
+
+        def expand(owners, begin, end):
+            # Pairs every owner with members[begin:end] of its row
+            counts = end - begin
+            total = int(counts.sum())
+            if total:
+                first = np.repeat(np.cumsum(counts) - counts, counts)
+                a = np.repeat(owners, counts)
+                b = members[np.repeat(begin, counts) + np.arange(total) - first]
+                keep = moving[a] | moving[b]
+                a, b = a[keep], b[keep]
+                tested[0] += len(a)
+                # Tested right away, while this batch of pairs is still in the cache
+                a, b = self.narrowphase(a, b, margin)
+                pairs_a.append(a)
+                pairs_b.append(b)
+
+        if len(key):
+            positions = np.arange(len(key))
+            expand(members, positions + 1, span(key, key)[1])
+            for offset in (1, stride - 1, stride, stride + 1):  # the cells below, above right, right and below right
+                expand(members, *span(key + offset, key + offset))
+
+        large_bodies = np.flatnonzero(large)
+        for body in large_bodies.tolist():
+            left, top, right, bottom = x[body] - margin, y[body] - margin, x[body] + w[body] + margin, y[body] + h[body] + margin
+            if len(key):
+                # Small bodies starting up to a cell before the body can reach into it
+                first_column = min(max(int(np.floor(left / size)) - 1 - left_column, 0), columns - 1)
+                last_column = min(max(int(np.floor(right / size)) - left_column, 0), columns - 1)
+                first_row = min(max(int(np.floor(top / size)) - 1 - top_row, 0), stride - 1)
+                last_row = min(max(int(np.floor(bottom / size)) - top_row, 0), stride - 1)
+                covered = np.arange(first_column, last_column + 1) * stride
+                begin, end = span(covered + first_row, covered + last_row)
+                counts = end - begin
+                total = int(counts.sum())
+                first = np.repeat(np.cumsum(counts) - counts, counts)
+                others = members[np.repeat(begin, counts) + np.arange(total) - first]
+            else:
+                others = large_bodies[:0]
+            others = np.concatenate((others, large_bodies[large_bodies > body]))  # a pair of two large bodies is found once
+            near = (x[others] < right) & (x[others] + w[others] > left) & (y[others] < bottom) & (y[others] + h[others] > top)
+            if not moving[body]:
+                near &= moving[others]
+            tested[0] += len(others)
+            others = others[near]
+            pairs_a.append(np.full(len(others), body))
+            pairs_b.append(others)
+
+        self.pairs = tested[0]
+        if not pairs_a:
+            return np.empty(0, np.intp), np.empty(0, np.intp)
+        return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+    def narrowphase(self, a, b, margin=0.0):
+        # Batched AABB test of the candidate pairs, boxes closer than margin count as touching
+        x, y, w, h = self.x, self.y, self.w, self.h
+        x_a, x_b, y_a, y_b = x.take(a), x.take(b), y.take(a), y.take(b)
+        overlap = np.minimum(x_a + w.take(a), x_b + w.take(b))
+        overlap -= np.maximum(x_a, x_b, out=x_a)
+        hit = overlap > -margin
+        overlap = np.minimum(y_a + h.take(a), y_b + h.take(b), out=overlap)
+        overlap -= np.maximum(y_a, y_b, out=y_a)
+        hit &= overlap > -margin
+        return a[hit], b[hit]
+
+    def pair_constants(self, a, b, crowd):
+        # What the solver passes need of a group of pairs that does not change within a step, and the
+        # scratch arrays they work in. Those are hundreds of kilobytes in a pile, allocating them anew for
+        # every temporary of every pass cost as much as the arithmetic.
+        inverse_a, inverse_b = self.inverse_mass.take(a), self.inverse_mass.take(b)
+        total = inverse_a + inverse_b
+        w_a, w_b, h_a, h_b = self.w.take(a), self.w.take(b), self.h.take(a), self.h.take(b)
+        scratch = [np.empty(len(a)) for _ in range(7)] + [np.empty(len(a), bool) for _ in range(3)]
+        return a, b, w_a, w_b, h_a, h_b, np.minimum(w_a, w_b), np.minimum(h_a, h_b), inverse_a / total, inverse_b / total, crowd, scratch
+
+    def solve(self, a, b, w_a, w_b, h_a, h_b, min_w, min_h, share_a, share_b, crowd, scratch, contacts):
+        # One solver pass over a group of pairs: pushes each touching pair apart the shortest way out, all at
+        # once. The depth on an axis is measured to the nearest face, a small body deep inside a wall leaves
+        # through the closer side. Pairs that don't touch take part with a push of 0, gathering the touching
+        # ones first costs more than it saves. Returns how many touched and, when contacts is set, the
+        # contacts with their normals, pointing from a towards b.
+        n = self.count
+        x_a, x_b, y_a, y_b, forward_x, forward_y, work, hit, along, mask = scratch
+        np.take(self.x, a, out=x_a, mode="clip")
+        np.take(self.x, b, out=x_b, mode="clip")
+        np.take(self.y, a, out=y_a, mode="clip")
+        np.take(self.y, b, out=y_b, mode="clip")
+        # forward is how far a reaches into b from the left (top), backward how far b reaches into a,
+        # backward is computed in place of b's position
+        np.add(x_a, w_a, out=forward_x)
+        forward_x -= x_b
+        backward_x = x_b
+        backward_x += w_b
+        backward_x -= x_a
+        np.add(y_a, h_a, out=forward_y)
+        forward_y -= y_b
+        backward_y = y_b
+        backward_y += h_b
+        backward_y -= y_a
+        depth_x = np.minimum(forward_x, backward_x, out=x_a)
+        depth_y = np.minimum(forward_y, backward_y, out=y_a)
+        np.greater(np.minimum(depth_x, min_w, out=work), 0, out=hit)
+        hit &= np.greater(np.minimum(depth_y, min_h, out=work), 0, out=mask)
+        touched = int(np.count_nonzero(hit))
+        if not touched:
+            return 0, None
+        np.less(depth_x, depth_y, out=along)
+        # The signed depth along the axis of least overlap, positive when b leaves towards +x or +y. The sign
+        # is worked out as 2 * forward_is_shorter - 1, a masked copy is several times slower.
+        move_x = np.multiply(np.less(forward_x, backward_x, out=mask), 2.0, out=backward_x)
+        move_x -= 1.0
+        move_x *= depth_x
+        move_x *= np.logical_and(along, hit, out=mask)
+        move_y = np.multiply(np.less(forward_y, backward_y, out=mask), 2.0, out=backward_y)
+        move_y -= 1.0
+        move_y *= depth_y
+        move_y *= np.logical_and(np.logical_not(along, out=along), hit, out=mask)
+        if crowd:
+            # A body's share of its contacts with other dynamic bodies is averaged, see shares()
+            touching = np.maximum(np.bincount(a, hit, n) + np.bincount(b, hit, n), 1)
+            share_a = np.divide(share_a, touching.take(a, out=depth_x, mode="clip"), out=depth_x)
+            share_b = np.divide(share_b, touching.take(b, out=depth_y, mode="clip"), out=depth_y)
+        self.x[:n] += np.bincount(b, np.multiply(move_x, share_b, out=work), n) - np.bincount(a, np.multiply(move_x, share_a, out=work), n)
+        self.y[:n] += np.bincount(b, np.multiply(move_y, share_b, out=work), n) - np.bincount(a, np.multiply(move_y, share_a, out=work), n)
+        if not contacts:
+            return touched, None
+        return touched, (a[hit], b[hit], np.sign(move_x[hit]), np.sign(move_y[hit]))
+
+    def bounce(self, a, b, normal_x, normal_y, vx, vy):
+        # Restitution: contacts that were closing faster than BOUNCE_SPEED before the step push apart again
+        n = self.count
+        approach = (vx[b] - vx[a]) * normal_x + (vy[b] - vy[a]) * normal_y
+        speed = np.where(approach < -BOUNCE_SPEED, -approach * np.minimum(self.restitution[a], self.restitution[b]), 0.0)
+        push_a, push_b = self.shares(a, b)
+        self.vx[:n] += np.bincount(b, normal_x * speed * push_b, n) - np.bincount(a, normal_x * speed * push_a, n)
+        self.vy[:n] += np.bincount(b, normal_y * speed * push_b, n) - np.bincount(a, normal_y * speed * push_a, n)
+
+    def shares(self, a, b):
+        # How much of a contact each side takes, by inverse mass. A body's share of its contacts with other
+        # dynamic bodies is averaged, summing them would push a body in a crowd out by several times its
+        # overlap. Static colliders always push out fully.
+        n = self.count
+        inverse_a, inverse_b = self.inverse_mass[a], self.inverse_mass[b]
+        total = inverse_a + inverse_b
+        both = (inverse_a > 0) & (inverse_b > 0)
+        touching = np.maximum(np.bincount(a[both], minlength=n) + np.bincount(b[both], minlength=n), 1)
+        return np.where(both, inverse_a / touching[a], inverse_a) / total, np.where(both, inverse_b / touching[b], inverse_b) / total
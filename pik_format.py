@@ -0,0 +1,340 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"PIKE"
+VERSION = 2
+
+HEADER = struct.Struct("<4sHHI")  # magic, version, flags, chunk count
+CHUNK_ENTRY = struct.Struct("<4sIQQ")  # tag, record count, offset, byte length
+
+OBJECTS = b"OBJS"
+CAMERAS = b"CAMS"
+OBJECT_SPRITES = b"OSPR"  # sprite index per object, -1 for a plain colored one, only written when a sprite is used
+BODIES = b"BODY"  # physics bodies, only written when an object has one
+CAMERA_VIEWS = b"CVEW"  # viewport position, zoom and update rate per camera, only written when one differs from the default
+
+OBJECT_RECORD = struct.Struct("<iiiiI")  # x, y, w, h, packed 0xRRGGBB color
+CAMERA_RECORD = struct.Struct("<iiii")
+OBJECT_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("w", "<i4"), ("h", "<i4"), ("color", "<u4")])
+CAMERA_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("w", "<i4"), ("h", "<i4")])
+SPRITE_RECORD = struct.Struct("<i")
+SPRITE_DTYPE = np.dtype("<i4")
+BODY_RECORD = struct.Struct("<Iffff")  # object index in the OBJS chunk, vx, vy, mass (0 for a static collider), restitution
+BODY_DTYPE = np.dtype([("object", "<u4"), ("vx", "<f4"), ("vy", "<f4"), ("mass", "<f4"), ("restitution", "<f4")])
+CAMERA_VIEW_RECORD = struct.Struct("<iiff")  # viewport x, y on screen, zoom, updates per second (0 every frame)
+CAMERA_VIEW_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("zoom", "<f4"), ("rate", "<f4")])
+
+RECORDS = {
+    OBJECTS: (OBJECT_RECORD, OBJECT_DTYPE),
+    CAMERAS: (CAMERA_RECORD, CAMERA_DTYPE),
+    OBJECT_SPRITES: (SPRITE_RECORD, SPRITE_DTYPE),
+    BODIES: (BODY_RECORD, BODY_DTYPE),
+    CAMERA_VIEWS: (CAMERA_VIEW_RECORD, CAMERA_VIEW_DTYPE),
+}
+
+CAMERA_COLOR = (0, 0, 255)  # legacy files mark cameras with this color instead of a "type" field
+READ_SIZE = 1 << 16
+
+
+class PikFormatError(ValueError):
+    pass
+
+
+def is_pik(path):
+    with open(path, "rb") as pik_file:
+        return pik_file.read(len(MAGIC)) == MAGIC
+
+
+def object_records(store):
+    ids = store.ids()
+    records = np.empty(len(ids), OBJECT_DTYPE)
+    records["x"] = store.x[ids]
+    records["y"] = store.y[ids]
+    records["w"] = store.w[ids]
+    records["h"] = store.h[ids]
+    records["color"] = store.color[ids]
+    return records
+
+
+def camera_records(cameras):
+    return np.array([tuple(camera) for camera in cameras], CAMERA_DTYPE)
+
+
+def camera_view_records(cameras, always=False):
+    # None when every camera has the default view (unless always), older readers then see the files they know
+    views = np.array([tuple(camera.screen_position) + (camera.zoom, camera.rate) for camera in cameras], CAMERA_VIEW_DTYPE)
+    if not always and not ((views["x"] != 0) | (views["y"] != 0) | (views["zoom"] != 1) | (views["rate"] != 0)).any():
+        return None
+    return views
+
+
+def sprite_records(store):
+    # None when no object uses a sprite, older readers then see exactly the files they know
+    sprites = store.sprite[store.ids()]
+    if not (sprites >= 0).any():
+        return None
+    return sprites.astype(SPRITE_DTYPE)
+
+
+def write_pik(path, objects, cameras, extra_chunks=()):
+    # objects/cameras are record arrays, extra_chunks is a list of (tag, count, bytes)
+    chunks = [(OBJECTS, len(objects), objects.tobytes()), (CAMERAS, len(cameras), cameras.tobytes())]
+    chunks.extend(extra_chunks)
+    write_chunks(path, chunks)
+
+
+def write_chunks(path, chunks):
+    offset = HEADER.size + CHUNK_ENTRY.size * len(chunks)
+    table = []
+    for tag, count, data in chunks:
+        table.append(CHUNK_ENTRY.pack(tag, count, offset, len(data)))
+        offset += len(data)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as pik_file:
+        pik_file.write(HEADER.pack(MAGIC, VERSION, 0, len(chunks)))
+        pik_file.writelines(table)
+        for _, _, data in chunks:
+            pik_file.write(data)
+    os.replace(temp_path, path)
+
+
+def scene_chunks(store, bodies=None, cameras=()):
+    # The optional chunks of a scene: object sprites, physics bodies and camera views when there are any
+    chunks = []
+    views = camera_view_records(cameras)
+    if views is not None:
+        chunks.append((CAMERA_VIEWS, len(views), views.tobytes()))
+    sprites = sprite_records(store)
+    if sprites is not None:
+        chunks.append((OBJECT_SPRITES, len(sprites), sprites.tobytes()))
+    if bodies is not None and len(bodies):
+        records = bodies.records(store.ids())
+        chunks.append((BODIES, len(records), records.tobytes()))
+    return chunks
+
+
+def save_scene(path, store, cameras, extra_chunks=(), bodies=None):
+    extra_chunks = scene_chunks(store, bodies, cameras) + list(extra_chunks)
+    write_pik(path, object_records(store), camera_records(cameras), extra_chunks)
+
+
+class RecordView:
+    # Sequence over a chunk that only unpacks the records that are indexed
+    def __init__(self, buffer, offset, count, record):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.record = record
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.record.unpack_from(self.buffer, self.offset + index * self.record.size)
+
+    def __iter__(self):
+        return self.record.iter_unpack(self.buffer[self.offset:self.offset + self.count * self.record.size])
+
+
+class PikFile:
+    def __init__(self, path):
+        with open(path, "rb") as pik_file:
+            self.map = mmap.mmap(pik_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise PikFormatError(f"{path} is too short to be a .pik file")
+        magic, self.version, self.flags, chunk_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise PikFormatError(f"{path} is not a binary .pik file")
+        if self.version > VERSION:
+            raise PikFormatError(f"{path} is .pik version {self.version}, this editor reads up to {VERSION}")
+        self.chunks = {}
+        for i in range(chunk_count):
+            tag, count, offset, length = CHUNK_ENTRY.unpack_from(self.map, HEADER.size + i * CHUNK_ENTRY.size)
+            if offset + length > len(self.map):
+                raise PikFormatError(f"{path} is truncated in chunk {tag!r}")
+            self.chunks[tag] = (count, offset, length)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # arrays still view the map, it is released once they are collected
+
+    def count(self, tag):
+        return self.chunks.get(tag, (0, 0, 0))[0]
+
+    def raw(self, tag):
+        count, offset, length = self.chunks[tag]
+        return memoryview(self.map)[offset:offset + length]
+
+    def records(self, tag):
+        record, _ = RECORDS[tag]
+        count, offset, _ = self.chunks.get(tag, (0, 0, 0))
+        return RecordView(self.map, offset, count, record)
+
+    def array(self, tag):
+        # Zero-copy view of a chunk, nothing is decoded until it is indexed
+        _, dtype = RECORDS[tag]
+        count, offset, length = self.chunks.get(tag, (0, 0, 0))
+        if count * dtype.itemsize > length:
+            raise PikFormatError(f"chunk {tag!r} holds {length} bytes, not {count} records")
+        return np.frombuffer(self.map, dtype, count, offset)
+
+    @property
+    def objects(self):
+        return self.records(OBJECTS)
+
+    @property
+    def cameras(self):
+        return self.records(CAMERAS)
+
+
+def iter_json_members(pik_file, streamed_keys):
+    # Walks the top-level object of a legacy .pik without loading the whole file.
+    # Members named in streamed_keys must be arrays and yield one (key, item) per element,
+    # anything else is decoded whole and yielded as (key, value).
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = pik_file.read(READ_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_space():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def expect(chars):
+        nonlocal pos
+        skip_space()
+        if pos >= len(buffer) or buffer[pos] not in chars:
+            raise PikFormatError(f"expected one of {chars!r} in legacy .pik file")
+        pos += 1
+        return buffer[pos - 1]
+
+    def decode():
+        nonlocal pos
+        while True:
+            skip_space()
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise PikFormatError("legacy .pik file is not valid JSON")
+                fill()
+                continue
+            if end == len(buffer) and not eof:
+                fill()  # a number may continue past the end of the buffer
+                continue
+            pos = end
+            return value
+
+    expect("{")
+    skip_space()
+    if buffer[pos:pos + 1] == "}":
+        return
+    while True:
+        key = decode()
+        expect(":")
+        if key in streamed_keys:
+            expect("[")
+            skip_space()
+            if buffer[pos:pos + 1] == "]":
+                pos += 1
+            else:
+                while True:
+                    yield key, decode()
+                    if expect(",]") == "]":
+                        break
+        else:
+            yield key, decode()
+        if expect(",}") == "}":
+            return
+
+
+def normalize_entry(entry):
+    # Both serializers ever shipped: {"type": ..., "rect": ...} and the color sentinel one
+    rect = tuple(entry["rect"])
+    kind = entry.get("type")
+    if kind is None:
+        kind = "camera" if tuple(entry["color"]) == CAMERA_COLOR else "object"
+    if kind == "camera":
+        return "camera", None, rect
+    return "object", tuple(entry["color"]), rect
+
+
+def read_legacy(path):
+    colors, rects, scene_cameras, cameras = [], [], [], None
+    with open(path, "r") as pik_file:
+        for key, value in iter_json_members(pik_file, ("game_objects", "cameras")):
+            if key == "game_objects":
+                try:
+                    kind, color, rect = normalize_entry(value)
+                except (TypeError, KeyError) as error:
+                    raise PikFormatError(f"legacy .pik file has a malformed object entry: {value!r}") from error
+                if kind == "object":
+                    colors.append(color)
+                    rects.append(rect)
+                else:
+                    scene_cameras.append(rect)
+            elif key == "cameras":
+                if cameras is None:
+                    cameras = []
+                cameras.append(tuple(value))
+    # Old saves wrote cameras twice, the "cameras" member wins like it did in load_project
+    return colors, rects, scene_cameras if cameras is None else cameras
+
+
+def legacy_records(path):
+    return build_records(*read_legacy(path))
+
+
+def build_records(colors, rects, cameras):
+    objects = np.empty(len(rects), OBJECT_DTYPE)
+    if rects:
+        rect_array = np.asarray(rects, np.int32)
+        color_array = np.asarray(colors, np.uint32)
+        objects["x"], objects["y"], objects["w"], objects["h"] = rect_array.T
+        objects["color"] = (color_array[:, 0] << 16) | (color_array[:, 1] << 8) | color_array[:, 2]
+    return objects, np.array(cameras, CAMERA_DTYPE)
+
+
+def convert_json(source_path, target_path):
+    objects, cameras = legacy_records(source_path)
+    write_pik(target_path, objects, cameras)
+    return len(objects), len(cameras)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("usage: python pik_format.py legacy.pik converted.pik")
+        sys.exit(1)
+    object_count, camera_count = convert_json(sys.argv[1], sys.argv[2])
+    print(f"Converted {object_count} objects and {camera_count} cameras")
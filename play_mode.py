@@ -0,0 +1,385 @@
+import multiprocessing
+import os
+import queue
+import struct
+import tempfile
+from multiprocessing import shared_memory
+
+import numpy as np
+import pygame
+from pygame.locals import QUIT, KEYDOWN, K_F3
+
+from physics import FIXED_DT, MAX_STEPS, Bodies
+from camera import DEFAULT_VIEW, Camera, make_cameras
+from pik_format import OBJECT_DTYPE, CAMERA_DTYPE, CAMERA_VIEW_DTYPE, SPRITE_DTYPE, BODY_DTYPE, object_records, camera_records, camera_view_records
+from profiler import profiler
+from renderer import SceneRenderer
+from scene_store import SceneStore
+from spatial_index import SpatialHash
+from sprites import PLACEMENT_DTYPE, SpriteAtlas
+from world_partition import WorldPartition
+
+SCREEN_SIZE = (800, 600)
+FPS = 60
+SNAPSHOT_HEADER = struct.Struct("<IIIIII")  # object count, camera count, body count, sprite count, atlas page count, page size
+STOP_TIMEOUT = 2.0
+PLAY_TRACE_PATH = os.path.join(tempfile.gettempdir(), "pike_play_trace.json")
+
+
+def write_snapshot(store, cameras, atlas=None, bodies=None):
+    # Layout: header, editor ids (uint32), object records, object sprites (int32), camera records,
+    # camera views, body records, atlas placements, atlas pages
+    ids = store.ids()
+    objects = object_records(store)
+    object_sprites = store.sprite[ids].astype(SPRITE_DTYPE)
+    camera_array = camera_records(cameras)
+    views = camera_view_records(cameras, always=True)
+    body_records = (bodies or Bodies()).records(ids)
+    atlas = atlas or SpriteAtlas()
+    placements = atlas.placements
+    pages = atlas.pages
+    page_bytes = atlas.page_size * atlas.page_size * 4
+    size = SNAPSHOT_HEADER.size + ids.size * 4 + objects.nbytes + object_sprites.nbytes + camera_array.nbytes + views.nbytes + body_records.nbytes + placements.nbytes + len(pages) * page_bytes
+    snapshot = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    SNAPSHOT_HEADER.pack_into(snapshot.buf, 0, len(ids), len(camera_array), len(body_records), len(placements), len(pages), atlas.page_size)
+    offset = SNAPSHOT_HEADER.size
+    np.ndarray(len(ids), "<u4", snapshot.buf, offset)[:] = ids
+    offset += ids.size * 4
+    np.ndarray(len(objects), OBJECT_DTYPE, snapshot.buf, offset)[:] = objects
+    offset += objects.nbytes
+    np.ndarray(len(object_sprites), SPRITE_DTYPE, snapshot.buf, offset)[:] = object_sprites
+    offset += object_sprites.nbytes
+    np.ndarray(len(camera_array), CAMERA_DTYPE, snapshot.buf, offset)[:] = camera_array
+    offset += camera_array.nbytes
+    np.ndarray(len(views), CAMERA_VIEW_DTYPE, snapshot.buf, offset)[:] = views
+    offset += views.nbytes
+    np.ndarray(len(body_records), BODY_DTYPE, snapshot.buf, offset)[:] = body_records
+    offset += body_records.nbytes
+    np.ndarray(len(placements), PLACEMENT_DTYPE, snapshot.buf, offset)[:] = placements
+    offset += placements.nbytes
+    for page in pages:
+        np.ndarray(page.shape, np.uint8, snapshot.buf, offset)[:] = page
+        offset += page_bytes
+    return snapshot
+
+
+def snapshot_scene(game_area):
+    # A streamed world is not copied, the game streams the same cells from disk
+    world = game_area.world
+    if world is not None:
+        world.flush(wait_for_writes=True)
+    return write_snapshot(SceneStore() if world is not None else game_area.objects, game_area.cameras, game_area.atlas, game_area.bodies)
+
+
+def read_snapshot(buffer):
+    object_count, camera_count, body_count, sprite_count, page_count, page_size = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    offset = SNAPSHOT_HEADER.size
+    ids = np.ndarray(object_count, "<u4", buffer, offset)
+    offset += ids.nbytes
+    objects = np.ndarray(object_count, OBJECT_DTYPE, buffer, offset)
+    offset += objects.nbytes
+    object_sprites = np.ndarray(object_count, SPRITE_DTYPE, buffer, offset)
+    offset += object_sprites.nbytes
+    cameras = np.ndarray(camera_count, CAMERA_DTYPE, buffer, offset)
+    offset += cameras.nbytes
+    views = np.ndarray(camera_count, CAMERA_VIEW_DTYPE, buffer, offset)
+    offset += views.nbytes
+    bodies = np.ndarray(body_count, BODY_DTYPE, buffer, offset)
+    offset += bodies.nbytes
+    placements = np.ndarray(sprite_count, PLACEMENT_DTYPE, buffer, offset)
+    offset += placements.nbytes
+    pages = []
+    for _ in range(page_count):
+        pages.append(np.ndarray((page_size, page_size, 4), np.uint8, buffer, offset))
+        offset += pages[-1].nbytes
+    for view in [ids, objects, object_sprites, cameras, views, bodies, placements] + pages:
+        view.setflags(write=False)
+    return ids, objects, object_sprites, cameras, views, bodies, placements, pages, page_size
+
+
+class PlayScene:
+    # The slice of GameArea that SceneRenderer needs, rebuilt in the game process
+    def __init__(self):
+        self.objects = SceneStore()
+        self.cameras = []
+        self.index = SpatialHash()
+        self.atlas = SpriteAtlas()
+        self.world = None  # read-only WorldPartition when the editor has a streamed world open
+        self.bodies = Bodies()
+        self.listeners = []
+        self.revision = 0
+
+    def notify_changed(self, bounds=None):
+        self.revision += 1
+        for listener in self.listeners:
+            listener(bounds)
+
+    def load_snapshot(self, name):
+        # Spawned children share the editor's resource tracker, which unlinks the block if the editor dies
+        snapshot = shared_memory.SharedMemory(name=name)
+        ids, objects, object_sprites, cameras, views, bodies, placements, pages, page_size = read_snapshot(snapshot.buf)
+        self.objects.clear()
+        self.index.clear()
+        self.bodies.clear()
+        self.objects.put(ids, objects["x"], objects["y"], objects["w"], objects["h"], objects["color"], object_sprites)
+        self.bodies.set_many(ids[bodies["object"]], bodies)
+        self.bodies.pull(self.objects)
+        # Dynamic bodies are drawn on top every frame, the index (and so the baked chunks) only has what stays put
+        moving = np.isin(ids, self.bodies.dynamic_ids(), invert=True)
+        self.index.insert_many(ids[moving], objects["x"][moving], objects["y"][moving], objects["w"][moving], objects["h"][moving])
+        self.cameras = make_cameras(cameras, views)
+        self.atlas.page_size = page_size
+        self.atlas.set_state([], placements.copy(), [page.copy() for page in pages])  # the block is released once copied
+        del ids, objects, object_sprites, cameras, views, bodies, placements, pages
+        snapshot.close()
+        self.notify_changed()
+
+    def open_world(self, path):
+        # After load_snapshot, which leaves only the cameras and atlas of a world
+        if self.world is not None:
+            self.world.close()
+            self.world = None
+        if path is not None:
+            self.world = WorldPartition(path, self, read_only=True)
+
+    def stream(self, rects):
+        self.world.update(rects)
+
+    def apply(self, message):
+        op = message[0]
+        if op == "set":
+            _, id, x, y, w, h, color, sprite = message
+            bounds = [(x, y, w, h)]
+            if self.objects.is_alive(id):
+                bounds.append(self.objects.bounds(id))
+            self.objects.put([id], x, y, w, h, color, sprite)
+            if self.bodies.is_dynamic(id):
+                self.bodies.pull(self.objects, [id])  # moved in the editor, the simulation carries on from there
+            else:
+                self.index.move(id, (x, y, w, h))
+                if id in self.bodies:
+                    self.bodies.pull(self.objects, [id])
+            self.notify_changed(bounds)
+        elif op == "delete":
+            id = message[1]
+            self.bodies.remove(id)
+            if self.objects.remove(id):
+                self.index.remove(id)
+                self.notify_changed([self.objects.bounds(id)])
+        elif op == "body":
+            _, id, body = message
+            moving = self.bodies.is_dynamic(id)
+            if body is None:
+                self.bodies.remove(id)
+            elif self.objects.is_alive(id):
+                self.bodies.set(id, *body)
+                self.bodies.pull(self.objects, [id])  # starts from where the object is now
+            if self.bodies.is_dynamic(id) != moving and self.objects.is_alive(id):
+                # Only what stays put is in the index, a body that starts or stops moving goes out of or into it
+                bounds = self.objects.bounds(id)
+                if moving:
+                    self.index.insert(id, bounds, order=id)
+                else:
+                    self.index.remove(id)
+                self.notify_changed([bounds])
+        elif op == "camera_add":
+            self.cameras.insert(message[2], Camera(message[1]))
+            self.notify_changed()
+        elif op == "camera_view":
+            _, index, screen_position, zoom, rate = message
+            if index < len(self.cameras):
+                self.cameras[index].set_view(screen_position, zoom, rate)  # the renderer sees the new view next frame
+        elif op == "camera_delete":
+            if message[1] < len(self.cameras):
+                del self.cameras[message[1]]
+            self.notify_changed()
+        elif op == "cells":
+            self.world.reload(message[1])
+
+
+def run_loop(scene, screen, edits=None, on_edit=None, fps=FPS):
+    # fps=0 runs uncapped, which is what the benchmarks measure
+    clock = pygame.time.Clock()
+    renderer = SceneRenderer(scene, screen)
+    bodies = getattr(scene, "bodies", None)
+    lag = 0.0  # simulated time owed to the physics stage, stepped in FIXED_DT steps
+    caption = None
+    overlay_rect = None
+    overlay_font = None
+    show_overlay = False  # F3 while profiling
+
+    running = True
+    while running:
+        with profiler.span("event_pump"):
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    running = False
+                elif event.type == KEYDOWN and event.key == K_F3 and profiler.enabled:
+                    show_overlay = not show_overlay
+                    if overlay_rect is not None:
+                        renderer.invalidate_screen(overlay_rect)
+
+            while edits is not None:
+                try:
+                    message = edits.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    running = False
+                    break
+                on_edit(message)
+
+        if scene.world is not None:
+            with profiler.span("stream"):
+                scene.stream(scene.cameras)
+        if bodies is not None and len(bodies):
+            with profiler.span("physics"):
+                # Fixed steps whatever the frame rate, a slow frame runs several (up to MAX_STEPS) to catch up
+                lag = min(lag + clock.get_time() / 1000, FIXED_DT * MAX_STEPS)
+                while lag >= FIXED_DT:
+                    bodies.step(FIXED_DT)
+                    lag -= FIXED_DT
+                bodies.push(scene.objects)
+        dirty = renderer.render()
+        if show_overlay:
+            if overlay_font is None:
+                pygame.font.init()
+                overlay_font = pygame.font.SysFont("monospace", 14)
+            overlay_rect = profiler.draw_overlay(screen, overlay_font, renderer.report_lines())
+            renderer.invalidate_screen(overlay_rect)  # the scene under it is redrawn next frame
+            if dirty is not None:
+                dirty.append(overlay_rect)
+        renderer.flip(dirty)
+        if renderer.dirty_count and (renderer.blits, renderer.baked) != caption:
+            caption = (renderer.blits, renderer.baked)
+            streaming = "" if scene.world is None else f", {scene.world.summary()}"
+            pygame.display.set_caption(f"Pike Engine - {renderer.blits} blits, {renderer.baked} chunks baked{streaming}")
+        clock.tick(fps)
+        profiler.end_frame()
+
+    renderer.close()
+
+
+def game_process(snapshot_name, edits, released, profiling=False, world_path=None):
+    profiler.set_enabled(profiling)
+    scene = PlayScene()
+    scene.load_snapshot(snapshot_name)
+    scene.open_world(world_path)
+    released.put(snapshot_name)
+
+    def on_edit(message):
+        if message[0] == "snapshot":
+            scene.load_snapshot(message[1])
+            scene.open_world(message[2])
+            released.put(message[1])
+        else:
+            scene.apply(message)
+
+    pygame.display.init()  # no audio or joysticks, the font module starts with the F3 overlay
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    run_loop(scene, screen, edits, on_edit)
+    scene.open_world(None)
+    pygame.quit()
+    if profiling:
+        profiler.export_chrome_trace(PLAY_TRACE_PATH)
+
+
+class PlaySession:
+    # Editor side of a play-mode process: owns the shared snapshots and forwards edits
+    def __init__(self, game_area):
+        self.game_area = game_area
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.edits = None
+        self.released = None
+        self.snapshots = {}
+
+    def running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        if self.running():
+            return
+        self.stop()
+        snapshot = self.share_scene()
+        self.edits = self.context.Queue()
+        self.released = self.context.Queue()
+        self.process = self.context.Process(target=game_process, args=(snapshot.name, self.edits, self.released, profiler.enabled, self.world_path()), daemon=True)
+        self.process.start()
+        self.game_area.edit_listeners.append(self.edited)
+
+    def share_scene(self):
+        snapshot = snapshot_scene(self.game_area)
+        self.snapshots[snapshot.name] = snapshot
+        return snapshot
+
+    def world_path(self):
+        return None if self.game_area.world is None else self.game_area.world.path
+
+    def edited(self, op, id):
+        store = self.game_area.objects
+        if op == "stream":
+            return
+        if op in ("reset", "atlas"):
+            self.edits.put(("snapshot", self.share_scene().name, self.world_path()))
+        elif op == "body":
+            bodies = self.game_area.bodies
+            self.edits.put(("body", id, bodies.get(id) if id in bodies else None))
+        elif self.game_area.world is not None and not op.startswith("camera"):
+            return  # sent as rewritten cells on the next poll
+        elif op == "delete":
+            self.edits.put(("delete", id))
+        elif op == "camera_add":
+            camera = self.game_area.cameras[id]
+            self.edits.put(("camera_add", tuple(camera), id))
+            if camera.settings() != DEFAULT_VIEW:  # a camera brought back by undo keeps its view
+                self.edits.put(("camera_view", id) + camera.settings())
+        elif op == "camera_delete":
+            self.edits.put(("camera_delete", id))
+        elif op == "camera_view":
+            camera = self.game_area.cameras[id]
+            self.edits.put(("camera_view", id, camera.screen_position, camera.zoom, camera.rate))
+        else:
+            x, y, w, h = store.bounds(id)
+            self.edits.put(("set", id, x, y, w, h, int(store.color[id]), int(store.sprite[id])))
+
+    def poll(self):
+        # Called from a Qt timer: frees snapshots the game has copied, notices a closed game window
+        # and hands edited cells of a streamed world over
+        world = self.game_area.world
+        if world is not None and world.dirty and self.running():
+            self.edits.put(("cells", world.flush(wait_for_writes=True)))
+        while self.released is not None:
+            try:
+                name = self.released.get_nowait()
+            except queue.Empty:
+                break
+            self.release(name)
+        if self.process is not None and not self.process.is_alive():
+            self.stop()
+
+    def release(self, name):
+        snapshot = self.snapshots.pop(name, None)
+        if snapshot is not None:
+            snapshot.close()
+            snapshot.unlink()
+
+    def stop(self):
+        if self.edited in self.game_area.edit_listeners:
+            self.game_area.edit_listeners.remove(self.edited)
+        if self.process is not None:
+            if self.process.is_alive():
+                self.edits.put(None)
+                self.process.join(STOP_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self.process = None
+        for name in list(self.snapshots):
+            self.release(name)
+        for channel in (self.edits, self.released):
+            if channel is not None:
+                channel.cancel_join_thread()  # the game may already be gone, never block the editor on it
+                channel.close()
+        self.edits = None
+        self.released = None
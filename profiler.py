@@ -0,0 +1,208 @@
+import json
+import builtins
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+HISTORY_FRAMES = 600
+MAX_EVENTS = 200000
+PERCENTILES = (50, 95, 99)
+STARTUP_TOP_IMPORTS = 15
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False, history=HISTORY_FRAMES, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.history = history
+        self.events = deque(maxlen=max_events)  # (name, start ns, duration ns, thread id)
+        self.frame_totals = defaultdict(int)
+        self.histories = defaultdict(lambda: deque(maxlen=self.history))
+        self.frame_start = None
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def span(self, name):
+        # When disabled this is one attribute check and a shared no-op context manager
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, start, end):
+        duration = end - start
+        with self.lock:
+            self.events.append((name, start, duration, threading.get_ident()))
+            self.frame_totals[name] += duration
+
+    def sample(self, name, start, end):
+        # A span that is its own sample, like one run of a script, outside any frame
+        duration = end - start
+        with self.lock:
+            self.events.append((name, start, duration, threading.get_ident()))
+            self.histories[name].append(duration / 1e6)
+
+    def end_frame(self, name="frame"):
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        with self.lock:
+            if self.frame_start is not None:
+                self.histories[name].append((now - self.frame_start) / 1e6)
+                self.events.append((name, self.frame_start, now - self.frame_start, threading.get_ident()))
+            for span_name, total in self.frame_totals.items():
+                self.histories[span_name].append(total / 1e6)
+            self.frame_totals.clear()
+            self.frame_start = now
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.frame_start = None
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.frame_totals.clear()
+            self.histories.clear()
+            self.frame_start = None
+
+    def percentiles(self, name):
+        with self.lock:
+            samples = sorted(self.histories.get(name, ()))
+        if not samples:
+            return None
+        return tuple(samples[min(len(samples) - 1, len(samples) * p // 100)] for p in PERCENTILES)
+
+    def summary(self):
+        return {name: self.percentiles(name) for name in sorted(self.histories)}
+
+    def report_lines(self):
+        lines = []
+        for name, values in self.summary().items():
+            if values is not None:
+                p50, p95, p99 = values
+                lines.append(f"{name:<14} p50 {p50:6.2f}  p95 {p95:6.2f}  p99 {p99:6.2f} ms")
+        return lines
+
+    def trace_events(self):
+        with self.lock:
+            events = list(self.events)
+        return [{
+            "name": name,
+            "cat": "pike",
+            "ph": "X",
+            "ts": start / 1000,
+            "dur": duration / 1000,
+            "pid": self.pid,
+            "tid": thread,
+        } for name, start, duration, thread in events]
+
+    def export_chrome_trace(self, path, extra_events=()):
+        # Loads in chrome://tracing and ui.perfetto.dev
+        trace = {"traceEvents": self.trace_events() + list(extra_events), "displayTimeUnit": "ms"}
+        with open(path, "w") as trace_file:
+            json.dump(trace, trace_file)
+
+    def draw_overlay(self, surface, font, extra_lines=(), position=(8, 8)):
+        import pygame
+        lines = (self.report_lines() or ["profiler: no samples yet"]) + list(extra_lines)
+        height = font.get_linesize()
+        rect = pygame.Rect(position, (max(font.size(line)[0] for line in lines) + 8, height * len(lines) + 8))
+        surface.fill((0, 0, 0), rect)
+        for row, line in enumerate(lines):
+            surface.blit(font.render(line, True, (255, 255, 0)), (rect.x + 4, rect.y + 4 + row * height))
+        return rect
+
+
+class StartupReport:
+    # A built in -X importtime: import self and cumulative times plus named milestones.
+    # Times count from the moment this module was imported, which entry points do first.
+    def __init__(self, mode=None):
+        self.mode = mode  # None, "1" to print the report, "exit" to print it and quit once the window is up
+        self.enabled = bool(mode)
+        self.start = time.perf_counter_ns()
+        self.marks = []  # (name, ns since start)
+        self.imports = []  # (module, self ns, cumulative ns, nesting depth)
+        self.children = []  # ns spent in nested imports, one entry per import in progress
+        self.original_import = None
+        if self.enabled:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.timed_import
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only first imports on the main thread are timed, everything else goes straight through
+        if level or name in sys.modules or threading.current_thread() is not threading.main_thread():
+            return self.original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter_ns()
+        depth = len(self.children)
+        self.children.append(0)
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.imports.append((name, elapsed - self.children.pop(), elapsed, depth))
+            if self.children:
+                self.children[-1] += elapsed
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, time.perf_counter_ns() - self.start))
+
+    def report_lines(self, top=STARTUP_TOP_IMPORTS):
+        lines = [f"{name:<32} {ns / 1e6:8.1f} ms" for name, ns in self.marks]
+        lines.append(f"{'top level imports':<32} {'self':>8} {'total':>8}")
+        top_level = sorted((entry for entry in self.imports if entry[3] == 0), key=lambda entry: entry[2], reverse=True)
+        lines.extend(f"  {name:<30} {own / 1e6:8.1f} {total / 1e6:8.1f} ms" for name, own, total, _ in top_level[:top])
+        lines.append(f"{'slowest modules':<32} {'self':>8} {'total':>8}")
+        slowest = sorted(self.imports, key=lambda entry: entry[1], reverse=True)
+        lines.extend(f"  {name:<30} {own / 1e6:8.1f} {total / 1e6:8.1f} ms" for name, own, total, _ in slowest[:top])
+        return lines
+
+    def finish(self, name="window shown"):
+        # Prints the report to stderr and stops timing imports, returns True when the app should quit
+        if not self.enabled:
+            return False
+        self.mark(name)
+        builtins.__import__ = self.original_import
+        self.enabled = False
+        print("\n".join(self.report_lines()), file=sys.stderr, flush=True)
+        return self.mode == "exit"
+
+
+def load_trace_events(path):
+    try:
+        with open(path) as trace_file:
+            return json.load(trace_file).get("traceEvents", [])
+    except (OSError, ValueError):
+        return []
+
+
+profiler = Profiler(enabled=os.environ.get("PIKE_PROFILE") == "1")
+startup = StartupReport(os.environ.get("PIKE_STARTUP_REPORT"))
@@ -0,0 +1,409 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+
+from profiler import profiler
+from sprites import SurfaceCache
+
+WHITE = (255, 255, 255)
+CHUNK_SIZE = 512
+CHUNK_BUDGET = 64 * 1024 * 1024  # bytes of baked chunk surfaces kept around, per zoom level
+RENDER_THREADS = int(os.environ.get("PIKE_RENDER_THREADS", "0"))  # cameras at different zooms drawn in parallel, 0 draws them in turn
+
+
+def zoomed_rect(bounds, zoom):
+    # A world rect in zoomed pixels, covering every pixel the rect touches
+    if zoom == 1:
+        return pygame.Rect(bounds)
+    x, y, w, h = bounds
+    left, top = math.floor(x * zoom), math.floor(y * zoom)
+    return pygame.Rect(left, top, math.ceil((x + w) * zoom) - left, math.ceil((y + h) * zoom) - top)
+
+
+def zoomed_rects(store, ids, zoom, left, top):
+    # Object rects in zoomed pixels relative to (left, top), as lists of x, y, w, h
+    if zoom == 1:
+        return (store.x[ids] - left).tolist(), (store.y[ids] - top).tolist(), store.w[ids].tolist(), store.h[ids].tolist()
+    x0, y0 = np.floor(store.x[ids] * zoom), np.floor(store.y[ids] * zoom)
+    x1, y1 = np.ceil((store.x[ids] + store.w[ids]) * zoom), np.ceil((store.y[ids] + store.h[ids]) * zoom)
+    return (x0 - left).astype(int).tolist(), (y0 - top).astype(int).tolist(), (x1 - x0).astype(int).tolist(), (y1 - y0).astype(int).tolist()
+
+
+class ChunkCache:
+    # Static objects prerendered into fixed-size surfaces at one zoom, least recently used dropped first.
+    # Chunks are chunk_size pixels of the zoomed world, chunk_size / zoom world pixels.
+    def __init__(self, game_area, screen, background=WHITE, chunk_size=CHUNK_SIZE, budget=CHUNK_BUDGET, zoom=1.0):
+        self.game_area = game_area
+        self.screen = screen
+        self.background = background
+        self.chunk_size = chunk_size
+        self.budget = budget
+        self.zoom = zoom
+        self.chunks = OrderedDict()  # (column, row) -> Surface
+        self.stale = {}  # (column, row) -> areas of a cached chunk to repaint, in chunk pixels
+        self.stale_pixels = {}  # (column, row) -> summed size of those areas, a chunk's worth is baked again
+        self.draw_rect = pygame.Rect(0, 0, 0, 0)
+        self.bytes = 0
+        self.baked = 0
+        self.atlas_surfaces = []  # one converted surface per atlas page, made on first use
+        self.atlas_revision = None
+        self.sprites = SurfaceCache(self.scaled_sprite)  # (sprite, w, h) -> Surface
+
+    def sprite_surface(self, sprite, w, h):
+        atlas = self.game_area.atlas
+        if self.atlas_revision != atlas.revision:
+            self.atlas_revision = atlas.revision
+            self.atlas_surfaces = [None] * len(atlas.pages)
+            self.sprites.clear()
+        return self.sprites.get((sprite, w, h))
+
+    def scaled_sprite(self, key):
+        sprite, w, h = key
+        atlas = self.game_area.atlas
+        page, x, y, sprite_w, sprite_h = atlas.placements[sprite].tolist()
+        surface = self.atlas_surfaces[page]
+        if surface is None:
+            data = atlas.pages[page]
+            surface = pygame.image.frombuffer(data.tobytes(), (data.shape[1], data.shape[0]), "RGBA").convert_alpha(self.screen)
+            self.atlas_surfaces[page] = surface
+        image = surface.subsurface((x, y, sprite_w, sprite_h))
+        if (sprite_w, sprite_h) != (w, h):
+            image = pygame.transform.smoothscale(image, (w, h))
+        else:
+            image = image.copy()  # a subsurface would keep the whole page locked to it
+        return image, w * h * 4
+
+    def clear(self):
+        self.chunks.clear()
+        self.stale.clear()
+        self.stale_pixels.clear()
+        self.bytes = 0
+
+    def invalidate(self, bounds):
+        # Cached chunks are patched where they changed when next used. Zoomed out, one chunk can cover
+        # the whole world and baking it again for every edit would cost more than drawing the scene.
+        size = self.chunk_size
+        for rect in bounds:
+            rect = zoomed_rect(rect, self.zoom)
+            rect.width, rect.height = max(rect.width, 1), max(rect.height, 1)
+            for column in range(rect.x // size, (rect.right - 1) // size + 1):
+                for row in range(rect.y // size, (rect.bottom - 1) // size + 1):
+                    key = (column, row)
+                    if key not in self.chunks:
+                        continue
+                    area = rect.move(-column * size, -row * size).clip((0, 0, size, size))
+                    pixels = self.stale_pixels.get(key, 0) + area.width * area.height
+                    if pixels < size * size:
+                        self.stale.setdefault(key, []).append(area)
+                        self.stale_pixels[key] = pixels
+                    else:
+                        self.discard(key)
+
+    def discard(self, key):
+        self.stale.pop(key, None)
+        self.stale_pixels.pop(key, None)
+        chunk = self.chunks.pop(key, None)
+        if chunk is not None:
+            self.bytes -= chunk.get_width() * chunk.get_height() * chunk.get_bytesize()
+
+    def get(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.bake(*key)
+            self.chunks[key] = chunk
+            self.bytes += chunk.get_width() * chunk.get_height() * chunk.get_bytesize()
+            while self.bytes > self.budget and len(self.chunks) > 1:
+                self.discard(next(iter(self.chunks)))
+        else:
+            self.chunks.move_to_end(key)
+            areas = self.stale.pop(key, None)
+            if areas:
+                del self.stale_pixels[key]
+                with profiler.span("patch"):
+                    for area in areas:
+                        self.paint(chunk, key, area)
+        return chunk
+
+    def bake(self, column, row):
+        with profiler.span("bake"):
+            size = self.chunk_size
+            chunk = pygame.Surface((size, size), 0, self.screen)  # same pixel format as the screen, blits need no conversion
+            self.paint(chunk, (column, row), pygame.Rect(0, 0, size, size))
+            self.baked += 1
+            return chunk
+
+    def paint(self, chunk, key, area):
+        # Draws the objects under area (chunk pixels) over the background, clipped to it
+        zoom = self.zoom
+        left, top = key[0] * self.chunk_size, key[1] * self.chunk_size
+        chunk.set_clip(area)
+        chunk.fill(self.background, area)
+        store = self.game_area.objects
+        if zoom == 1:
+            ids = self.game_area.index.query_rect(area.move(left, top))
+        else:
+            world_left, world_top = math.floor((left + area.left) / zoom), math.floor((top + area.top) / zoom)
+            world_right, world_bottom = math.ceil((left + area.right) / zoom), math.ceil((top + area.bottom) / zoom)
+            ids = self.game_area.index.query_rect((world_left, world_top, world_right - world_left, world_bottom - world_top))
+        draw_rect = self.draw_rect
+        xs, ys, ws, hs = zoomed_rects(store, ids, zoom, left, top)
+        for x, y, w, h, color, sprite in zip(xs, ys, ws, hs, store.color[ids].tolist(), store.sprite[ids].tolist()):
+            if sprite >= 0 and w > 0 and h > 0:
+                chunk.blit(self.sprite_surface(sprite, w, h), (x, y))
+                continue
+            draw_rect.update(x, y, w, h)
+            pygame.draw.rect(chunk, store.to_rgb(color), draw_rect)  # Surface.fill misplaces rects that start left of the surface
+        chunk.set_clip(None)
+
+    def blit_list(self, lens, region):
+        # (chunk, target position, area) for every chunk under region, clipped to it. lens is the camera's
+        # view in zoomed pixels, positions are relative to its top left.
+        size = self.chunk_size
+        region = region.clip(lens)
+        blits = []
+        if not region.width or not region.height:
+            return blits
+        for column in range(region.left // size, (region.right - 1) // size + 1):
+            for row in range(region.top // size, (region.bottom - 1) // size + 1):
+                left, top = column * size, row * size
+                area = region.clip((left, top, size, size))
+                blits.append((self.get((column, row)), (area.x - lens.left, area.y - lens.top), area.move(-left, -top)))
+        return blits
+
+
+class CameraTarget:
+    # The render target of one camera and what drawing it costs
+    def __init__(self):
+        self.surface = None
+        self.view = None  # camera.view() the surface shows
+        self.dirty = []  # world rects changed since the surface was drawn
+        self.updated = None  # perf_counter() of the last draw
+        self.renders = 0
+        self.skipped = 0  # draws held back by the camera's update rate
+        self.last_ms = 0.0
+        self.total_ms = 0.0
+        self.counts = None  # (drawn, culled) objects of the last draw, counted only when stats are asked for
+        self.bodies_drawn = 0  # dynamic bodies in view at the last draw
+
+
+class SceneRenderer:
+    # Every camera draws into its own surface at its zoom, only when something it sees changed and no more
+    # often than its update rate allows. The surfaces are then blitted onto the screen at their viewports,
+    # later cameras on top.
+    def __init__(self, game_area, screen, background=WHITE, chunk_size=CHUNK_SIZE, chunk_budget=CHUNK_BUDGET, threads=RENDER_THREADS):
+        self.game_area = game_area
+        self.screen = screen
+        self.background = background
+        self.chunk_size = chunk_size
+        self.chunk_budget = chunk_budget
+        self.caches = {}  # zoom -> ChunkCache
+        self.chunks = self.cache(1.0)
+        self.targets = []  # one CameraTarget per camera
+        self.layout = None  # the viewports the screen was composed with
+        self.dirty_screen = []
+        self.blits = 0
+        self.dirty_count = 0
+        # Cameras sharing a chunk cache share its surfaces and are drawn in turn, different zooms can overlap
+        self.pool = ThreadPoolExecutor(threads, "pike-render") if threads else None
+        game_area.listeners.append(self.scene_changed)
+
+    def close(self):
+        if self.scene_changed in self.game_area.listeners:
+            self.game_area.listeners.remove(self.scene_changed)
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def cache(self, zoom):
+        cache = self.caches.get(zoom)
+        if cache is None:
+            cache = self.caches[zoom] = ChunkCache(self.game_area, self.screen, self.background, self.chunk_size, self.chunk_budget, zoom)
+        return cache
+
+    @property
+    def baked(self):
+        return sum(cache.baked for cache in self.caches.values())
+
+    def scene_changed(self, bounds):
+        if bounds is None:
+            for cache in self.caches.values():
+                cache.clear()
+            for target in self.targets:
+                target.view = None
+        else:
+            for cache in self.caches.values():
+                cache.invalidate(bounds)
+            for target in self.targets:
+                target.dirty.extend(bounds)
+
+    def invalidate_screen(self, rect):
+        # Composed again from the camera surfaces, nothing is redrawn
+        self.dirty_screen.append(pygame.Rect(rect))
+
+    def render(self, now=None):
+        now = time.perf_counter() if now is None else now
+        cameras = self.game_area.cameras
+        if len(self.targets) != len(cameras):
+            self.targets = [CameraTarget() for _ in cameras]
+        zooms = {camera.zoom for camera in cameras} | {1.0}
+        for zoom in [zoom for zoom in self.caches if zoom not in zooms]:
+            del self.caches[zoom]
+        for cache in self.caches.values():
+            cache.baked = 0
+        self.blits = 0
+        bodies = getattr(self.game_area, "bodies", None)
+        moving = bodies.dynamic_ids() if bodies is not None and len(bodies) else ()
+
+        jobs = []
+        for camera, target in zip(cameras, self.targets):
+            view = camera.view()
+            if view == target.view and not target.dirty and not len(moving):
+                continue
+            if camera.rate and target.updated is not None and now - target.updated < 1 / camera.rate:
+                target.skipped += 1  # keeps its dirt until it is due
+                continue
+            job = self.prepare(camera, target, view, moving)
+            if job is not None:
+                jobs.append(job)
+
+        with profiler.span("draw"):
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job[2].zoom, []).append(job)
+            if self.pool is not None and len(groups) > 1:
+                list(self.pool.map(self.draw_group, groups.values(), [now] * len(groups)))
+            else:
+                for group in groups.values():
+                    self.draw_group(group, now)
+
+        with profiler.span("compose"):
+            return self.compose(cameras, jobs)
+
+    def prepare(self, camera, target, view, moving):
+        # Picks the regions to redraw and resolves their chunk blits, baking happens here on the calling thread
+        start = time.perf_counter()
+        zoom = camera.zoom
+        viewport = camera.viewport
+        full = view != target.view or len(moving)
+        if target.surface is None or target.surface.get_size() != viewport.size:
+            target.surface = pygame.Surface(viewport.size, 0, self.screen)
+            full = True
+        target.view = view
+        lens = pygame.Rect(math.floor(camera.x * zoom), math.floor(camera.y * zoom), viewport.width, viewport.height)
+        if full:
+            regions = [lens]
+        else:
+            regions = [region for region in (zoomed_rect(bounds, zoom).clip(lens) for bounds in target.dirty) if region.width and region.height]
+        target.dirty.clear()
+        if not regions:
+            return None
+        cache = self.cache(zoom)
+        with profiler.span("cull"):
+            blits = [(region.move(-lens.left, -lens.top), cache.blit_list(lens, region)) for region in regions]
+        return camera, target, cache, lens, blits, moving, time.perf_counter() - start
+
+    def draw_group(self, jobs, now):
+        for camera, target, cache, lens, blits, moving, prepare_time in jobs:
+            start = time.perf_counter()
+            surface = target.surface
+            for region, chunk_blits in blits:
+                surface.fill(self.background, region)
+                surface.blits(chunk_blits, doreturn=False)
+                self.blits += len(chunk_blits)
+            target.bodies_drawn = self.draw_bodies(camera, target.surface, cache, lens, moving) if len(moving) else 0
+            elapsed = (time.perf_counter() - start + prepare_time) * 1000
+            target.updated = now
+            target.counts = None
+            target.renders += 1
+            target.last_ms = elapsed
+            target.total_ms += elapsed
+
+    def draw_bodies(self, camera, surface, cache, lens, ids):
+        # Dynamic bodies are not in the index or the chunks, the ones in view are drawn one by one
+        store = self.game_area.objects
+        xs, ys, ws, hs = store.x[ids], store.y[ids], store.w[ids], store.h[ids]
+        ids = ids[(xs < camera.right) & (xs + ws > camera.left) & (ys < camera.bottom) & (ys + hs > camera.top)]
+        draw_rect = pygame.Rect(0, 0, 0, 0)
+        xs, ys, ws, hs = zoomed_rects(store, ids, camera.zoom, lens.left, lens.top)
+        for x, y, w, h, color, sprite in zip(xs, ys, ws, hs, store.color[ids].tolist(), store.sprite[ids].tolist()):
+            if sprite >= 0 and w > 0 and h > 0:
+                surface.blit(cache.sprite_surface(sprite, w, h), (x, y))
+                continue
+            draw_rect.update(x, y, w, h)
+            pygame.draw.rect(surface, store.to_rgb(color), draw_rect)
+        self.blits += len(ids)
+        return len(ids)
+
+    def compose(self, cameras, jobs):
+        # Returns the screen rects to update, None when the whole screen was composed
+        layout = [tuple(camera.viewport) for camera in cameras]
+        if layout != self.layout:
+            self.layout = layout
+            self.dirty_screen.clear()
+            self.screen.fill(self.background)
+            for camera, target in zip(cameras, self.targets):
+                if target.surface is not None:
+                    self.screen.blit(target.surface, camera.screen_position)
+            self.blits += len(cameras)
+            self.dirty_count = 1
+            return None
+
+        dirty = self.dirty_screen
+        self.dirty_screen = []
+        for camera, target, cache, lens, blits, moving, prepare_time in jobs:
+            dirty.extend(region.move(camera.screen_position) for region, _ in blits)
+        screen_rect = self.screen.get_rect()
+        dirty = [rect.clip(screen_rect) for rect in dirty]
+        dirty = [rect for rect in dirty if rect.width and rect.height]
+        for rect in dirty:
+            self.screen.fill(self.background, rect)
+            for camera, target in zip(cameras, self.targets):
+                viewport = pygame.Rect(camera.screen_position, target.surface.get_size())
+                area = rect.clip(viewport)
+                if area.width and area.height:
+                    self.screen.blit(target.surface, area.topleft, area.move(-viewport.x, -viewport.y))
+                    self.blits += 1
+        self.dirty_count = len(dirty)
+        return dirty
+
+    def counts(self, camera, target):
+        # The index query costs as much as the objects in view, so it only runs for stats, never per frame
+        if target.counts is None:
+            drawn = len(self.game_area.index.query_rect(camera)) + target.bodies_drawn if target.renders else 0
+            target.counts = (drawn, len(self.game_area.objects) - drawn)
+        return target.counts
+
+    def camera_stats(self):
+        return [{
+            "camera": index,
+            "zoom": camera.zoom,
+            "rate": camera.rate,
+            "renders": target.renders,
+            "skipped": target.skipped,
+            "last_ms": target.last_ms,
+            "average_ms": target.total_ms / target.renders if target.renders else 0.0,
+            "drawn": self.counts(camera, target)[0],
+            "culled": self.counts(camera, target)[1],
+        } for index, (camera, target) in enumerate(zip(self.game_area.cameras, self.targets))]
+
+    def report_lines(self):
+        lines = []
+        for stats in self.camera_stats():
+            rate = f"{stats['rate']:g} Hz" if stats["rate"] else "every frame"
+            lines.append(f"camera {stats['camera']:<2} {stats['zoom']:g}x {rate:<11} last {stats['last_ms']:6.2f}  avg {stats['average_ms']:6.2f} ms  "
+                         f"{stats['renders']} renders, {stats['skipped']} held, {stats['drawn']} drawn, {stats['culled']} culled")
+        return lines
+
+    def present(self):
+        self.flip(self.render())
+
+    def flip(self, dirty):
+        with profiler.span("flip"):
+            if dirty is None:
+                pygame.display.flip()
+            elif dirty:
+                pygame.display.update(dirty)
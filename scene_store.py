@@ -0,0 +1,241 @@
+import numpy as np
+
+INITIAL_CAPACITY = 1024
+
+
+def pack_color(color):
+    return (int(color[0]) << 16) | (int(color[1]) << 8) | int(color[2])
+
+
+def unpack_color(packed):
+    return ((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF)
+
+
+class GameObject:
+    __slots__ = ("store", "id")
+
+    def __init__(self, store, id):
+        self.store = store
+        self.id = id
+
+    def __eq__(self, other):
+        return isinstance(other, GameObject) and other.store is self.store and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"GameObject({self.id}, {self.color}, {self.bounds})"
+
+    @property
+    def alive(self):
+        return self.store.is_alive(self.id)
+
+    @property
+    def bounds(self):
+        return self.store.bounds(self.id)
+
+    @property
+    def rect(self):
+        # A copy, write it back through the setter or use move()
+        import pygame
+        return pygame.Rect(self.store.bounds(self.id))
+
+    @rect.setter
+    def rect(self, rect):
+        self.store.set_rect(self.id, rect)
+
+    @property
+    def color(self):
+        return self.store.rgb(self.id)
+
+    @color.setter
+    def color(self, color):
+        self.store.set_color(self.id, color)
+
+    @property
+    def sprite(self):
+        # Index into the scene's SpriteAtlas, -1 when the object is drawn in its color
+        return int(self.store.sprite[self.id])
+
+    @sprite.setter
+    def sprite(self, sprite):
+        self.store.set_sprite(self.id, sprite)
+
+    def move(self, x, y):
+        self.store.move(self.id, x, y)
+
+
+class SceneStore:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.x = np.zeros(capacity, np.int32)
+        self.y = np.zeros(capacity, np.int32)
+        self.w = np.zeros(capacity, np.int32)
+        self.h = np.zeros(capacity, np.int32)
+        self.color = np.zeros(capacity, np.uint32)
+        self.sprite = np.full(capacity, -1, np.int32)
+        self.alive = np.zeros(capacity, np.bool_)
+        self.count = 0  # slots handed out so far, ids are never reused outside a streamed world (see world_partition)
+        self.live = 0
+        self.colors = {}
+
+    def __len__(self):
+        return self.live
+
+    def __iter__(self):
+        for id in self.ids().tolist():
+            yield GameObject(self, id)
+
+    def __contains__(self, obj):
+        return isinstance(obj, GameObject) and obj.store is self and self.is_alive(obj.id)
+
+    def columns(self):
+        return (self.x, self.y, self.w, self.h, self.color, self.sprite, self.alive)
+
+    @property
+    def capacity(self):
+        return len(self.x)
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name in ("x", "y", "w", "h", "color", "sprite", "alive"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def clear(self):
+        self.alive[:self.count] = False
+        self.count = 0
+        self.live = 0
+
+    def handle(self, id):
+        return GameObject(self, id)
+
+    def is_alive(self, id):
+        return 0 <= id < self.count and bool(self.alive[id])
+
+    def ids(self):
+        return np.flatnonzero(self.alive[:self.count])
+
+    def add(self, color, rect, sprite=-1):
+        id = self.count
+        self.reserve(id + 1)
+        self.x[id], self.y[id], self.w[id], self.h[id] = rect[0], rect[1], rect[2], rect[3]
+        self.color[id] = pack_color(color)
+        self.sprite[id] = sprite
+        self.alive[id] = True
+        self.count += 1
+        self.live += 1
+        return GameObject(self, id)
+
+    def add_many(self, xs, ys, ws, hs, colors, sprites=-1):
+        colors = np.asarray(colors)
+        if colors.ndim == 2:
+            colors = (colors[:, 0].astype(np.uint32) << 16) | (colors[:, 1].astype(np.uint32) << 8) | colors[:, 2].astype(np.uint32)
+        n = len(xs)
+        start = self.count
+        self.reserve(start + n)
+        end = start + n
+        self.x[start:end] = xs
+        self.y[start:end] = ys
+        self.w[start:end] = ws
+        self.h[start:end] = hs
+        self.color[start:end] = colors
+        self.sprite[start:end] = sprites
+        self.alive[start:end] = True
+        self.count = end
+        self.live += n
+        return np.arange(start, end)
+
+    def put(self, ids, xs, ys, ws, hs, colors, sprites=-1):
+        # Writes objects at the given ids, reviving or extending the store as needed
+        ids = np.asarray(ids, np.intp)
+        if not len(ids):
+            return ids
+        self.reserve(int(ids.max()) + 1)
+        self.count = max(self.count, int(ids.max()) + 1)
+        self.live += int(np.count_nonzero(~self.alive[ids]))
+        self.x[ids] = xs
+        self.y[ids] = ys
+        self.w[ids] = ws
+        self.h[ids] = hs
+        self.color[ids] = colors
+        self.sprite[ids] = sprites
+        self.alive[ids] = True
+        return ids
+
+    def remove(self, id):
+        if not self.is_alive(id):
+            return False
+        self.alive[id] = False
+        self.live -= 1
+        return True
+
+    def remove_many(self, ids):
+        ids = np.asarray(ids, np.intp)
+        ids = ids[self.alive[ids]]
+        self.alive[ids] = False
+        self.live -= len(np.unique(ids))
+        return ids
+
+    def revive(self, ids):
+        # Brings removed objects back as they were, their columns are left alone on removal
+        ids = np.asarray(ids, np.intp)
+        ids = np.unique(ids[~self.alive[ids]])
+        self.alive[ids] = True
+        self.live += len(ids)
+        return ids
+
+    def bounds(self, id):
+        return (int(self.x[id]), int(self.y[id]), int(self.w[id]), int(self.h[id]))
+
+    def bounds_many(self, ids):
+        return zip(self.x[ids].tolist(), self.y[ids].tolist(), self.w[ids].tolist(), self.h[ids].tolist())
+
+    def rgb(self, id):
+        return self.to_rgb(int(self.color[id]))
+
+    def to_rgb(self, packed):
+        color = self.colors.get(packed)
+        if color is None:
+            color = self.colors[packed] = unpack_color(packed)
+        return color
+
+    def set_rect(self, id, rect):
+        self.x[id], self.y[id], self.w[id], self.h[id] = rect[0], rect[1], rect[2], rect[3]
+
+    def move(self, id, x, y):
+        self.x[id] = x
+        self.y[id] = y
+
+    def set_color(self, id, color):
+        self.color[id] = pack_color(color)
+
+    def set_sprite(self, id, sprite):
+        self.sprite[id] = sprite
+
+    def translate_all(self, dx, dy, ids=None):
+        if ids is None:
+            ids = self.ids()
+        self.x[ids] += dx
+        self.y[ids] += dy
+        return ids
+
+    def ids_in_rect(self, rect):
+        x, y, w, h = rect[0], rect[1], rect[2], rect[3]
+        n = self.count
+        xs, ys = self.x[:n], self.y[:n]
+        mask = self.alive[:n] & (xs < x + w) & (xs + self.w[:n] > x) & (ys < y + h) & (ys + self.h[:n] > y)
+        return np.flatnonzero(mask)
+
+    def group_by_color(self, ids=None):
+        if ids is None:
+            ids = self.ids()
+        colors = self.color[ids]
+        order = np.argsort(colors, kind="stable")
+        packed, starts = np.unique(colors[order], return_index=True)
+        groups = np.split(ids[order], starts[1:])
+        return {unpack_color(int(color)): group for color, group in zip(packed, groups)}
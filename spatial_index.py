@@ -0,0 +1,283 @@
+import numpy as np
+
+CELL_SIZE = 64
+LARGE_ITEM_CELLS = 256  # items covering more cells than this are kept out of the grid
+REGION_CELLS = 16  # deferred items reach the grid a region of REGION_CELLS x REGION_CELLS cells at a time
+
+
+def rect_tuple(rect):
+    return (rect[0], rect[1], rect[2], rect[3])
+
+
+class SpatialHash:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.large = set()
+        self.bounds = {}
+        self.order = {}
+        self.counter = 0
+        self.deferred = {}  # (region x, region y) -> (items, xs, ys, ws, hs, orders) not in the grid yet
+        self.deferred_count = 0
+        self.deferred_items = np.empty(0, np.int64)  # sorted, with the region of each, to find an item's region
+        self.deferred_regions = np.empty((0, 2), np.int64)
+
+    def __len__(self):
+        return len(self.bounds) + self.deferred_count
+
+    def __contains__(self, item):
+        return item in self.bounds or self.deferred_region(item) is not None
+
+    def clear(self):
+        self.cells.clear()
+        self.large.clear()
+        self.bounds.clear()
+        self.order.clear()
+        self.counter = 0
+        self.drop_deferred()
+
+    def drop_deferred(self):
+        self.deferred.clear()
+        self.deferred_count = 0
+        self.deferred_items = np.empty(0, np.int64)
+        self.deferred_regions = np.empty((0, 2), np.int64)
+
+    def insert_deferred(self, items, xs, ys, ws, hs, orders=None):
+        # Like insert_many, but items only reach the grid when a query or an edit touches their region, so
+        # opening a big scene indexes what is looked at instead of everything. Items larger than a region go in now.
+        self.flush_deferred()
+        items = np.asarray(items, np.int64)
+        if not len(items):
+            return
+        xs, ys, ws, hs = (np.asarray(column, np.int64) for column in (xs, ys, ws, hs))
+        orders = items if orders is None else np.asarray(orders, np.int64)
+        self.counter = max(self.counter, int(orders.max()) + 1)
+        region = self.cell_size * REGION_CELLS
+        big = (ws > region) | (hs > region)
+        if big.any():
+            self.insert_many(items[big], xs[big], ys[big], ws[big], hs[big], orders[big])
+            small = ~big
+            items, xs, ys, ws, hs, orders = items[small], xs[small], ys[small], ws[small], hs[small], orders[small]
+        rx, ry = xs // region, ys // region
+        order = np.lexsort((ry, rx))
+        rx, ry = rx[order], ry[order]
+        starts = np.flatnonzero(np.r_[True, (rx[1:] != rx[:-1]) | (ry[1:] != ry[:-1])])
+        ends = np.r_[starts[1:], len(order)]
+        for x, y, start, end in zip(rx[starts].tolist(), ry[starts].tolist(), starts.tolist(), ends.tolist()):
+            members = order[start:end]
+            self.deferred[(x, y)] = (items[members], xs[members], ys[members], ws[members], hs[members], orders[members])
+        self.deferred_count = len(items)
+        by_item = np.argsort(items[order])
+        self.deferred_items = items[order][by_item]
+        self.deferred_regions = np.stack([rx, ry], axis=1)[by_item]
+
+    def deferred_region(self, item):
+        if not self.deferred:
+            return None
+        position = int(np.searchsorted(self.deferred_items, item))
+        if position == len(self.deferred_items) or self.deferred_items[position] != item:
+            return None
+        key = tuple(self.deferred_regions[position].tolist())
+        return key if key in self.deferred else None
+
+    def index_region(self, key):
+        items, xs, ys, ws, hs, orders = self.deferred.pop(key)
+        self.deferred_count -= len(items)
+        if not self.deferred:
+            self.drop_deferred()
+        self.insert_many(items, xs, ys, ws, hs, orders)
+
+    def index_item(self, item):
+        key = self.deferred_region(item)
+        if key is not None:
+            self.index_region(key)
+
+    def index_items(self, items):
+        if not self.deferred:
+            return
+        positions = np.minimum(np.searchsorted(self.deferred_items, items), len(self.deferred_items) - 1)
+        found = self.deferred_items[positions] == items
+        for key in {tuple(key) for key in self.deferred_regions[positions[found]].tolist()}:
+            if key in self.deferred:
+                self.index_region(key)
+
+    def index_rect(self, x, y, w, h):
+        # Items start in the region of their top-left corner and are at most a region wide or tall
+        if not self.deferred:
+            return
+        region = self.cell_size * REGION_CELLS
+        x0, y0 = x // region - 1, y // region - 1
+        x1, y1 = (x + max(w, 1) - 1) // region, (y + max(h, 1) - 1) // region
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.deferred):
+            keys = [key for key in self.deferred if x0 <= key[0] <= x1 and y0 <= key[1] <= y1]
+        else:
+            keys = [(rx, ry) for rx in range(x0, x1 + 1) for ry in range(y0, y1 + 1) if (rx, ry) in self.deferred]
+        for key in keys:
+            self.index_region(key)
+
+    def flush_deferred(self):
+        for key in list(self.deferred):
+            self.index_region(key)
+
+    def cell_range(self, x, y, w, h):
+        size = self.cell_size
+        x0, y0 = x // size, y // size
+        x1 = (x + max(w, 1) - 1) // size
+        y1 = (y + max(h, 1) - 1) // size
+        return x0, y0, x1, y1
+
+    def cells_for(self, rect):
+        x0, y0, x1, y1 = self.cell_range(*rect)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > LARGE_ITEM_CELLS:
+            return None
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, item, rect, order=None):
+        self.index_item(item)
+        if item in self.bounds:
+            self.remove(item)
+        rect = rect_tuple(rect)
+        self.bounds[item] = rect
+        if order is None:
+            order = self.counter
+        self.order[item] = order
+        self.counter = max(self.counter, order) + 1
+        self._link(item, self.cells_for(rect))
+
+    def insert_many(self, items, xs, ys, ws, hs, orders=None):
+        # Bulk insert of integer items ordered by their own value (or orders), the grid is built with NumPy
+        items = np.asarray(items)
+        if not len(items):
+            return
+        xs, ys, ws, hs = (np.asarray(column, np.int64) for column in (xs, ys, ws, hs))
+        size = self.cell_size
+        x0, y0 = xs // size, ys // size
+        x1 = (xs + np.maximum(ws, 1) - 1) // size
+        y1 = (ys + np.maximum(hs, 1) - 1) // size
+        self.index_items(items)
+        item_list = items.tolist()
+        for item in item_list:
+            if item in self.bounds:
+                self.remove(item)
+        self.bounds.update(zip(item_list, zip(xs.tolist(), ys.tolist(), ws.tolist(), hs.tolist())))
+        orders = items if orders is None else np.asarray(orders)
+        self.order.update(zip(item_list, orders.tolist()))
+        self.counter = max(self.counter, int(orders.max()) + 1)
+
+        # Every item is repeated once per grid cell it covers, then the (cell, item) pairs are grouped by cell
+        rows = y1 - y0 + 1
+        covered = (x1 - x0 + 1) * rows
+        large = covered > LARGE_ITEM_CELLS
+        self.large.update(items[large].tolist())
+        small = ~large
+        counts = covered[small]
+        if len(counts):
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            step = np.arange(int(counts.sum())) - first
+            row_count = np.repeat(rows[small], counts)
+            cx = np.repeat(x0[small], counts) + step // row_count
+            cy = np.repeat(y0[small], counts) + step % row_count
+            members = np.repeat(items[small], counts)
+            order = np.lexsort((cy, cx))
+            cx, cy, members = cx[order], cy[order], members[order]
+            starts = np.flatnonzero(np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+            ends = np.r_[starts[1:], len(members)]
+            for x, y, start, end in zip(cx[starts].tolist(), cy[starts].tolist(), starts.tolist(), ends.tolist()):
+                bucket = self.cells.get((x, y))
+                if bucket is None:
+                    self.cells[(x, y)] = bucket = set()
+                bucket.update(members[start:end].tolist())
+
+    def remove(self, item):
+        self.index_item(item)
+        rect = self.bounds.pop(item, None)
+        if rect is None:
+            return False
+        del self.order[item]
+        self._unlink(item, self.cells_for(rect))
+        return True
+
+    def move(self, item, rect):
+        self.index_item(item)
+        old = self.bounds.get(item)
+        if old is None:
+            self.insert(item, rect)
+            return
+        rect = rect_tuple(rect)
+        self.bounds[item] = rect
+        if self.cell_range(*old) == self.cell_range(*rect):
+            return
+        old_cells = self.cells_for(old)
+        new_cells = self.cells_for(rect)
+        if old_cells is None or new_cells is None:
+            self._unlink(item, old_cells)
+            self._link(item, new_cells)
+            return
+        old_set, new_set = set(old_cells), set(new_cells)
+        self._unlink(item, old_set - new_set)
+        self._link(item, new_set - old_set)
+
+    def _link(self, item, cells):
+        if cells is None:
+            self.large.add(item)
+            return
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if bucket is None:
+                self.cells[cell] = bucket = set()
+            bucket.add(item)
+
+    def _unlink(self, item, cells):
+        if cells is None:
+            self.large.discard(item)
+            return
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard(item)
+                if not bucket:
+                    del self.cells[cell]
+
+    def query_point(self, x, y):
+        self.index_rect(x, y, 1, 1)
+        size = self.cell_size
+        candidates = list(self.cells.get((x // size, y // size), ()))
+        candidates.extend(self.large)
+        hits = []
+        for item in candidates:
+            bx, by, bw, bh = self.bounds[item]
+            if bx <= x < bx + bw and by <= y < by + bh:
+                hits.append(item)
+        hits.sort(key=self.order.__getitem__)
+        return hits
+
+    def topmost_at(self, x, y):
+        hits = self.query_point(x, y)
+        return hits[-1] if hits else None
+
+    def query_rect(self, rect):
+        x, y, w, h = rect_tuple(rect)
+        self.index_rect(x, y, w, h)
+        x0, y0, x1, y1 = self.cell_range(x, y, w, h)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            # The viewport covers more cells than are occupied, walk the occupied ones instead
+            candidates = set()
+            for (cx, cy), bucket in self.cells.items():
+                if x0 <= cx <= x1 and y0 <= cy <= y1:
+                    candidates.update(bucket)
+        else:
+            candidates = set()
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    bucket = self.cells.get((cx, cy))
+                    if bucket:
+                        candidates.update(bucket)
+        candidates.update(self.large)
+        right, bottom = x + w, y + h
+        hits = []
+        for item in candidates:
+            bx, by, bw, bh = self.bounds[item]
+            if bx < right and x < bx + bw and by < bottom and y < by + bh:
+                hits.append(item)
+        hits.sort(key=self.order.__getitem__)
+        return hits
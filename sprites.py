@@ -0,0 +1,274 @@
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import pik_format
+
+PAGE_SIZE = 2048
+PADDING = 1  # transparent pixels around each sprite so scaling never pulls in a neighbour
+CACHE_BUDGET = 32 * 1024 * 1024  # bytes of converted and scaled sprite images kept around
+
+PLACEMENT_DTYPE = np.dtype([("page", "<u2"), ("x", "<u2"), ("y", "<u2"), ("w", "<u2"), ("h", "<u2")])
+
+# Chunks of the .atlas file written next to a .pik project
+PLACEMENTS = b"SPRT"
+SOURCES = b"SSRC"  # JSON: page size and [path relative to the atlas, mtime ns, size] per sprite
+PAGE_TAG = b"P%03d"
+
+
+def atlas_path(project_path):
+    return os.path.splitext(project_path)[0] + ".atlas"
+
+
+def pack(sizes, page_size=PAGE_SIZE, padding=PADDING, skylines=None):
+    # Skyline bottom-left bin packing, tallest first. Returns (page, x, y) for each (w, h), in input order.
+    # skylines, when given, is filled with the packed pages' skylines for later place() calls.
+    skylines = [] if skylines is None else skylines  # one list of [x, y, width] segments per page, left to right
+    placements = [None] * len(sizes)
+    for index in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        placements[index] = place(skylines, sizes[index][0], sizes[index][1], page_size, padding)
+    return placements, len(skylines)
+
+
+def place(skylines, w, h, page_size=PAGE_SIZE, padding=PADDING, grow=True):
+    # (page, x, y) of one more w x h sprite, None when grow is False and no page has room for it
+    if w + padding > page_size or h + padding > page_size:
+        raise ValueError(f"a {w}x{h} sprite does not fit on a {page_size} atlas page")
+    w, h = w + padding, h + padding
+    for page, skyline in enumerate(skylines):
+        spot = skyline_spot(skyline, w, h, page_size)
+        if spot is not None:
+            break
+    else:
+        if not grow:
+            return None
+        page, skyline = len(skylines), [[0, 0, page_size]]
+        skylines.append(skyline)
+        spot = skyline_spot(skyline, w, h, page_size)
+    segment, x, y = spot
+    skyline_place(skyline, segment, x, y + h, w)
+    return page, x, y
+
+
+def placed_skylines(placements, page_count, page_size=PAGE_SIZE, padding=PADDING):
+    # Skylines over sprites packed earlier (a loaded atlas): the top of the lowest free space of every column
+    tops = np.zeros((page_count, page_size), np.int32)
+    for page, x, y, w, h in placements.tolist():
+        columns = tops[page, x:x + w + padding]
+        np.maximum(columns, y + h + padding, out=columns)
+    skylines = []
+    for row in tops:
+        starts = [0] + (np.flatnonzero(row[1:] != row[:-1]) + 1).tolist()
+        ends = starts[1:] + [page_size]
+        skylines.append([[start, int(row[start]), end - start] for start, end in zip(starts, ends)])
+    return skylines
+
+
+def skyline_spot(skyline, w, h, page_size):
+    # Lowest (then leftmost) spot where a w x h rect rests on the skyline, as (segment, x, y)
+    best = None
+    for segment in range(len(skyline)):
+        x = skyline[segment][0]
+        if x + w > page_size:
+            break
+        y = 0
+        remaining = w
+        for other in range(segment, len(skyline)):
+            y = max(y, skyline[other][1])
+            remaining -= skyline[other][2]
+            if remaining <= 0:
+                break
+        if y + h <= page_size and (best is None or (y, x) < (best[2], best[1])):
+            best = (segment, x, y)
+    return best
+
+
+def skyline_place(skyline, segment, x, top, w):
+    skyline.insert(segment, [x, top, w])
+    right = x + w
+    following = segment + 1
+    while following < len(skyline) and skyline[following][0] < right:
+        covered = skyline[following]
+        overlap = right - covered[0]
+        if covered[2] <= overlap:
+            del skyline[following]
+        else:
+            covered[0] += overlap
+            covered[2] -= overlap
+            break
+    merged = [skyline[0]]
+    for piece in skyline[1:]:
+        if piece[1] == merged[-1][1]:
+            merged[-1][2] += piece[2]
+        else:
+            merged.append(piece)
+    skyline[:] = merged
+
+
+class SpriteAtlas:
+    # Every sprite image of a scene packed into a few RGBA pages, objects refer to sprites by index.
+    # Pages are never changed in place, an added sprite goes into a copy of its page and a repack builds new
+    # ones, so they can be handed to other threads.
+    def __init__(self, page_size=PAGE_SIZE):
+        self.page_size = page_size
+        self.sources = []  # [absolute path, mtime ns, size] per sprite
+        self.placements = np.empty(0, PLACEMENT_DTYPE)
+        self.pages = []  # (page_size, page_size, 4) uint8 arrays
+        self.skylines = None  # free space of the pages for place(), rebuilt from the placements when None
+        self.revision = 0
+
+    def __len__(self):
+        return len(self.sources)
+
+    def size(self, sprite):
+        placement = self.placements[sprite]
+        return int(placement["w"]), int(placement["h"])
+
+    def image(self, sprite):
+        page, x, y, w, h = self.placements[sprite].tolist()
+        return self.pages[page][y:y + h, x:x + w]
+
+    def find(self, path):
+        path = os.path.abspath(path)
+        for sprite, source in enumerate(self.sources):
+            if source[0] == path:
+                return sprite
+        return None
+
+    def add(self, path, decode):
+        # decode(path) returns an (h, w, 4) RGBA array. An image that is already in the atlas is not added twice.
+        sprite = self.find(path)
+        if sprite is not None:
+            return sprite
+        # Packed into the free space left on the pages, everything is repacked only when none has room.
+        path = os.path.abspath(path)
+        image = decode(path)
+        stat = os.stat(path)
+        h, w = image.shape[:2]
+        if self.skylines is None:
+            self.skylines = placed_skylines(self.placements, len(self.pages), self.page_size)
+        spot = place(self.skylines, w, h, self.page_size, grow=False)
+        if spot is None:
+            self.repack([self.image(sprite) for sprite in range(len(self.sources))] + [image])
+        else:
+            page, x, y = spot
+            pages = list(self.pages)
+            pages[page] = pages[page].copy()
+            pages[page][y:y + h, x:x + w] = image
+            self.placements = np.append(self.placements, np.array([(page, x, y, w, h)], PLACEMENT_DTYPE))
+            self.pages = pages
+            self.revision += 1
+        self.sources.append([path, stat.st_mtime_ns, stat.st_size])
+        return len(self.sources) - 1
+
+    def refresh(self, decode):
+        # Reloads sprites whose image changed on disk since it was packed, returns how many did
+        changed = []
+        for sprite, (path, mtime, size) in enumerate(self.sources):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # a missing image keeps its packed pixels
+            if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+                changed.append((sprite, stat))
+        if changed:
+            images = [self.image(sprite) for sprite in range(len(self.sources))]
+            for sprite, stat in changed:
+                images[sprite] = decode(self.sources[sprite][0])
+                self.sources[sprite][1:] = [stat.st_mtime_ns, stat.st_size]
+            self.repack(images)
+        return len(changed)
+
+    def repack(self, images):
+        skylines = []
+        placements, page_count = pack([(image.shape[1], image.shape[0]) for image in images], self.page_size, skylines=skylines)
+        pages = [np.zeros((self.page_size, self.page_size, 4), np.uint8) for _ in range(page_count)]
+        records = np.empty(len(images), PLACEMENT_DTYPE)
+        for sprite, (image, (page, x, y)) in enumerate(zip(images, placements)):
+            h, w = image.shape[:2]
+            pages[page][y:y + h, x:x + w] = image
+            records[sprite] = (page, x, y, w, h)
+        self.placements = records
+        self.pages = pages
+        self.skylines = skylines
+        self.revision += 1
+
+    def clear(self):
+        if self.sources:
+            self.set_state([], np.empty(0, PLACEMENT_DTYPE), [])
+
+    def set_state(self, sources, placements, pages):
+        self.sources = [list(source) for source in sources]
+        self.placements = placements
+        self.pages = pages
+        self.skylines = None
+        self.revision += 1
+
+    def state(self):
+        # A consistent copy-free view for another thread or process to write out
+        return [list(source) for source in self.sources], self.placements, list(self.pages)
+
+    def save(self, path):
+        write_atlas(path, self.page_size, *self.state())
+
+    def load(self, path):
+        # Pages stay views of the mapped file, nothing is decoded or repacked
+        with pik_format.PikFile(path) as atlas:
+            meta = json.loads(bytes(atlas.raw(SOURCES)))
+            directory = os.path.dirname(os.path.abspath(path))
+            page_size = meta["page_size"]
+            count, offset, _ = atlas.chunks[PLACEMENTS]
+            placements = np.frombuffer(atlas.map, PLACEMENT_DTYPE, count, offset)
+            pages = []
+            for page in range(meta["pages"]):
+                count, offset, _ = atlas.chunks[PAGE_TAG % page]
+                pages.append(np.frombuffer(atlas.map, np.uint8, page_size * page_size * 4, offset).reshape(page_size, page_size, 4))
+        self.page_size = page_size
+        self.set_state([[os.path.normpath(os.path.join(directory, source)), mtime, size] for source, mtime, size in meta["sources"]], placements, pages)
+
+
+def write_atlas(path, page_size, sources, placements, pages):
+    directory = os.path.dirname(os.path.abspath(path))
+    meta = {
+        "page_size": page_size,
+        "pages": len(pages),
+        "sources": [[os.path.relpath(source, directory), mtime, size] for source, mtime, size in sources],
+    }
+    chunks = [(SOURCES, len(sources), json.dumps(meta).encode()), (PLACEMENTS, len(placements), placements.tobytes())]
+    chunks.extend((PAGE_TAG % page, 1, np.ascontiguousarray(data).tobytes()) for page, data in enumerate(pages))
+    pik_format.write_chunks(path, chunks)
+
+
+class SurfaceCache:
+    # Converted and scaled sprite images by key, least recently used dropped past the byte budget.
+    # make(key) returns (image, bytes), it is only called on a miss.
+    def __init__(self, make, budget=CACHE_BUDGET):
+        self.make = make
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = self.entries[key] = self.make(key)
+            self.bytes += entry[1]
+            while self.bytes > self.budget and len(self.entries) > 1:
+                _, (_, size) = self.entries.popitem(last=False)
+                self.bytes -= size
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry[0]
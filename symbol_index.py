@@ -0,0 +1,372 @@
+import ast
+import hashlib
+import marshal
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_DIR = os.environ.get("PIKE_SYMBOL_CACHE", os.path.join(os.path.expanduser("~"), ".pike", "symbol_cache"))
+INDEX_WORKERS = int(os.environ.get("PIKE_INDEX_WORKERS", str(min(4, os.cpu_count() or 1))))
+CACHE_VERSION = 1
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", ".venv", "venv", "env", ".tox", "node_modules", "build", "dist"}
+FIND_LIMIT = 50
+
+Symbol = namedtuple("Symbol", "name kind path line column container")  # line is 1 based, container is the dotted parent
+
+# Top level lines that start a region: decorators, defs and classes in column 0
+REGION_START = re.compile(r"(?:@|def\s|async\s+def\s|class\s)")
+
+
+def collect(body, path, line_offset, container, symbols, in_function=False):
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            kind = "class" if isinstance(node, ast.ClassDef) else ("method" if container and not in_function else "function")
+            symbols.append(Symbol(node.name, kind, path, node.lineno + line_offset, node.col_offset, container))
+            inner = f"{container}.{node.name}" if container else node.name
+            collect(node.body, path, line_offset, inner, symbols, kind != "class")
+        elif not in_function and isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        symbols.append(Symbol(name.id, "variable", path, name.lineno + line_offset, name.col_offset, container))
+        elif isinstance(node, (ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith)):
+            collect(node.body, path, line_offset, container, symbols, in_function)
+            collect(getattr(node, "orelse", []), path, line_offset, container, symbols, in_function)
+        elif isinstance(node, ast.Try):
+            for block in [node.body, node.orelse, node.finalbody] + [handler.body for handler in node.handlers]:
+                collect(block, path, line_offset, container, symbols, in_function)
+
+
+def parse_symbols(source, path, line_offset=0):
+    # None when the source does not parse
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    symbols = []
+    collect(tree.body, path, line_offset, "", symbols)
+    return symbols
+
+
+def split_regions(source):
+    # Cuts a module into (first line number, text) chunks at top level defs and classes, each chunk parses on its own
+    lines = source.splitlines(True)
+    regions = []
+    start = 0
+    in_decorator = False
+    for number, line in enumerate(lines):
+        if REGION_START.match(line):
+            if number > start and not in_decorator:
+                regions.append((start, "".join(lines[start:number])))
+                start = number
+            in_decorator = line.startswith("@")
+    if start < len(lines):
+        regions.append((start, "".join(lines[start:])))
+    return regions
+
+
+def shifted(symbols, path, line_offset):
+    return [Symbol(name, kind, path, line + line_offset, column, container) for name, kind, _, line, column, container in symbols]
+
+
+def parse_regions(source, path):
+    # Fallback for a module with a syntax error: the regions that do parse still give their symbols
+    symbols = []
+    for start, text in split_regions(source):
+        symbols.extend(parse_symbols(text, path, start) or [])
+    return symbols
+
+
+class DocumentIndex:
+    # Symbols of a document being edited, only regions whose text changed since the last update are parsed again
+    def __init__(self, path):
+        self.path = path
+        self.regions = {}  # region text -> (first line, symbols counted from the region start, symbols counted from the top)
+        self.headers = {}  # first line of a region -> its last symbols that parsed
+        self.symbols = []
+        self.parsed = 0
+
+    def update(self, source):
+        regions = {}
+        headers = {}
+        symbols = []
+        self.parsed = 0
+        for start, text in split_regions(source):
+            region = self.regions.get(text)
+            if region is None:
+                self.parsed += 1
+                relative = parse_symbols(text, self.path)
+                if relative is None:
+                    relative = self.headers.get(text.split("\n", 1)[0], [])  # keep what it had while it is being typed
+                region = (start, relative, shifted(relative, self.path, start))
+            elif region[0] != start:
+                region = (start, region[1], shifted(region[1], self.path, start))
+            regions[text] = region
+            headers[text.split("\n", 1)[0]] = region[1]
+            symbols.extend(region[2])
+        self.regions = regions
+        self.headers = headers
+        self.symbols = symbols
+        return symbols
+
+
+class SymbolIndex:
+    # Workspace symbols for outline, go-to-definition and find-symbol.
+    # Files are parsed on a thread pool, results are cached on disk by mtime, size and content hash.
+    def __init__(self, cache_dir=CACHE_DIR, workers=INDEX_WORKERS, on_change=None):
+        self.cache_dir = cache_dir
+        self.on_change = on_change  # called from a worker thread
+        self.pool = ThreadPoolExecutor(max(1, workers), thread_name_prefix="pike-index")
+        self.lock = threading.Lock()
+        self.closed = False  # set by close() before the pool shuts down, nothing is scheduled after it
+        self.root = None
+        self.files = {}  # path -> (mtime ns, size, sha1, symbols)
+        self.by_name = {}  # name -> symbols across the workspace
+        self.sorted_names = []  # (lower case name, name) for prefix lookups
+        self.files_generation = 0
+        self.cache_root = None
+        self.documents = {}  # path -> DocumentIndex of the open document
+        self.pending = {}  # path -> newest source not parsed yet, one parse per document runs at a time
+        self.scan_threads = []
+        self.scan_generation = 0
+        self.stats = {"parsed": 0, "reused": 0, "seconds": 0.0}
+
+    def cache_path(self, root):
+        key = hashlib.sha1(root.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}.index")
+
+    def set_root(self, root):
+        # Starts a background scan, only files whose mtime or size changed since the cache are read again
+        root = os.path.abspath(root)
+        with self.lock:
+            if root != self.root:
+                self.root = root
+                self.files = {}
+                self.cache_root = None  # the scan loads the disk cache of the new root
+            self.scan_generation += 1  # an older scan still running drops its results
+            generation = self.scan_generation
+        thread = threading.Thread(target=self.scan, args=(root, generation), name="pike-index-scan", daemon=True)
+        self.scan_threads = [scan for scan in self.scan_threads if scan.is_alive()] + [thread]
+        thread.start()
+
+    def wait(self):
+        for thread in self.scan_threads:
+            thread.join()
+
+    def load_cache(self, root):
+        try:
+            with open(self.cache_path(root), "rb") as cache_file:
+                cache = marshal.loads(cache_file.read())  # far faster than marshal.load on the file object
+        except (OSError, EOFError, ValueError, TypeError):
+            return {}
+        if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION or cache.get("root") != root:
+            return {}
+        return {path: (mtime, size, digest, [Symbol(name, kind, path, line, column, container) for name, kind, line, column, container in symbols])
+                for path, (mtime, size, digest, symbols) in cache["files"].items()}
+
+    def save_cache(self):
+        with self.lock:
+            root = self.root
+            files = {path: (mtime, size, digest, [(symbol.name, symbol.kind, symbol.line, symbol.column, symbol.container) for symbol in symbols])
+                     for path, (mtime, size, digest, symbols) in self.files.items()}
+        if root is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.cache_path(root)
+        with open(path + ".tmp", "wb") as cache_file:
+            cache_file.write(marshal.dumps({"version": CACHE_VERSION, "root": root, "files": files}))
+        os.replace(path + ".tmp", path)
+
+    def source_files(self, root):
+        for directory, directories, names in os.walk(root):
+            directories[:] = [name for name in directories if name not in SKIP_DIRS and not name.startswith(".")]
+            for name in names:
+                if name.endswith(".py"):
+                    yield os.path.join(directory, name)
+
+    def scan(self, root, generation):
+        start = time.perf_counter()
+        fresh = self.cache_root != root
+        if fresh:
+            files = self.load_cache(root)
+            with self.lock:
+                if generation != self.scan_generation:
+                    return
+                self.files = files
+                self.cache_root = root
+        with self.lock:
+            known = dict(self.files)
+        changed = []
+        found = set()
+        for path in self.source_files(root):
+            if generation != self.scan_generation:
+                return  # a newer scan took over
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.add(path)
+            cached = known.get(path)
+            if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+                changed.append(path)
+        if self.closed:
+            return
+        try:
+            results = [result for result in self.pool.map(lambda path: self.index_file(path, known.get(path)), changed) if result is not None]
+        except RuntimeError:
+            return  # the pool or the interpreter shut down under the scan
+        with self.lock:
+            if generation != self.scan_generation:
+                return
+            removed = set(self.files) - found
+            for path in removed:
+                del self.files[path]
+            for path, entry in results:
+                self.files[path] = entry
+        if fresh or removed or results:
+            self.publish_names()
+            self.changed()
+        if removed or results:
+            self.save_cache()
+        with self.lock:
+            self.stats["seconds"] = time.perf_counter() - start
+
+    def index_file(self, path, cached=None):
+        # Returns (path, entry), a file touched without changing its content keeps its cached symbols
+        try:
+            with open(path, "rb") as source_file:
+                stat = os.fstat(source_file.fileno())
+                data = source_file.read()
+        except OSError:
+            return None
+        digest = hashlib.sha1(data).hexdigest()
+        if cached is not None and cached[2] == digest:
+            with self.lock:
+                self.stats["reused"] += 1
+            return path, (stat.st_mtime_ns, stat.st_size, digest, cached[3])
+        with self.lock:
+            self.stats["parsed"] += 1
+        source = data.decode("utf-8", "replace")
+        symbols = parse_symbols(source, path)
+        if symbols is None:
+            symbols = parse_regions(source, path)
+        return path, (stat.st_mtime_ns, stat.st_size, digest, symbols)
+
+    def refresh_file(self, path):
+        # After a save: re-index one file in the background
+        path = os.path.abspath(path)
+        with self.lock:
+            if self.closed or not path.endswith(".py"):
+                return
+            self.pool.submit(self.refresh, path)
+
+    def refresh(self, path):
+        with self.lock:
+            cached = self.files.get(path)
+        result = self.index_file(path, cached)
+        if result is None:
+            return
+        with self.lock:
+            if self.root is None or not path.startswith(self.root + os.sep):
+                return
+            self.files[path] = result[1]
+        self.publish_names()
+        self.changed()
+
+    def publish_names(self):
+        # The name tables are rebuilt outside the lock so lookups never wait for it
+        with self.lock:
+            self.files_generation += 1
+            generation = self.files_generation
+            entries = list(self.files.values())
+        by_name = {}
+        for _, _, _, symbols in entries:
+            for symbol in symbols:
+                by_name.setdefault(symbol.name, []).append(symbol)
+        sorted_names = sorted((name.lower(), name) for name in by_name)
+        with self.lock:
+            if generation == self.files_generation:  # a newer rebuild is on its way otherwise
+                self.by_name = by_name
+                self.sorted_names = sorted_names
+
+    def update_document(self, path, source):
+        # Re-parses the changed regions of an open document on the pool. Edits made while a parse runs
+        # replace each other, only the newest is parsed next, so an older parse never lands after a newer one.
+        with self.lock:
+            if self.closed:
+                return
+            if path not in self.documents:
+                self.documents[path] = DocumentIndex(path)
+            running = path in self.pending
+            self.pending[path] = source
+            if not running:
+                self.pool.submit(self.update, path)
+
+    def update(self, path):
+        while True:
+            with self.lock:
+                source = self.pending.get(path)
+                document = self.documents.get(path)
+                if source is None or document is None:
+                    self.pending.pop(path, None)
+                    return
+                self.pending[path] = None  # still running, a new edit only swaps the source
+            document.update(source)
+            self.changed()
+
+    def close_document(self, path):
+        with self.lock:
+            self.documents.pop(path, None)
+            if path in self.pending:
+                self.pending[path] = None
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def outline(self, path):
+        with self.lock:
+            document = self.documents.get(path)
+            if document is not None:
+                return list(document.symbols)
+            entry = self.files.get(path)
+            return list(entry[3]) if entry is not None else []
+
+    def definitions(self, name, path=None):
+        # Definitions in the given document first, then the rest of the workspace
+        with self.lock:
+            found = [symbol for symbol in self.documents[path].symbols if symbol.name == name] if path in self.documents else []
+            found.extend(symbol for symbol in self.by_name.get(name, ()) if symbol.path not in self.documents)
+            for other, document in self.documents.items():
+                if other != path:
+                    found.extend(symbol for symbol in document.symbols if symbol.name == name)
+        return [symbol for symbol in found if symbol.kind != "variable"] + [symbol for symbol in found if symbol.kind == "variable"]
+
+    def find(self, query, limit=FIND_LIMIT):
+        # Case insensitive prefix match, open documents first
+        query = query.lower()
+        if not query:
+            return []
+        with self.lock:
+            found = [symbol for document in self.documents.values() for symbol in document.symbols if symbol.name.lower().startswith(query)]
+            position = bisect_left(self.sorted_names, (query,))
+            while position < len(self.sorted_names) and len(found) < limit:
+                lower, name = self.sorted_names[position]
+                if not lower.startswith(query):
+                    break
+                found.extend(symbol for symbol in self.by_name[name] if symbol.path not in self.documents)
+                position += 1
+        return found[:limit]
+
+    def close(self):
+        with self.lock:
+            self.closed = True  # submits happen under the lock, none can slip in before the shutdown
+        self.scan_generation += 1
+        self.wait()
+        self.pool.shutdown(wait=True)
+        self.save_cache()  # keeps refreshes made after the last scan
@@ -0,0 +1,455 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+import pik_format
+from profiler import profiler
+
+CELL_SIZE = 2048
+BUDGET = int(os.environ.get("PIKE_WORLD_BUDGET_MB", "256")) * 1024 * 1024
+PREFETCH_MARGIN = int(os.environ.get("PIKE_WORLD_PREFETCH", "1024"))  # world pixels loaded ahead around every view
+WORKERS = int(os.environ.get("PIKE_WORLD_WORKERS", "2"))
+PREFETCH_PER_UPDATE = 1  # prefetched cells brought into the scene per update, spreads the cost over frames
+OBJECT_BYTES = 400  # rough cost of a loaded object: store columns plus the spatial hash's bounds, order and bucket entries
+
+# A world is a manifest .pik (no objects, the cameras and a WRLD chunk) and a <name>.cells directory with one
+# .pik per non-empty cell. Objects belong to the cell holding their top-left corner.
+WORLD = b"WRLD"  # JSON: cell size, next uid, widest and tallest object, [column, row, count] per cell
+UIDS = b"WUID"  # persistent object ids of a cell, they keep the draw order across loads
+UNSAVED = "unsaved"  # edited cells and manifest until the world is saved, picked up again after a crash
+MANIFEST = "world.pik"
+
+
+def cells_dir(path):
+    return os.path.splitext(os.path.abspath(path))[0] + ".cells"
+
+
+def cell_name(key):
+    return f"{key[0]}_{key[1]}.pik"
+
+
+def cell_keys(xs, ys, cell_size):
+    return np.asarray(xs, np.int64) // cell_size, np.asarray(ys, np.int64) // cell_size
+
+
+def write_cell(path, objects, sprites, uids):
+    extra = [(pik_format.OBJECT_SPRITES, len(sprites), sprites.astype(pik_format.SPRITE_DTYPE).tobytes()), (UIDS, len(uids), uids.astype("<u8").tobytes())]
+    pik_format.write_pik(path, objects, pik_format.camera_records([]), extra)
+
+
+def read_cell(path):
+    with pik_format.PikFile(path) as pik:
+        objects = pik.array(pik_format.OBJECTS).copy()
+        sprites = pik.array(pik_format.OBJECT_SPRITES).copy() if pik_format.OBJECT_SPRITES in pik.chunks else np.full(len(objects), -1, pik_format.SPRITE_DTYPE)
+        count, offset, _ = pik.chunks[UIDS]
+        uids = np.frombuffer(pik.map, "<u8", count, offset).copy()
+    return objects, sprites, uids
+
+
+def write_manifest(path, meta, cameras, views=None):
+    extra = [(WORLD, 1, json.dumps(meta).encode())]
+    if views is not None:
+        extra.append((pik_format.CAMERA_VIEWS, len(views), views.tobytes()))
+    pik_format.write_pik(path, np.empty(0, pik_format.OBJECT_DTYPE), cameras, extra)
+
+
+def create_world(path, store, cameras, cell_size=CELL_SIZE):
+    # Splits a loaded scene into cells, the current id order becomes the uid (draw) order
+    ids = store.ids()
+    objects = pik_format.object_records(store)
+    sprites = store.sprite[ids].astype(pik_format.SPRITE_DTYPE)
+    uids = np.arange(len(ids), dtype=np.uint64)
+    columns, rows = cell_keys(objects["x"], objects["y"], cell_size)
+    directory = cells_dir(path)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    cells = []
+    order = np.lexsort((rows, columns))
+    if len(order):
+        columns, rows = columns[order], rows[order]
+        starts = np.flatnonzero(np.r_[True, (columns[1:] != columns[:-1]) | (rows[1:] != rows[:-1])])
+        ends = np.r_[starts[1:], len(order)]
+        for column, row, start, end in zip(columns[starts].tolist(), rows[starts].tolist(), starts.tolist(), ends.tolist()):
+            members = order[start:end]
+            write_cell(os.path.join(directory, cell_name((column, row))), objects[members], sprites[members], uids[members])
+            cells.append([column, row, end - start])
+    meta = {
+        "cell_size": cell_size,
+        "next_uid": len(ids),
+        "reach": [int(objects["w"].max(initial=0)), int(objects["h"].max(initial=0))],
+        "cells": cells,
+    }
+    write_manifest(os.path.abspath(path), meta, pik_format.camera_records(cameras), pik_format.camera_view_records(cameras))
+
+
+class Cell:
+    __slots__ = ("key", "objects", "used")
+
+    def __init__(self, key):
+        self.key = key
+        self.objects = {}  # store id -> uid
+        self.used = 0
+
+
+class WorldPartition:
+    # Streams the cells of a world into a scene (GameArea or PlayScene) around the views passed to update().
+    # Loads run on a thread pool, the scene is only touched on the calling thread. Store slots of evicted
+    # objects are handed out again, so ids are only stable while their cell stays loaded.
+    def __init__(self, path, scene, budget=BUDGET, margin=PREFETCH_MARGIN, workers=WORKERS, on_stream=None, read_only=False):
+        self.path = os.path.abspath(path)
+        self.directory = cells_dir(path)
+        self.unsaved = os.path.join(self.directory, UNSAVED)
+        self.scene = scene
+        self.budget = budget
+        self.margin = margin
+        self.on_stream = on_stream
+        self.changes = []  # ("add" or "delete", ids) since the last on_stream call, only kept for on_stream
+        self.read_only = read_only
+        self.recovered = self.read_manifest()
+        self.cells = {}  # key -> Cell, loaded ones
+        self.loading = {}  # key -> Future of (objects, sprites, uids)
+        self.home = {}  # store id -> key of its cell
+        self.free_ids = []
+        self.dirty = set()
+        self.manifest_dirty = False
+        self.writes = {}  # key -> cell data an evicted cell is being written out with
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max(workers, 1), "pike-world")
+        self.writer = ThreadPoolExecutor(1, "pike-world-writer")  # one at a time keeps the writes of a cell in order
+        self.clock = 0
+        self.needed = set()
+        self.wanted = set()
+        self.loaded_objects = 0
+        self.stats = {"loads": 0, "evictions": 0, "writes": 0, "prefetch_hits": 0, "prefetch_misses": 0, "stalls": 0, "stall_ms": 0.0, "worst_stall_ms": 0.0}
+
+    def read_manifest(self):
+        # Unsaved edits of an earlier session win over the saved manifest
+        path = os.path.join(self.unsaved, MANIFEST)
+        recovered = os.path.exists(path)
+        with pik_format.PikFile(path if recovered else self.path) as pik:
+            meta = json.loads(bytes(pik.raw(WORLD)))
+            self.cameras = pik.array(pik_format.CAMERAS).copy()
+            self.camera_views = pik.array(pik_format.CAMERA_VIEWS).copy()
+        self.cell_size = meta["cell_size"]
+        self.next_uid = meta["next_uid"]
+        self.reach = list(meta["reach"])
+        self.counts = {(column, row): count for column, row, count in meta["cells"]}
+        return recovered
+
+    def close(self):
+        if not self.read_only:
+            self.flush()
+        self.writer.shutdown(wait=True)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def key_at(self, x, y):
+        return (x // self.cell_size, y // self.cell_size)
+
+    def keys_in(self, rects, margin):
+        # Cells whose objects can reach into any rect, objects only extend right and down from their cell
+        size = self.cell_size
+        keys = set()
+        for rect in rects:
+            x, y, w, h = rect[0] - margin, rect[1] - margin, rect[2] + 2 * margin, rect[3] + 2 * margin
+            x0, y0 = (x - self.reach[0]) // size, (y - self.reach[1]) // size
+            x1, y1 = (x + max(w, 1) - 1) // size, (y + max(h, 1) - 1) // size
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.counts) + len(self.cells):
+                candidates = set(self.counts) | set(self.cells)
+                keys.update(key for key in candidates if x0 <= key[0] <= x1 and y0 <= key[1] <= y1)
+            else:
+                keys.update(key for key in ((column, row) for column in range(x0, x1 + 1) for row in range(y0, y1 + 1))
+                            if key in self.counts or key in self.cells)
+        return keys
+
+    def update(self, rects, wait_for_needed=True):
+        # rects are the views (cameras) being drawn. Cells under them are needed, waiting for one is a stall;
+        # cells within the prefetch margin are loaded in the background.
+        needed = self.keys_in(rects, 0)
+        wanted = self.keys_in(rects, self.margin) | needed
+        for key in sorted(wanted, key=lambda key: key not in needed):
+            if key not in self.cells and key not in self.loading:
+                self.loading[key] = self.pool.submit(self.read, key)
+        for key in needed - self.needed:
+            if key in self.cells or self.loading[key].done():
+                self.stats["prefetch_hits"] += 1
+            else:
+                self.stats["prefetch_misses"] += 1
+        if wait_for_needed:
+            pending = [self.loading[key] for key in needed if key in self.loading and not self.loading[key].done()]
+            if pending:
+                start = time.perf_counter()
+                with profiler.span("stream_wait"):
+                    wait(pending)
+                stall = (time.perf_counter() - start) * 1000
+                self.stats["stalls"] += 1
+                self.stats["stall_ms"] += stall
+                self.stats["worst_stall_ms"] = max(self.stats["worst_stall_ms"], stall)
+        self.needed = needed
+        self.wanted = wanted
+        self.clock += 1
+        bounds = self.integrate(PREFETCH_PER_UPDATE)
+        for key in wanted:
+            cell = self.cells.get(key)
+            if cell is not None:
+                cell.used = self.clock
+        bounds.extend(self.evict())
+        self.streamed(bounds)
+        return bool(bounds)
+
+    def streamed(self, bounds):
+        if bounds:
+            self.scene.notify_changed(bounds)
+            if self.on_stream is not None:
+                changes, self.changes = self.changes, []
+                self.on_stream(changes)
+
+    def read(self, key):
+        # Worker thread: the cell as it was last written, an evicted cell still being written comes from memory
+        with profiler.span("stream_load"):
+            with self.lock:
+                data = self.writes.get(key)
+            if data is not None:
+                return data
+            for directory in (self.unsaved, self.directory):
+                try:
+                    return read_cell(os.path.join(directory, cell_name(key)))
+                except FileNotFoundError:
+                    continue
+            return np.empty(0, pik_format.OBJECT_DTYPE), np.empty(0, pik_format.SPRITE_DTYPE), np.empty(0, "<u8")
+
+    def integrate(self, prefetched=None):
+        # Every loaded cell that is needed, and up to prefetched (default: all) others
+        bounds = []
+        with profiler.span("stream_apply"):
+            for key, future in list(self.loading.items()):
+                if not future.done():
+                    continue
+                if key not in self.needed:
+                    if prefetched == 0:
+                        continue
+                    if prefetched is not None:
+                        prefetched -= 1
+                del self.loading[key]
+                rect = self.add_cell(key, *future.result())
+                if rect is not None:
+                    bounds.append(rect)
+        return bounds
+
+    def add_cell(self, key, objects, sprites, uids):
+        cell = self.cells[key] = Cell(key)
+        cell.used = self.clock
+        self.stats["loads"] += 1
+        count = len(objects)
+        if not count:
+            return None
+        reused = self.free_ids[-count:]
+        del self.free_ids[-count:]
+        start = self.scene.objects.count
+        ids = np.r_[np.asarray(reused, np.intp), np.arange(start, start + count - len(reused))]
+        self.scene.objects.put(ids, objects["x"], objects["y"], objects["w"], objects["h"], objects["color"], sprites)
+        self.scene.index.insert_many(ids, objects["x"], objects["y"], objects["w"], objects["h"], orders=uids)
+        id_list = ids.tolist()
+        cell.objects = dict(zip(id_list, uids.tolist()))
+        if self.on_stream is not None:
+            self.changes.append(("add", id_list))
+        self.home.update(dict.fromkeys(id_list, key))
+        self.loaded_objects += count
+        left, top = int(objects["x"].min()), int(objects["y"].min())
+        return (left, top, int((objects["x"] + objects["w"]).max()) - left, int((objects["y"] + objects["h"]).max()) - top)
+
+    def evict(self):
+        bounds = []
+        if self.loaded_objects * OBJECT_BYTES <= self.budget:
+            return bounds
+        for cell in sorted((cell for key, cell in self.cells.items() if key not in self.wanted), key=lambda cell: cell.used):
+            if self.loaded_objects * OBJECT_BYTES <= self.budget:
+                break
+            rect = self.drop_cell(cell.key, write=True)
+            if rect is not None:
+                bounds.append(rect)
+            self.stats["evictions"] += 1
+        return bounds
+
+    def drop_cell(self, key, write):
+        if write and key in self.dirty:
+            self.write_cell(key)
+        cell = self.cells.pop(key)
+        self.dirty.discard(key)
+        if not cell.objects:
+            return None
+        ids = np.fromiter(cell.objects, np.intp, len(cell.objects))
+        store, index = self.scene.objects, self.scene.index
+        xs, ys = store.x[ids], store.y[ids]
+        rect = (int(xs.min()), int(ys.min()), int((xs + store.w[ids]).max() - xs.min()), int((ys + store.h[ids]).max() - ys.min()))
+        store.remove_many(ids)
+        for id in cell.objects:
+            index.remove(id)
+            del self.home[id]
+        self.free_ids.extend(cell.objects)
+        if self.on_stream is not None:
+            self.changes.append(("delete", list(cell.objects)))
+        self.loaded_objects -= len(cell.objects)
+        return rect
+
+    def capture(self, key):
+        # Vectorized copies of a loaded cell, safe to hand to the writer thread
+        cell = self.cells[key]
+        store = self.scene.objects
+        ids = np.fromiter(cell.objects, np.intp, len(cell.objects))
+        objects = np.empty(len(ids), pik_format.OBJECT_DTYPE)
+        for name, column in (("x", store.x), ("y", store.y), ("w", store.w), ("h", store.h), ("color", store.color)):
+            objects[name] = column[ids]
+        return objects, store.sprite[ids].astype(pik_format.SPRITE_DTYPE), np.fromiter(cell.objects.values(), np.uint64, len(ids))
+
+    def write_cell(self, key):
+        data = self.capture(key)
+        self.counts[key] = len(data[0])
+        with self.lock:
+            self.writes[key] = data
+        self.writer.submit(self.write_cell_file, key, data)
+        self.stats["writes"] += 1
+
+    def write_cell_file(self, key, data):
+        os.makedirs(self.unsaved, exist_ok=True)
+        write_cell(os.path.join(self.unsaved, cell_name(key)), *data)
+        with self.lock:
+            if self.writes.get(key) is data:
+                del self.writes[key]
+
+    def meta(self):
+        return {
+            "cell_size": self.cell_size,
+            "next_uid": self.next_uid,
+            "reach": self.reach,
+            "cells": [[column, row, count] for (column, row), count in sorted(self.counts.items()) if count],
+        }
+
+    def flush(self, wait_for_writes=False):
+        # Writes edited cells and the manifest to the unsaved directory, returns the keys of the written cells
+        keys = sorted(self.dirty)
+        for key in keys:
+            self.write_cell(key)
+        self.dirty.clear()
+        if keys or self.manifest_dirty:
+            self.manifest_dirty = False
+            self.writer.submit(self.write_unsaved_manifest, self.meta(), pik_format.camera_records(self.scene.cameras), pik_format.camera_view_records(self.scene.cameras))
+        if wait_for_writes:
+            self.writer.submit(int).result()
+        return keys
+
+    def write_unsaved_manifest(self, meta, cameras, views):
+        os.makedirs(self.unsaved, exist_ok=True)
+        write_manifest(os.path.join(self.unsaved, MANIFEST), meta, cameras, views)
+
+    def save(self, path=None):
+        # Moves the unsaved cells into the cells directory, to a new world when path differs
+        path = self.path if path is None else os.path.abspath(path)
+        wait(list(self.loading.values()))  # nothing may read the cells while they are moved
+        self.flush(wait_for_writes=True)
+        directory = cells_dir(path)
+        if path != self.path:
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            if os.path.isdir(self.directory):
+                shutil.copytree(self.directory, directory, ignore=shutil.ignore_patterns(UNSAVED))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.isdir(self.unsaved):
+            for name in os.listdir(self.unsaved):
+                if name != MANIFEST:
+                    os.replace(os.path.join(self.unsaved, name), os.path.join(directory, name))
+        for key, count in list(self.counts.items()):
+            if not count:
+                del self.counts[key]
+                if os.path.exists(os.path.join(directory, cell_name(key))):
+                    os.remove(os.path.join(directory, cell_name(key)))
+        write_manifest(path, self.meta(), pik_format.camera_records(self.scene.cameras), pik_format.camera_view_records(self.scene.cameras))
+        if os.path.isdir(self.unsaved):
+            shutil.rmtree(self.unsaved)
+        self.path, self.directory = path, directory
+        self.unsaved = os.path.join(directory, UNSAVED)
+
+    def ensure(self, key):
+        # Loads a cell right away, for edits that land in a cell no view has asked for
+        if key in self.cells:
+            return self.cells[key]
+        if key not in self.loading:
+            if key not in self.counts:
+                cell = self.cells[key] = Cell(key)
+                cell.used = self.clock
+                return cell
+            self.loading[key] = self.pool.submit(self.read, key)
+        wait([self.loading[key]])
+        self.streamed(self.integrate())
+        return self.cells[key]
+
+    def reload(self, keys):
+        # Read-only side of a world someone else edits: re-reads the manifest and drops the rewritten cells
+        self.read_manifest()
+        bounds = []
+        for key in keys:
+            if key in self.loading:
+                wait([self.loading[key]])
+                bounds.extend(self.integrate())
+            if key in self.cells:
+                rect = self.drop_cell(key, write=False)
+                if rect is not None:
+                    bounds.append(rect)
+        self.needed.difference_update(keys)
+        self.streamed(bounds)
+
+    def edited(self, op, id):
+        # GameArea edit listener, keeps every loaded object in the cell of its top-left corner
+        if op.startswith("camera"):
+            self.manifest_dirty = True  # cameras live in the manifest
+            return
+        if op not in ("add", "delete", "move", "resize", "color", "sprite"):
+            return
+        store = self.scene.objects
+        if op == "delete":
+            key = self.home.pop(id, None)
+            if key is not None:
+                del self.cells[key].objects[id]
+                self.dirty.add(key)
+                self.loaded_objects -= 1
+                self.free_ids.append(id)
+            return
+        key = self.key_at(int(store.x[id]), int(store.y[id]))
+        old_key = self.home.get(id)
+        self.reach = [max(self.reach[0], int(store.w[id])), max(self.reach[1], int(store.h[id]))]
+        if op == "add":
+            uid = self.next_uid
+            self.next_uid += 1
+            self.scene.index.insert(id, store.bounds(id), order=uid)
+            self.loaded_objects += 1
+        elif old_key is None:
+            return  # not part of the world
+        elif old_key == key:
+            self.dirty.add(key)
+            return
+        else:
+            uid = self.cells[old_key].objects.pop(id)
+            self.dirty.add(old_key)
+        self.home[id] = key
+        self.ensure(key).objects[id] = uid
+        self.dirty.add(key)
+
+    def report_lines(self):
+        stats = self.stats
+        needed = stats["prefetch_hits"] + stats["prefetch_misses"]
+        return [
+            f"cells loaded    {len(self.cells)} of {len(self.counts)}, {self.loaded_objects} objects, ~{self.loaded_objects * OBJECT_BYTES / 1048576:.1f} of {self.budget / 1048576:.0f} MB",
+            f"loads           {stats['loads']}, evictions {stats['evictions']}, cell writes {stats['writes']}",
+            f"prefetch hits   {stats['prefetch_hits']} of {needed} needed cells ({stats['prefetch_hits'] / max(needed, 1):.0%})",
+            f"stalls          {stats['stalls']}, {stats['stall_ms']:.1f} ms total, worst {stats['worst_stall_ms']:.1f} ms",
+        ]
+
+    def summary(self):
+        stats = self.stats
+        needed = stats["prefetch_hits"] + stats["prefetch_misses"]
+        return f"{len(self.cells)} cells, {stats['prefetch_hits'] / max(needed, 1):.0%} prefetched, {stats['stall_ms']:.0f} ms stalled"